@@ -0,0 +1,328 @@
+"""
+RQ collector benchmark.
+
+Fill a Redis server with queues, jobs, registries entries and workers then
+measure the `RQCollector.collect` wall time, Redis round trips and peak
+memory for the default and the custom RQ classes.
+
+Usage:
+
+    $ # Using fakeredis
+    $ python -m benchmarks.collect --queues 50 --workers 500
+    $ # Using a Redis server, the database is flushed
+    $ python -m benchmarks.collect --redis-url redis://localhost:6379/15
+    $ # Spawning a local redis-server
+    $ python -m benchmarks.collect --spawn-redis
+
+The report is printed as JSON on the standard output.
+
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from prometheus_client import Summary
+from redis import Redis
+from rq import Queue, Worker
+from rq.job import Job
+from rq.utils import utcformat
+
+from rq_exporter.__version__ import __version__
+from rq_exporter.collector import RQCollector
+from rq_exporter.instrumentation import instrument_connection
+
+
+class CustomJob(Job):
+    redis_job_namespace_prefix = 'rq:custom:job:'
+
+
+class CustomQueue(Queue):
+    redis_queue_namespace_prefix = 'rq:custom:queue:'
+    job_class = CustomJob
+
+
+class CustomWorker(Worker):
+    redis_worker_namespace_prefix = 'rq:custom:worker:'
+    queue_class = CustomQueue
+    job_class = CustomJob
+
+
+# Same classes as `compose/project/custom.py`
+CLASSES = {
+    'default': (Worker, Queue),
+    'custom': (CustomWorker, CustomQueue),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='RQ collector benchmark')
+
+    parser.add_argument('--redis-url', help='Redis URL, the database is flushed (Default: fakeredis)')
+    parser.add_argument('--spawn-redis', action='store_true', help='Spawn a local redis-server')
+    parser.add_argument('--queues', type=int, default=20, help='Number of queues (Default: 20)')
+    parser.add_argument('--jobs', type=int, default=100, help='Queued jobs per queue (Default: 100)')
+    parser.add_argument('--registry-entries', type=int, default=100,
+                        help='Entries per job registry of each queue (Default: 100)')
+    parser.add_argument('--workers', type=int, default=100, help='Number of workers (Default: 100)')
+    parser.add_argument('--batch-sizes', type=lambda v: [int(s) for s in v.split(',')], default=[0, 1000],
+                        help='Comma separated batch sizes, 0 is the non batched collection (Default: 0,1000)')
+    parser.add_argument('--classes', type=lambda v: v.split(','), default=list(CLASSES),
+                        help='Comma separated RQ classes: default,custom (Default: default,custom)')
+    parser.add_argument('--scan-limit', type=int, default=0, help='Collector scan limit (Default: 0)')
+    parser.add_argument('--failed-scan-limit', type=int, default=0, help='Collector failed scan limit (Default: 0)')
+    parser.add_argument('--started-limit', type=int, default=0, help='Collector started limit (Default: 0)')
+    parser.add_argument('--queued-limit', type=int, default=0, help='Collector queued limit (Default: 0)')
+    parser.add_argument('--scheduler-metrics', action='store_true', help='Collect the scheduler metrics')
+    parser.add_argument('--oldest-jobs', action='store_true', help='Collect the oldest job age metric')
+    parser.add_argument('--streaming', action='store_true', help='Use the streaming collection')
+    parser.add_argument('--lua-script', action='store_true', help='Use the Lua collection script')
+    parser.add_argument('--iterations', type=int, default=10, help='Timed collections (Default: 10)')
+    parser.add_argument('--output', help='Write the report to a file instead of the standard output')
+
+    return parser.parse_args()
+
+
+def fill(connection, worker_class, queue_class, args):
+    """Create the queues, jobs, registries entries and workers using the RQ classes key layout."""
+    now = datetime.now(timezone.utc)
+    timestamp = now.timestamp()
+    job_class = queue_class.job_class
+
+    queues = [queue_class(f'queue_{i}', connection=connection) for i in range(args.queues)]
+
+    with connection.pipeline(transaction=False) as pipeline:
+        for q in queues:
+            pipeline.sadd(queue_class.redis_queues_keys, q.key)
+
+            for j in range(args.jobs):
+                job_id = f'{q.name}_queued_{j}'
+                pipeline.rpush(q.key, job_id)
+                pipeline.hset(job_class.key_for(job_id), mapping={
+                    'origin': q.name,
+                    'status': 'queued',
+                    'description': f'tasks.task_{j % 5}({j})',
+                    'created_at': utcformat(now - timedelta(seconds=j)),
+                    'enqueued_at': utcformat(now - timedelta(seconds=j)),
+                })
+
+            for j in range(args.registry_entries):
+                started_at = now - timedelta(seconds=60 + j)
+                ended_at = started_at + timedelta(seconds=j % 30)
+
+                for (registry, score) in (
+                    (q.started_job_registry, timestamp + 60 if j % 10 else timestamp - 60),
+                    (q.finished_job_registry, timestamp + 500 + j),
+                    (q.failed_job_registry, timestamp + 500 + j),
+                    (q.deferred_job_registry, timestamp + 500 + j),
+                    (q.scheduled_job_registry, timestamp + j),
+                ):
+                    job_id = f'{q.name}_{registry.key.split(":")[1]}_{j}'
+                    member = f'{job_id}:execution' if registry is q.started_job_registry else job_id
+
+                    pipeline.zadd(registry.key, {member: score})
+                    pipeline.hset(job_class.key_for(job_id), mapping={
+                        'origin': q.name,
+                        'enqueued_at': utcformat(started_at - timedelta(seconds=j % 5)),
+                        'started_at': utcformat(started_at),
+                        'ended_at': utcformat(ended_at),
+                    })
+
+            pipeline.execute()
+
+        for i in range(args.workers):
+            key = f'{worker_class.redis_worker_namespace_prefix}worker_{i}'
+            worker_queues = [queues[(i + k) % len(queues)].name for k in range(1 + i % 3)] if queues else []
+
+            pipeline.sadd(worker_class.redis_workers_keys, key)
+            pipeline.hset(key, mapping={
+                'birth': utcformat(now),
+                'last_heartbeat': utcformat(now),
+                'state': 'busy' if i % 2 else 'idle',
+                'queues': ','.join(worker_queues),
+                'successful_job_count': i,
+                'failed_job_count': i % 7,
+                'total_working_time': i * 1.5,
+            })
+
+        pipeline.execute()
+
+
+def benchmark(connection_factory, worker_class, queue_class, batch_size, args):
+    """Measure the collections of an `RQCollector`.
+
+    Returns:
+        dict: The benchmark results.
+
+    """
+    connection = connection_factory()
+    stats = instrument_connection(connection)
+
+    collector = RQCollector(
+        connection, worker_class, queue_class,
+        batch_size=batch_size,
+        scan_limit=args.scan_limit,
+        failed_scan_limit=args.failed_scan_limit,
+        started_limit=args.started_limit,
+        streaming=args.streaming,
+        lua_script=args.lua_script,
+        queued_limit=args.queued_limit,
+        scheduler_metrics=args.scheduler_metrics,
+        oldest_jobs=args.oldest_jobs,
+        summary=Summary('rq_benchmark_seconds', 'Benchmark collections', registry=None),
+    )
+
+    # Warm up, the connection is established and the caches are filled
+    samples = sum(len(metric.samples) for metric in collector.collect())
+
+    before = stats.get_counts()
+
+    wall_times = []
+
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        list(collector.collect())
+        wall_times.append(time.perf_counter() - start)
+
+    totals = [0, 0, 0, 0]
+
+    for (phase, counts) in stats.get_counts().items():
+        previous = before.get(phase, (0, 0, 0, 0))
+
+        for i in range(4):
+            totals[i] += counts[i] - previous[i]
+
+    # Measured separately, tracing the allocations slows down the collection
+    tracemalloc.start()
+    list(collector.collect())
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'batch_size': batch_size,
+        'samples': samples,
+        'wall_time_seconds': {
+            'min': min(wall_times),
+            'median': statistics.median(wall_times),
+            'mean': statistics.mean(wall_times),
+            'max': max(wall_times),
+        },
+        'round_trips': totals[1] / args.iterations,
+        'commands': totals[0] / args.iterations,
+        'sent_bytes': totals[2] / args.iterations,
+        'received_bytes': totals[3] / args.iterations,
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def spawn_redis():
+    """Start a redis-server on a free port.
+
+    Returns:
+        tuple: `(process, url)`
+
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    process = subprocess.Popen(
+        ['redis-server', '--port', str(port), '--save', '', '--appendonly', 'no'],
+        stdout=subprocess.DEVNULL,
+    )
+
+    url = f'redis://127.0.0.1:{port}/0'
+
+    for _ in range(50):
+        try:
+            Redis.from_url(url).ping()
+            break
+        except Exception:
+            time.sleep(0.1)
+
+    return process, url
+
+
+def main():
+    args = parse_args()
+
+    process = None
+
+    if args.spawn_redis:
+        process, args.redis_url = spawn_redis()
+
+    if args.redis_url:
+        backend = 'redis'
+        connection_factory = lambda: Redis.from_url(args.redis_url)
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit('fakeredis is required when --redis-url or --spawn-redis are not used')
+
+        backend = 'fakeredis'
+        server = fakeredis.FakeServer()
+        connection_factory = lambda: fakeredis.FakeRedis(server=server)
+
+    try:
+        connection = connection_factory()
+        results = []
+
+        for name in args.classes:
+            worker_class, queue_class = CLASSES[name]
+
+            connection.flushdb()
+            fill(connection, worker_class, queue_class, args)
+
+            for batch_size in args.batch_sizes:
+                print(f'Benchmarking {name} classes with batch size {batch_size}...', file=sys.stderr)
+
+                results.append({
+                    'classes': name,
+                    **benchmark(connection_factory, worker_class, queue_class, batch_size, args)
+                })
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        'rq_exporter_version': __version__,
+        'python_version': platform.python_version(),
+        'backend': backend,
+        'params': {
+            'queues': args.queues,
+            'jobs': args.jobs,
+            'registry_entries': args.registry_entries,
+            'workers': args.workers,
+            'scan_limit': args.scan_limit,
+            'failed_scan_limit': args.failed_scan_limit,
+            'started_limit': args.started_limit,
+            'streaming': args.streaming,
+            'lua_script': args.lua_script,
+            'queued_limit': args.queued_limit,
+            'scheduler_metrics': args.scheduler_metrics,
+            'oldest_jobs': args.oldest_jobs,
+            'iterations': args.iterations,
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+RQ exporter startup benchmark.
+
+Measure the `rq_exporter` import time and the time until a new exporter
+process accepts connections and serves its first scrape.
+
+Usage:
+
+    $ # Redis is not reachable, the exporter must start without it
+    $ python -m benchmarks.startup
+    $ # Using a Redis server
+    $ python -m benchmarks.startup --redis-url redis://localhost:6379/15
+    $ # Spawning a local redis-server
+    $ python -m benchmarks.startup --spawn-redis
+
+The report is printed as JSON on the standard output.
+
+"""
+
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+from rq_exporter.__version__ import __version__
+
+from .collect import spawn_redis
+
+
+# Timeout in seconds for the exporter process to accept connections
+READY_TIMEOUT = 30
+
+IMPORT_CODE = (
+    'import time; start = time.perf_counter(); import rq_exporter.__main__; '
+    'print(time.perf_counter() - start)'
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='RQ exporter startup benchmark')
+
+    parser.add_argument('--redis-url', help='Redis URL (Default: an unreachable Redis server)')
+    parser.add_argument('--spawn-redis', action='store_true', help='Spawn a local redis-server')
+    parser.add_argument('--iterations', type=int, default=5, help='Measured startups (Default: 5)')
+    parser.add_argument('--exporter-args', type=lambda v: v.split(), default=[],
+                        help='Space separated extra exporter arguments, e.g. "--batch-size 1000"')
+    parser.add_argument('--output', help='Write the report to a file instead of the standard output')
+
+    return parser.parse_args()
+
+
+def free_port():
+    """Get a free local TCP port."""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def summarize(values):
+    return {
+        'min': min(values),
+        'median': statistics.median(values),
+        'mean': statistics.mean(values),
+        'max': max(values),
+    }
+
+
+def measure_import():
+    """Measure the `rq_exporter` import time in a new interpreter.
+
+    Returns:
+        float: Import time in seconds.
+
+    """
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_CODE])
+    return float(output)
+
+
+def measure_startup(redis_url, exporter_args):
+    """Start an exporter process and measure the time until it serves a scrape.
+
+    Returns:
+        dict: Seconds until the port accepts connections and until the first
+            scrape response, with its HTTP status.
+
+    """
+    port = free_port()
+    url = f'http://127.0.0.1:{port}/metrics'
+
+    start = time.perf_counter()
+
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'rq_exporter', '--host', '127.0.0.1', '--port', str(port),
+         '--redis-url', redis_url, '--log-level', 'ERROR', *exporter_args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'The exporter exited with status {process.returncode}')
+
+            if time.perf_counter() - start > READY_TIMEOUT:
+                raise RuntimeError('The exporter did not accept connections in time')
+
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.001)
+
+        listening = time.perf_counter() - start
+
+        try:
+            with urllib.request.urlopen(url, timeout=READY_TIMEOUT) as response:
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            # Scrapes fail while Redis is not reachable
+            status = exc.code
+
+        first_scrape = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {'listening': listening, 'first_scrape': first_scrape, 'status': status}
+
+
+def main():
+    args = parse_args()
+
+    process = None
+
+    if args.spawn_redis:
+        process, args.redis_url = spawn_redis()
+
+    # Nothing listens on a free port
+    redis_url = args.redis_url or f'redis://127.0.0.1:{free_port()}/0'
+
+    try:
+        import_times = [measure_import() for _ in range(args.iterations)]
+        startups = []
+
+        for i in range(args.iterations):
+            print(f'Starting the exporter ({i + 1}/{args.iterations})...', file=sys.stderr)
+            startups.append(measure_startup(redis_url, args.exporter_args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {
+        'rq_exporter_version': __version__,
+        'python_version': platform.python_version(),
+        'redis': 'reachable' if args.redis_url else 'unreachable',
+        'params': {
+            'iterations': args.iterations,
+            'exporter_args': args.exporter_args,
+        },
+        'results': {
+            'import_seconds': summarize(import_times),
+            'listening_seconds': summarize([s['listening'] for s in startups]),
+            'first_scrape_seconds': summarize([s['first_scrape'] for s in startups]),
+            'first_scrape_statuses': sorted({s['status'] for s in startups}),
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
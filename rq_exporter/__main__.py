@@ -15,6 +15,12 @@ Usage:
     $ # Set Redis URL
     $ python -m rq_exporter --redis-url redis://:123456@redis_host:6379/0
 
+    $ # Serve the multi-target probe on /probe?target=redis://redis_host:6379/0
+    $ python -m rq_exporter --probe
+
+    $ # Use the asyncio server and redis.asyncio
+    $ python -m rq_exporter --async
+
 """
 
 import sys
@@ -23,19 +29,51 @@ import time
 import logging
 import argparse
 
-from prometheus_client import start_wsgi_server
+from prometheus_client import make_wsgi_app
 from prometheus_client.core import REGISTRY
 from redis.exceptions import RedisError
 from rq.utils import import_attribute
 
-from .collector import RQCollector
-from .utils import get_redis_connection
+from .collector import RQCollector, WORKER_AGGREGATIONS
+from .exporter import start_wsgi_server, make_deadline_app
+from .exposition import CachedExpositionApp
+from .instrumentation import instrument_connection
+from .probe import RQProbe, make_probe_app, parse_targets
+from .utils import get_redis_connection, get_connection_options, parse_list, DEFAULT_BATCH_SIZE
 from . import config
 from .__version__ import __version__
 
 
 logger = logging.getLogger(__package__)
 
+# Options not supported by the asyncio server: argument name, option and unset value
+# The options only used with another unsupported option are not listed
+ASYNC_UNSUPPORTED_OPTIONS = (
+    ('redis_cluster', '--redis-cluster', False),
+    ('sentinel_replica', '--sentinel-replica', False),
+    ('sentinel_max_lag', '--sentinel-max-lag', 0),
+    ('redis_max_connections', '--redis-max-connections', 0),
+    ('redis_socket_timeout', '--redis-socket-timeout', 0),
+    ('redis_connect_timeout', '--redis-connect-timeout', 0),
+    ('redis_keepalive', '--redis-keepalive', False),
+    ('redis_health_check_interval', '--redis-health-check-interval', 0),
+    ('redis_retries', '--redis-retries', 0),
+    ('stream_collection', '--stream-collection', False),
+    ('lua_script', '--lua-script', False),
+    ('poll_interval', '--poll-interval', 0),
+    ('reuse_window', '--reuse-window', 0),
+    ('cache_exposition', '--cache-exposition', False),
+    ('instrument_redis', '--instrument-redis', False),
+    ('scan_limit', '--scan-limit', 0),
+    ('failed_scan_limit', '--failed-scan-limit', 0),
+    ('started_limit', '--started-limit', 0),
+    ('queued_limit', '--queued-limit', 0),
+    ('scheduler_metrics', '--scheduler-metrics', False),
+    ('oldest_jobs', '--oldest-jobs', False),
+    ('worker_aggregation', '--worker-aggregation', 'none'),
+    ('breaker_threshold', '--breaker-threshold', 0),
+)
+
 
 def parse_args():
     """Parse the command line arguments."""
@@ -106,6 +144,15 @@ def parse_args():
         help = f'Redis database number (Default: {config.DEFAULT_REDIS_DB})'
     )
 
+    parser.add_argument(
+        '--redis-cluster',
+        dest = 'redis_cluster',
+        action = 'store_true',
+        default = config.REDIS_CLUSTER,
+        required = False,
+        help = 'Connect to a Redis Cluster, the Redis host and port are used as a startup node'
+    )
+
     parser.add_argument(
         '--sentinel-host',
         dest='sentinel_host',
@@ -136,6 +183,25 @@ def parse_args():
         help=f'Redis sentinel master name (Default: {config.DEFAULT_SENTINEL_MASTER})',
     )
 
+    parser.add_argument(
+        '--sentinel-replica',
+        dest='sentinel_replica',
+        action='store_true',
+        default=config.REDIS_SENTINEL_REPLICA,
+        required=False,
+        help='Read from the replicas of the Sentinel master, the master is used when no replica is available',
+    )
+
+    parser.add_argument(
+        '--sentinel-max-lag',
+        dest='sentinel_max_lag',
+        type=float,
+        default=config.REDIS_SENTINEL_MAX_LAG,
+        metavar='SECONDS',
+        required=False,
+        help=f'Maximum replication lag of the Sentinel replicas, 0 disables the check (Default: {config.DEFAULT_SENTINEL_MAX_LAG})',
+    )
+
     parser.add_argument(
         '--redis-pass',
         dest = 'redis_pass',
@@ -156,6 +222,75 @@ def parse_args():
         help = f'Redis server password file path (Default: {config.DEFAULT_REDIS_PASS_FILE})'
     )
 
+    parser.add_argument(
+        '--redis-max-connections',
+        dest = 'redis_max_connections',
+        type = int,
+        default = config.REDIS_MAX_CONNECTIONS,
+        metavar = 'CONNECTIONS',
+        required = False,
+        help = f'Maximum number of connections of the Redis connection pool, 0 is unlimited (Default: {config.DEFAULT_REDIS_MAX_CONNECTIONS})'
+    )
+
+    parser.add_argument(
+        '--redis-socket-timeout',
+        dest = 'redis_socket_timeout',
+        type = float,
+        default = config.REDIS_SOCKET_TIMEOUT,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Seconds to wait for a Redis reply, 0 waits forever (Default: {config.DEFAULT_REDIS_SOCKET_TIMEOUT})'
+    )
+
+    parser.add_argument(
+        '--redis-connect-timeout',
+        dest = 'redis_connect_timeout',
+        type = float,
+        default = config.REDIS_CONNECT_TIMEOUT,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Seconds to wait for a Redis connection, 0 uses the socket timeout (Default: {config.DEFAULT_REDIS_CONNECT_TIMEOUT})'
+    )
+
+    parser.add_argument(
+        '--redis-keepalive',
+        dest = 'redis_keepalive',
+        action = 'store_true',
+        default = config.REDIS_KEEPALIVE,
+        required = False,
+        help = 'Enable TCP keepalive on the Redis connections'
+    )
+
+    parser.add_argument(
+        '--redis-health-check-interval',
+        dest = 'redis_health_check_interval',
+        type = int,
+        default = config.REDIS_HEALTH_CHECK_INTERVAL,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Check the idle Redis connections with PING after this many seconds, 0 disables (Default: {config.DEFAULT_REDIS_HEALTH_CHECK_INTERVAL})'
+    )
+
+    parser.add_argument(
+        '--redis-retries',
+        dest = 'redis_retries',
+        type = int,
+        default = config.REDIS_RETRIES,
+        metavar = 'RETRIES',
+        required = False,
+        help = f'Number of retries of the Redis commands failing with connection or timeout errors (Default: {config.DEFAULT_REDIS_RETRIES})'
+    )
+
+    parser.add_argument(
+        '--redis-retry-backoff',
+        dest = 'redis_retry_backoff',
+        type = float,
+        default = config.REDIS_RETRY_BACKOFF,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Base delay of the exponential backoff between the Redis retries (Default: {config.DEFAULT_REDIS_RETRY_BACKOFF})'
+    )
+
     parser.add_argument(
         '--worker-class',
         dest = 'worker_class',
@@ -176,6 +311,257 @@ def parse_args():
         help = f'RQ Queue class (Default: {config.DEFAULT_QUEUE_CLASS})'
     )
 
+    parser.add_argument(
+        '--batch-size',
+        dest = 'batch_size',
+        type = int,
+        default = config.BATCH_SIZE,
+        metavar = 'SIZE',
+        required = False,
+        help = f'Number of Redis commands per pipeline, 0 disables batching (Default: {config.DEFAULT_BATCH_SIZE})'
+    )
+
+    parser.add_argument(
+        '--stream-collection',
+        dest = 'stream_collection',
+        action = 'store_true',
+        default = config.STREAM_COLLECTION,
+        required = False,
+        help = 'Read the workers and queues sets in chunks of --batch-size using SSCAN to bound the memory usage'
+    )
+
+    parser.add_argument(
+        '--lua-script',
+        dest = 'lua_script',
+        action = 'store_true',
+        default = config.LUA_SCRIPT,
+        required = False,
+        help = 'Collect the workers stats and jobs counts in a single round trip using a Lua script'
+    )
+
+    parser.add_argument(
+        '--poll-interval',
+        dest = 'poll_interval',
+        type = float,
+        default = config.POLL_INTERVAL,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Collect the metrics in the background every SECONDS, 0 collects on every request (Default: {config.DEFAULT_POLL_INTERVAL})'
+    )
+
+    parser.add_argument(
+        '--reuse-window',
+        dest = 'reuse_window',
+        type = float,
+        default = config.REUSE_WINDOW,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Reuse the last collected metrics for SECONDS after a collection (Default: {config.DEFAULT_REUSE_WINDOW})'
+    )
+
+    parser.add_argument(
+        '--scrape-timeout-offset',
+        dest = 'scrape_timeout_offset',
+        type = float,
+        default = config.SCRAPE_TIMEOUT_OFFSET,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Seconds subtracted from the Prometheus scrape timeout to get the collection deadline (Default: {config.DEFAULT_SCRAPE_TIMEOUT_OFFSET})'
+    )
+
+    parser.add_argument(
+        '--probe',
+        dest = 'probe',
+        action = 'store_true',
+        default = config.PROBE,
+        required = False,
+        help = 'Serve the multi-target probe on /probe?target=<redis-url>'
+    )
+
+    parser.add_argument(
+        '--probe-targets',
+        dest = 'probe_targets',
+        type = parse_targets,
+        default = config.PROBE_TARGETS,
+        metavar = 'redis://host1:6379/0,redis://host2:6379/0',
+        required = False,
+        help = 'Comma separated Redis URLs allowed to be probed (Default: all targets are allowed)'
+    )
+
+    parser.add_argument(
+        '--probe-concurrency',
+        dest = 'probe_concurrency',
+        type = int,
+        default = config.PROBE_CONCURRENCY,
+        metavar = 'THREADS',
+        required = False,
+        help = f'Maximum number of targets probed concurrently (Default: {config.DEFAULT_PROBE_CONCURRENCY})'
+    )
+
+    parser.add_argument(
+        '--probe-max-targets',
+        dest = 'probe_max_targets',
+        type = int,
+        default = config.PROBE_MAX_TARGETS,
+        metavar = 'TARGETS',
+        required = False,
+        help = f'Maximum number of probe targets whose connection pool is kept (Default: {config.DEFAULT_PROBE_MAX_TARGETS})'
+    )
+
+    parser.add_argument(
+        '--async',
+        dest = 'use_async',
+        action = 'store_true',
+        default = config.ASYNC,
+        required = False,
+        help = 'Serve the exporter using asyncio and redis.asyncio'
+    )
+
+    parser.add_argument(
+        '--cache-exposition',
+        dest = 'cache_exposition',
+        action = 'store_true',
+        default = config.CACHE_EXPOSITION,
+        required = False,
+        help = 'Render the RQ metrics once per collection and serve the cached output with an ETag'
+    )
+
+    parser.add_argument(
+        '--instrument-redis',
+        dest = 'instrument_redis',
+        action = 'store_true',
+        default = config.INSTRUMENT_REDIS,
+        required = False,
+        help = 'Export the Redis commands, round trips and bytes and the time spent by collection phase'
+    )
+
+    parser.add_argument(
+        '--scan-limit',
+        dest = 'scan_limit',
+        type = int,
+        default = config.SCAN_LIMIT,
+        metavar = 'ENTRIES',
+        required = False,
+        help = f'Maximum number of new finished job registry entries read per scrape for the job histograms, 0 disables (Default: {config.DEFAULT_SCAN_LIMIT})'
+    )
+
+    parser.add_argument(
+        '--failed-scan-limit',
+        dest = 'failed_scan_limit',
+        type = int,
+        default = config.FAILED_SCAN_LIMIT,
+        metavar = 'ENTRIES',
+        required = False,
+        help = f'Maximum number of new failed job registry entries read per scrape for the failed jobs by exception counters, 0 disables (Default: {config.DEFAULT_FAILED_SCAN_LIMIT})'
+    )
+
+    parser.add_argument(
+        '--started-limit',
+        dest = 'started_limit',
+        type = int,
+        default = config.STARTED_LIMIT,
+        metavar = 'JOBS',
+        required = False,
+        help = f'Maximum number of running jobs read per queue for the running jobs histogram, 0 disables (Default: {config.DEFAULT_STARTED_LIMIT})'
+    )
+
+    parser.add_argument(
+        '--queued-limit',
+        dest = 'queued_limit',
+        type = int,
+        default = config.QUEUED_LIMIT,
+        metavar = 'JOBS',
+        required = False,
+        help = f'Maximum number of jobs read from the head of each queue for the queued jobs by function metric, 0 disables (Default: {config.DEFAULT_QUEUED_LIMIT})'
+    )
+
+    parser.add_argument(
+        '--queued-cache-size',
+        dest = 'queued_cache_size',
+        type = int,
+        default = config.QUEUED_CACHE_SIZE,
+        metavar = 'JOBS',
+        required = False,
+        help = f'Maximum number of job function names cached between collections (Default: {config.DEFAULT_QUEUED_CACHE_SIZE})'
+    )
+
+    parser.add_argument(
+        '--scheduler-metrics',
+        dest = 'scheduler_metrics',
+        action = 'store_true',
+        default = config.SCHEDULER_METRICS,
+        required = False,
+        help = 'Read the overdue scheduled jobs and the scheduler locks with the job counts of --batch-size'
+    )
+
+    parser.add_argument(
+        '--oldest-jobs',
+        dest = 'oldest_jobs',
+        action = 'store_true',
+        default = config.OLDEST_JOBS,
+        required = False,
+        help = 'Read the enqueue time of the job at the head of each queue for the oldest job age metric'
+    )
+
+    parser.add_argument(
+        '--worker-aggregation',
+        dest = 'worker_aggregation',
+        type = str,
+        choices = WORKER_AGGREGATIONS,
+        default = config.WORKER_AGGREGATION,
+        required = False,
+        help = f'Aggregate the worker metrics by queue set or by individual queue instead of by worker name (Default: {config.DEFAULT_WORKER_AGGREGATION})'
+    )
+
+    parser.add_argument(
+        '--worker-allowlist',
+        dest = 'worker_allowlist',
+        type = parse_list,
+        default = config.WORKER_ALLOWLIST,
+        metavar = 'NAMES',
+        required = False,
+        help = 'Comma separated names of the workers kept in detail when aggregating'
+    )
+
+    parser.add_argument(
+        '--worker-top',
+        dest = 'worker_top',
+        type = int,
+        default = config.WORKER_TOP,
+        metavar = 'WORKERS',
+        required = False,
+        help = f'Number of workers with the highest working time kept in detail when aggregating (Default: {config.DEFAULT_WORKER_TOP})'
+    )
+
+    parser.add_argument(
+        '--breaker-threshold',
+        dest = 'breaker_threshold',
+        type = int,
+        default = config.BREAKER_THRESHOLD,
+        metavar = 'FAILURES',
+        required = False,
+        help = f'Number of consecutive failed collections after which the collections are skipped, 0 disables (Default: {config.DEFAULT_BREAKER_THRESHOLD})'
+    )
+
+    parser.add_argument(
+        '--breaker-reset-timeout',
+        dest = 'breaker_reset_timeout',
+        type = float,
+        default = config.BREAKER_RESET_TIMEOUT,
+        metavar = 'SECONDS',
+        required = False,
+        help = f'Seconds during which the collections are skipped before retrying (Default: {config.DEFAULT_BREAKER_RESET_TIMEOUT})'
+    )
+
+    parser.add_argument(
+        '--breaker-serve-stale',
+        dest = 'breaker_serve_stale',
+        action = 'store_true',
+        default = config.BREAKER_SERVE_STALE,
+        required = False,
+        help = 'Serve the last successful collection instead of failing while the collections are skipped'
+    )
+
     parser.add_argument(
         '--log-level',
         dest = 'log_level',
@@ -219,6 +605,19 @@ def main():
         level = args.log_level.upper()
     )
 
+    if args.use_async:
+        return main_async(args)
+
+    connection_options = get_connection_options(
+        max_connections=args.redis_max_connections,
+        socket_timeout=args.redis_socket_timeout,
+        socket_connect_timeout=args.redis_connect_timeout,
+        socket_keepalive=args.redis_keepalive,
+        health_check_interval=args.redis_health_check_interval,
+        retries=args.redis_retries,
+        retry_backoff=args.redis_retry_backoff,
+    )
+
     # Register the RQ collector
     try:
         connection = get_redis_connection(
@@ -229,16 +628,47 @@ def main():
             sentinel=args.sentinel_host,
             sentinel_port=args.sentinel_port,
             sentinel_master=args.sentinel_master,
+            sentinel_replica=args.sentinel_replica,
+            sentinel_max_lag=args.sentinel_max_lag or None,
             password=args.redis_pass,
             password_file=args.redis_pass_file,
+            cluster=args.redis_cluster,
+            options=connection_options,
         )
 
+        if args.instrument_redis:
+            instrument_connection(connection)
+
         worker_class = import_attribute(args.worker_class)
         queue_class = import_attribute(args.queue_class)
 
-        # Register the RQ collector
-        # The `collect` method is called on registration
-        REGISTRY.register(RQCollector(connection, worker_class, queue_class))
+        collector = RQCollector(
+            connection, worker_class, queue_class,
+            batch_size=args.batch_size,
+            poll_interval=args.poll_interval,
+            reuse_window=args.reuse_window,
+            scan_limit=args.scan_limit,
+            started_limit=args.started_limit,
+            worker_aggregation=args.worker_aggregation,
+            worker_allowlist=args.worker_allowlist,
+            worker_top=args.worker_top,
+            breaker_threshold=args.breaker_threshold,
+            breaker_reset_timeout=args.breaker_reset_timeout,
+            serve_stale=args.breaker_serve_stale,
+            streaming=args.stream_collection,
+            lua_script=args.lua_script,
+            queued_limit=args.queued_limit,
+            queued_cache_size=args.queued_cache_size,
+            failed_scan_limit=args.failed_scan_limit,
+            scheduler_metrics=args.scheduler_metrics,
+            oldest_jobs=args.oldest_jobs
+        )
+
+        # The collector is served by the cached exposition app instead of the registry
+        if not args.cache_exposition:
+            # Register the RQ collector
+            # The `describe` method is called on registration, Redis is not accessed
+            REGISTRY.register(collector)
     except (IOError, RedisError) as exc:
         logger.exception('There was an error starting the RQ exporter')
         sys.exit(1)
@@ -246,8 +676,27 @@ def main():
         logger.exception('Incorrect RQ class location')
         sys.exit(1)
 
+    if args.poll_interval > 0:
+        collector.start_polling()
+
+    app = CachedExpositionApp(collector) if args.cache_exposition else make_wsgi_app()
+    app = make_deadline_app(app, collector, args.scrape_timeout_offset)
+
+    if args.probe:
+        probe = RQProbe(
+            worker_class, queue_class,
+            batch_size=args.batch_size,
+            targets=args.probe_targets,
+            max_workers=args.probe_concurrency,
+            connection_options=connection_options,
+            max_targets=args.probe_max_targets,
+            oldest_jobs=args.oldest_jobs
+        )
+
+        app = make_probe_app(app, probe)
+
     # Start the WSGI server
-    start_wsgi_server(args.port, args.host)
+    start_wsgi_server(app, args.port, args.host)
 
     logger.info(f'Serving the application on {args.host}:{args.port}')
 
@@ -255,6 +704,73 @@ def main():
         time.sleep(1)
 
 
+def get_async_unsupported_options(args):
+    """Get the options set on the command line or in the environment that the asyncio server doesn't support.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments
+
+    Returns:
+        list: The unsupported options that are set.
+
+    """
+    return [
+        option for (name, option, unset) in ASYNC_UNSUPPORTED_OPTIONS
+        if getattr(args, name) and getattr(args, name) != unset
+    ]
+
+
+def main_async(args):
+    """Start the asyncio server."""
+    import asyncio
+    from .aio import AsyncExporter, AsyncRQCollector, AsyncRQProbe, get_async_redis_connection
+
+    unsupported = get_async_unsupported_options(args)
+
+    if unsupported:
+        logger.error(f'The {", ".join(unsupported)} options are not supported by the asyncio server')
+        sys.exit(1)
+
+    # Every Redis read is pipelined in asyncio mode
+    batch_size = args.batch_size if args.batch_size > 0 else DEFAULT_BATCH_SIZE
+
+    try:
+        connection = get_async_redis_connection(
+            url=args.redis_url,
+            host=args.redis_host,
+            port=args.redis_port,
+            db=args.redis_db,
+            sentinel=args.sentinel_host,
+            sentinel_port=args.sentinel_port,
+            sentinel_master=args.sentinel_master,
+            password=args.redis_pass,
+            password_file=args.redis_pass_file,
+        )
+
+        worker_class = import_attribute(args.worker_class)
+        queue_class = import_attribute(args.queue_class)
+    except IOError as exc:
+        logger.exception('There was an error starting the RQ exporter')
+        sys.exit(1)
+    except (ImportError, AttributeError) as exc:
+        logger.exception('Incorrect RQ class location')
+        sys.exit(1)
+
+    collector = AsyncRQCollector(connection, worker_class, queue_class, batch_size=batch_size)
+
+    probe = None
+
+    if args.probe:
+        probe = AsyncRQProbe(
+            worker_class, queue_class,
+            batch_size=batch_size,
+            targets=args.probe_targets,
+            max_targets=args.probe_max_targets
+        )
+
+    asyncio.run(AsyncExporter(collector, probe).serve(args.host, args.port))
+
+
 if __name__ == '__main__':
     def signal_handler(sig, frame):
         logger.info('Stopping the server...')
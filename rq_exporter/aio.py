@@ -0,0 +1,480 @@
+"""
+RQ exporter asyncio server.
+
+Collect the RQ metrics using `redis.asyncio` and serve them from an asyncio HTTP server.
+
+Usage:
+
+    $ python -m rq_exporter --async
+
+"""
+
+import gzip
+import time
+import asyncio
+import logging
+from urllib.parse import urlsplit, parse_qs
+
+from prometheus_client import Summary
+from prometheus_client.core import REGISTRY, CollectorRegistry
+from prometheus_client.exposition import choose_encoder
+from redis.asyncio import Redis
+from redis.asyncio.sentinel import Sentinel
+from redis.exceptions import RedisError
+from rq import Queue, Worker
+from rq.utils import as_text
+
+from .collector import StaticCollector, build_metrics
+from .probe import add_target_label, build_probe_metrics, get_target_label
+from .utils import (
+    WORKER_FIELDS, get_worker_keys, parse_workers_stats, get_queues_commands, parse_jobs_by_queue, LRUCache,
+    read_password, parse_sentinel_addresses
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds to wait for the request of a client and for the response to be sent
+REQUEST_TIMEOUT = 10
+
+# Maximum number of header lines of a request
+MAX_HEADERS = 100
+
+
+def get_async_redis_connection(host='localhost', port='6379', db='0', sentinel=None,
+                               sentinel_port='26379', sentinel_master=None,
+                               password=None, password_file=None, url=None):
+    """Get the `redis.asyncio` connection instance.
+
+    Note:
+        Same as `rq_exporter.utils.get_redis_connection` but returns an asyncio client.
+
+    Returns:
+        redis.asyncio.Redis: Redis connection instance.
+
+    Raises:
+        IOError: On errors opening the password file.
+
+    """
+    if url:
+        return Redis.from_url(url)
+
+    # Use password file if provided
+    password = read_password(password, password_file)
+
+    if sentinel:
+        return Sentinel(
+            parse_sentinel_addresses(sentinel, sentinel_port),
+            sentinel_kwargs={'password': password, 'socket_timeout': 1}
+        ).master_for(sentinel_master, password=password, db=db, socket_timeout=1)
+
+    return Redis(host=host, port=port, db=db, password=password)
+
+
+async def execute_pipelined_async(connection, commands, batch_size):
+    """Execute Redis commands using concurrent pipelines.
+
+    Each chunk of `batch_size` commands is sent in its own pipeline and
+    the chunks are sent concurrently.
+
+    Args:
+        connection (redis.asyncio.Redis): Redis connection instance.
+        commands (list): List of `(command, *args)` tuples, e.g. `('llen', key)`
+        batch_size (int): Maximum number of commands per pipeline
+
+    Returns:
+        list: The commands replies in the same order as `commands`
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    async def execute(chunk):
+        async with connection.pipeline(transaction=False) as pipeline:
+            for (command, *args) in chunk:
+                getattr(pipeline, command)(*args)
+
+            return await pipeline.execute()
+
+    chunks = await asyncio.gather(*(
+        execute(commands[i:i + batch_size]) for i in range(0, len(commands), batch_size)
+    ))
+
+    return [reply for chunk in chunks for reply in chunk]
+
+
+async def get_workers_stats_async(connection, worker_class=None, batch_size=1000):
+    """Get the RQ workers stats.
+
+    Args:
+        connection (redis.asyncio.Redis): Redis connection instance.
+        worker_class (type): RQ Worker class
+        batch_size (int): Maximum number of commands per pipeline
+
+    Returns:
+        list: List of worker stats as a dict {name, queues, state}
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    worker_class = worker_class if worker_class is not None else Worker
+
+    worker_keys = get_worker_keys(
+        worker_class, await connection.smembers(worker_class.redis_workers_keys)
+    )
+
+    replies = await execute_pipelined_async(
+        connection,
+        [('hmget', key, WORKER_FIELDS) for key in worker_keys],
+        batch_size
+    )
+
+    return parse_workers_stats(worker_class, worker_keys, replies)
+
+
+async def get_jobs_by_queue_async(connection, queue_class=None, batch_size=1000):
+    """Get the current jobs by queue.
+
+    Args:
+        connection (redis.asyncio.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+        batch_size (int): Maximum number of commands per pipeline
+
+    Returns:
+        dict: Dictionary of job count by status for each queue
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    queue_class = queue_class if queue_class is not None else Queue
+
+    # The queues are only used to get the Redis keys, no commands are executed
+    queues = [
+        queue_class.from_queue_key(as_text(key), connection=connection)
+        for key in await connection.smembers(queue_class.redis_queues_keys) if key
+    ]
+
+    commands = get_queues_commands(queues)
+
+    return parse_jobs_by_queue(
+        queues, await execute_pipelined_async(connection, list(commands.values()), batch_size)
+    )
+
+
+class AsyncRQCollector(object):
+    """RQ stats collector using `redis.asyncio`.
+
+    The workers and jobs are collected concurrently and concurrent requests
+    share the in-flight collection.
+
+    Args:
+        connection (redis.asyncio.Redis): Redis connection instance.
+        worker_class (type): RQ Worker class
+        queue_class (type): RQ Queue class
+        batch_size (int): Number of Redis commands per pipeline
+        summary (prometheus_client.Summary): Summary metric recording the collections,
+            defaults to a new `rq_request_processing_seconds` summary.
+
+    """
+
+    def __init__(self, connection, worker_class=None, queue_class=None, batch_size=1000,
+                 summary=None):
+        self.connection = connection
+        self.worker_class = worker_class
+        self.queue_class = queue_class
+        self.batch_size = batch_size
+
+        self._flight = None
+
+        # RQ data collection count and time in seconds
+        self.summary = summary if summary is not None else Summary(
+            'rq_request_processing_seconds', 'Time spent collecting RQ data'
+        )
+
+    async def collect_once(self):
+        """Get the RQ metrics, sharing the collection with concurrent requests.
+
+        Returns:
+            list: RQ metric families for workers and jobs.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        if self._flight is None or self._flight.done():
+            self._flight = asyncio.ensure_future(self.get_metrics())
+
+        # A cancelled request must not cancel the shared collection
+        return await asyncio.shield(self._flight)
+
+    async def get_metrics(self):
+        """Get the RQ metrics from Redis.
+
+        Returns:
+            list: RQ metric families for workers and jobs.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        logger.debug('Collecting the RQ metrics...')
+
+        with self.summary.time():
+            workers, jobs_by_queue = await asyncio.gather(
+                get_workers_stats_async(self.connection, self.worker_class, self.batch_size),
+                get_jobs_by_queue_async(self.connection, self.queue_class, self.batch_size),
+            )
+
+        logger.debug('RQ metrics collection finished')
+
+        return build_metrics(workers, jobs_by_queue)
+
+
+class AsyncRQProbe(object):
+    """Collect the RQ metrics of the requested targets using `redis.asyncio`.
+
+    Args:
+        worker_class (type): RQ Worker class
+        queue_class (type): RQ Queue class
+        batch_size (int): Number of Redis commands per pipeline
+        targets (list): Allowed Redis URLs, all the targets are allowed if empty
+        max_targets (int): Maximum number of targets whose collector is kept, the
+            connections of the least recently probed targets are closed
+
+    """
+
+    def __init__(self, worker_class=None, queue_class=None, batch_size=1000, targets=None, max_targets=100):
+        self.worker_class = worker_class
+        self.queue_class = queue_class
+        self.batch_size = batch_size
+        self.targets = set(targets or [])
+
+        self._collectors = LRUCache(max_targets)
+
+        # Probe collection count and time in seconds by target
+        self.summary = Summary(
+            'rq_probe_processing_seconds', 'Time spent collecting RQ data of probe targets',
+            labelnames=['target'],
+        )
+
+    def is_allowed(self, target):
+        """Whether the target is allowed to be probed."""
+        return not self.targets or target in self.targets
+
+    async def close_collector(self, target, collector):
+        """Close the connections of a target no longer kept.
+
+        Args:
+            target (str): Redis URL
+            collector (AsyncRQCollector): Collector of the target
+
+        """
+        try:
+            self.summary.remove(get_target_label(target))
+        except KeyError:
+            # Another target URL with the same label was removed
+            pass
+
+        await collector.connection.aclose()
+
+    async def probe(self, target):
+        """Collect the RQ metrics of a target.
+
+        Args:
+            target (str): Redis URL
+
+        Returns:
+            list: The target metric families with the `target` label and the probe metrics.
+
+        """
+        label = get_target_label(target)
+        start = time.perf_counter()
+
+        try:
+            collector = self._collectors.get(target)
+
+            if collector is None:
+                collector = AsyncRQCollector(
+                    Redis.from_url(target),
+                    self.worker_class,
+                    self.queue_class,
+                    batch_size=self.batch_size,
+                    summary=self.summary.labels(label),
+                )
+
+                for (evicted_target, evicted) in self._collectors.set(target, collector):
+                    await self.close_collector(evicted_target, evicted)
+
+            metrics = add_target_label(await collector.collect_once(), label)
+            success = 1
+        except (RedisError, ValueError):
+            logger.exception(f'There was an error probing the target {label}')
+            metrics = []
+            success = 0
+
+        return metrics + build_probe_metrics(label, success, time.perf_counter() - start)
+
+
+class AsyncExporter(object):
+    """Minimal asyncio HTTP server for the exporter metrics.
+
+    Args:
+        collector (AsyncRQCollector): RQ metrics collector
+        probe (AsyncRQProbe): Optional multi-target probe served on `/probe`
+        request_timeout (float): Seconds to wait for the request of a client and for
+            the response to be sent, the connection is closed after this delay
+
+    """
+
+    def __init__(self, collector, probe=None, request_timeout=REQUEST_TIMEOUT):
+        self.collector = collector
+        self.probe = probe
+        self.request_timeout = request_timeout
+
+    async def get_response(self, method, path, query):
+        """Get the response status and the metric families to render.
+
+        Returns:
+            tuple: `(status, metrics, body)`, `metrics` is `None` for non metrics responses.
+
+        """
+        if method != 'GET':
+            return '405 Method Not Allowed', None, b''
+
+        if path == '/favicon.ico':
+            return '200 OK', None, b''
+
+        if path == '/probe' and self.probe is not None:
+            target = parse_qs(query).get('target', [None])[0]
+
+            if not target:
+                return '400 Bad Request', None, b'The "target" parameter is required\n'
+
+            if not self.probe.is_allowed(target):
+                return '403 Forbidden', None, b'The target is not allowed\n'
+
+            return '200 OK', await self.probe.probe(target), b''
+
+        try:
+            metrics = await self.collector.collect_once()
+        except RedisError:
+            logger.exception('There was an error collecting the RQ metrics')
+            return '500 Internal Server Error', None, b'Error collecting the RQ metrics\n'
+
+        return '200 OK', list(REGISTRY.collect()) + metrics, b''
+
+    async def read_request(self, reader):
+        """Read the request line and the headers of an HTTP request.
+
+        Returns:
+            tuple: `(method, target, headers)`, `None` if the client closed the
+                connection without sending a request.
+
+        Raises:
+            ValueError: On malformed requests or lines longer than the stream limit
+            UnicodeError: On non ASCII request lines
+
+        """
+        line = await reader.readline()
+
+        if not line:
+            return None
+
+        request_line = line.decode('ascii').split()
+
+        if len(request_line) != 3:
+            raise ValueError('Malformed request line')
+
+        headers = {}
+
+        for count in range(MAX_HEADERS + 1):
+            line = await reader.readline()
+
+            if line in (b'\r\n', b'\n', b''):
+                break
+
+            if count == MAX_HEADERS:
+                raise ValueError('Too many headers')
+
+            name, separator, value = line.decode('latin-1').partition(':')
+
+            if not separator or not name.strip():
+                raise ValueError('Malformed header line')
+
+            headers[name.strip().lower()] = value.strip()
+
+        method, target, _ = request_line
+
+        return method, target, headers
+
+    async def handle(self, reader, writer):
+        """Handle an HTTP request."""
+        try:
+            try:
+                request = await asyncio.wait_for(self.read_request(reader), self.request_timeout)
+            except asyncio.TimeoutError:
+                logger.debug('Timeout reading the request')
+                return
+            except (ValueError, UnicodeError) as exc:
+                logger.debug(f'Malformed request: {exc}')
+                await self.write_response(
+                    writer, '400 Bad Request', [('Content-Type', 'text/plain; charset=utf-8')], b'Malformed request\n'
+                )
+                return
+
+            if request is None:
+                return
+
+            method, target, headers = request
+
+            url = urlsplit(target)
+            status, metrics, body = await self.get_response(method, url.path, url.query)
+
+            response_headers = [('Content-Type', 'text/plain; charset=utf-8')]
+
+            if metrics is not None:
+                registry = CollectorRegistry(auto_describe=False)
+                registry.register(StaticCollector(metrics))
+
+                encoder, content_type = choose_encoder(headers.get('accept'))
+                body = encoder(registry)
+                response_headers = [('Content-Type', content_type)]
+
+                if 'gzip' in headers.get('accept-encoding', ''):
+                    body = gzip.compress(body)
+                    response_headers.append(('Content-Encoding', 'gzip'))
+
+            await self.write_response(writer, status, response_headers, body)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def write_response(self, writer, status, headers, body):
+        """Write an HTTP response, waiting at most `request_timeout` seconds for the client to read it.
+
+        Raises:
+            asyncio.TimeoutError: If the client doesn't read the response in time
+            ConnectionError: If the client closed the connection
+
+        """
+        headers = headers + [('Content-Length', str(len(body))), ('Connection', 'close')]
+
+        writer.write(f'HTTP/1.1 {status}\r\n'.encode('latin-1'))
+        for (name, value) in headers:
+            writer.write(f'{name}: {value}\r\n'.encode('latin-1'))
+        writer.write(b'\r\n' + body)
+
+        await asyncio.wait_for(writer.drain(), self.request_timeout)
+
+    async def serve(self, host, port):
+        """Serve the exporter forever."""
+        server = await asyncio.start_server(self.handle, host, port)
+
+        logger.info(f'Serving the application on {host}:{port}')
+
+        async with server:
+            await server.serve_forever()
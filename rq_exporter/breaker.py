@@ -0,0 +1,75 @@
+"""
+Circuit breaker for the Redis collections.
+
+"""
+
+import time
+import threading
+
+from redis.exceptions import RedisError
+
+
+class CircuitOpenError(RedisError):
+    """Raised when a collection is skipped because the circuit is open."""
+
+
+class CircuitBreaker(object):
+    """Skip the Redis collections after consecutive failures.
+
+    The circuit opens after `failure_threshold` consecutive failures, the
+    collections are then skipped for `reset_timeout` seconds, after which a
+    single trial collection is allowed (half-open state). The circuit is
+    closed if it succeeds, otherwise it's opened again.
+
+    Args:
+        failure_threshold (int): Number of consecutive failures opening the circuit
+        reset_timeout (float): Seconds before allowing a trial collection
+
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """Whether the circuit is open (including the half-open state)."""
+        return self.opened_at is not None
+
+    def before_call(self):
+        """Check whether a collection is allowed.
+
+        Raises:
+            CircuitOpenError: If the circuit is open or a trial collection is running
+
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return
+
+            if self._trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError('Redis is unhealthy, the collection was skipped')
+
+            self._trial = True
+
+    def record_success(self):
+        """Close the circuit after a successful collection."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        """Record a failed collection, opening the circuit if needed."""
+        with self._lock:
+            self.failures += 1
+
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+            self._trial = False
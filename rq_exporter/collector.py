@@ -3,16 +3,459 @@ RQ metrics collector.
 
 """
 
+import time
 import logging
+import threading
+from contextlib import contextmanager
+from collections import namedtuple
 
 from prometheus_client import Summary
-from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily, GaugeHistogramMetricFamily
+from prometheus_client.utils import floatToGoString
+from redis.cluster import RedisCluster
+from redis.exceptions import ResponseError
 
-from .utils import get_workers_stats, get_jobs_by_queue
+from .utils import (
+    get_workers_stats, get_workers_stats_batched, get_jobs_by_queue, get_jobs_by_queue_batched,
+    iter_workers_stats, iter_jobs_by_queue, get_oldest_jobs_by_queue, get_started_jobs_by_queue,
+    get_queued_jobs_by_func, get_queues, LRUCache, DEFAULT_BATCH_SIZE
+)
+from .breaker import CircuitBreaker, CircuitOpenError
+from .histogram import DEFAULT_BUCKETS
+from .instrumentation import CommandStats, command_phase
+from .scanner import FinishedJobsScanner, FailedJobsScanner
+from .script import CollectionScript
+from .sentinel import ReplicaConnectionPool
 
 logger = logging.getLogger(__name__)
 
 
+# Immutable result of a background collection
+# `metrics` is a tuple of metric families and `timestamp` the time of the last successful collection
+Snapshot = namedtuple('Snapshot', ['metrics', 'timestamp', 'success'])
+
+# Worker aggregation modes
+# `none` keeps a series per worker, `queues` aggregates the workers by queue set
+# and `queue` by individual queue
+WORKER_AGGREGATIONS = ('none', 'queues', 'queue')
+
+# Metric families changing on every collection even when the RQ data didn't change,
+# the ages relative to the collection time and the exporter own instrumentation
+VOLATILE_METRICS = frozenset((
+    'rq_worker_heartbeat_age_seconds',
+    'rq_worker_current_job_seconds',
+    'rq_queue_oldest_job_age_seconds',
+    'rq_scheduled_jobs_max_lag_seconds',
+    'rq_job_running_seconds',
+    'rq_exporter_phase_duration_seconds',
+    'rq_exporter_redis_commands',
+    'rq_exporter_redis_round_trips',
+    'rq_exporter_redis_sent_bytes',
+    'rq_exporter_redis_received_bytes',
+))
+
+
+def aggregate_workers(workers, mode='none', allowlist=None, top=0):
+    """Aggregate the workers stats to limit the number of series.
+
+    The workers kept in detail are the workers in `allowlist` and the `top`
+    workers with the highest total working time, the other workers are
+    aggregated by queue set (`queues` mode) or by individual queue (`queue` mode)
+    with an empty `name`. The workers of a group are counted by state, the
+    counters are summed across all the states so that they don't move between
+    groups when a worker changes state. The aggregated workers keep the oldest
+    heartbeat and current job start time of the group.
+
+    Note:
+        In `queue` mode the stats of a worker listening on multiple queues are
+        counted for each of its queues.
+        The workers iterable is consumed once, it's only loaded in memory
+        when `top` is set.
+
+    Args:
+        workers (iterable): Workers stats returned by `get_workers_stats` or `iter_workers_stats`
+        mode (str): Aggregation mode, one of `WORKER_AGGREGATIONS`
+        allowlist (list): Names of the workers to keep in detail
+        top (int): Number of workers with the highest working time to keep in detail
+
+    Returns:
+        list: Workers stats, the aggregated workers have a `states` dict
+            with the number of workers by state instead of a `state`.
+
+    Raises:
+        ValueError: On invalid aggregation mode
+
+    """
+    if mode not in WORKER_AGGREGATIONS:
+        raise ValueError(f'Invalid worker aggregation mode: {mode}')
+
+    if mode == 'none':
+        return workers
+
+    keep = set(allowlist or [])
+
+    if top > 0:
+        workers = list(workers)
+        by_working_time = sorted(workers, key=lambda w: w['total_working_time'], reverse=True)
+        keep.update(w['name'] for w in by_working_time[:top])
+
+    detailed = []
+    aggregated = {}
+
+    for worker in workers:
+        if worker['name'] in keep:
+            detailed.append(worker)
+            continue
+
+        queue_sets = [[q] for q in worker['queues']] if mode == 'queue' else [worker['queues']]
+
+        for queues in queue_sets:
+            group = aggregated.setdefault(tuple(queues), {
+                'name': '',
+                'states': {},
+                'queues': queues,
+                'successful_job_count': 0,
+                'failed_job_count': 0,
+                'total_working_time': 0,
+                'last_heartbeat': None,
+                'current_job_started_at': None,
+            })
+
+            group['successful_job_count'] += worker['successful_job_count']
+            group['failed_job_count'] += worker['failed_job_count']
+            group['total_working_time'] += worker['total_working_time']
+            group['states'][worker['state']] = group['states'].get(worker['state'], 0) + 1
+
+            # The oldest heartbeat and the longest running job of the group
+            for field in ('last_heartbeat', 'current_job_started_at'):
+                if worker.get(field) is not None and (group[field] is None or worker[field] < group[field]):
+                    group[field] = worker[field]
+
+    return detailed + list(aggregated.values())
+
+
+def build_metrics(workers, jobs_by_queue, oldest_jobs=None):
+    """Build the RQ metric families.
+
+    Args:
+        workers (iterable): Workers stats returned by `get_workers_stats` or `aggregate_workers`
+        jobs_by_queue (dict): Jobs count by status for each queue returned by `get_jobs_by_queue`
+        oldest_jobs (dict): Enqueue timestamp of the oldest job by queue returned
+            by `get_oldest_jobs_by_queue`
+
+    Returns:
+        list: RQ metric families for workers and jobs.
+
+    """
+    metrics = build_workers_metrics(workers) + build_jobs_metrics(jobs_by_queue)
+
+    if oldest_jobs is not None:
+        metrics.extend(build_oldest_jobs_metrics(oldest_jobs))
+
+    return metrics
+
+
+def build_workers_metrics(workers):
+    """Build the workers metric families.
+
+    Args:
+        workers (iterable): Workers stats returned by `get_workers_stats`, `iter_workers_stats`
+            or `aggregate_workers`, consumed once
+
+    Returns:
+        list: The `rq_workers`, `rq_workers_success`, `rq_workers_failed`,
+            `rq_workers_working_time`, `rq_worker_heartbeat_age_seconds` and
+            `rq_worker_current_job_seconds` metric families.
+
+    """
+    rq_workers = GaugeMetricFamily(
+        'rq_workers', 'RQ workers',
+        labels=['name', 'state', 'queues'],
+    )
+    rq_workers_success = CounterMetricFamily(
+        'rq_workers_success', 'RQ workers success count',
+        labels=['name', 'queues'],
+    )
+    rq_workers_failed = CounterMetricFamily(
+        'rq_workers_failed', 'RQ workers fail count',
+        labels=['name', 'queues'],
+    )
+    rq_workers_working_time = CounterMetricFamily(
+        'rq_workers_working_time', 'RQ workers spent seconds',
+        labels=['name', 'queues'],
+    )
+
+    rq_worker_heartbeat_age_seconds = GaugeMetricFamily(
+        'rq_worker_heartbeat_age_seconds', 'Seconds since the last heartbeat of the RQ workers',
+        labels=['name', 'queues'],
+    )
+    rq_worker_current_job_seconds = GaugeMetricFamily(
+        'rq_worker_current_job_seconds', 'Seconds since the RQ workers started their current job',
+        labels=['name', 'queues'],
+    )
+
+    now = time.time()
+
+    for worker in workers:
+        label_queues = ','.join(worker['queues'])
+
+        states = worker['states'] if 'states' in worker else {worker['state']: 1}
+
+        for (state, count) in states.items():
+            rq_workers.add_metric([worker['name'], state, label_queues], count)
+
+        rq_workers_success.add_metric(
+            [worker['name'], label_queues], worker['successful_job_count'],
+        )
+        rq_workers_failed.add_metric(
+            [worker['name'], label_queues], worker['failed_job_count'],
+        )
+        rq_workers_working_time.add_metric(
+            [worker['name'], label_queues], worker['total_working_time'],
+        )
+
+        if worker.get('last_heartbeat') is not None:
+            rq_worker_heartbeat_age_seconds.add_metric(
+                [worker['name'], label_queues], max(0, now - worker['last_heartbeat']),
+            )
+
+        if worker.get('current_job_started_at') is not None:
+            rq_worker_current_job_seconds.add_metric(
+                [worker['name'], label_queues], max(0, now - worker['current_job_started_at']),
+            )
+
+    return [
+        rq_workers, rq_workers_success, rq_workers_failed, rq_workers_working_time,
+        rq_worker_heartbeat_age_seconds, rq_worker_current_job_seconds
+    ]
+
+
+def build_jobs_metrics(jobs_by_queue):
+    """Build the jobs metric family.
+
+    Args:
+        jobs_by_queue (dict, iterable): Jobs count by status for each queue returned by
+            `get_jobs_by_queue` or `(queue_name, jobs)` pairs yielded by `iter_jobs_by_queue`
+
+    Returns:
+        list: The `rq_jobs` metric family.
+
+    """
+    rq_jobs = GaugeMetricFamily(
+        'rq_jobs', 'RQ jobs by state',
+        labels=['queue', 'status'],
+    )
+
+    if isinstance(jobs_by_queue, dict):
+        jobs_by_queue = jobs_by_queue.items()
+
+    for (queue_name, jobs) in jobs_by_queue:
+        for (status, count) in jobs.items():
+            rq_jobs.add_metric([queue_name, status], count)
+
+    return [rq_jobs]
+
+
+def build_oldest_jobs_metrics(oldest_jobs):
+    """Build the oldest job age metric family.
+
+    Args:
+        oldest_jobs (dict): Enqueue timestamp of the oldest job by queue returned
+            by `get_oldest_jobs_by_queue`
+
+    Returns:
+        list: The `rq_queue_oldest_job_age_seconds` metric family.
+
+    """
+    rq_queue_oldest_job_age = GaugeMetricFamily(
+        'rq_queue_oldest_job_age_seconds', 'Seconds since the job at the head of the queue was enqueued',
+        labels=['queue'],
+    )
+
+    now = time.time()
+
+    for (queue_name, enqueued_at) in oldest_jobs.items():
+        # Empty queues have no waiting jobs
+        age = max(0, now - enqueued_at) if enqueued_at is not None else 0
+        rq_queue_oldest_job_age.add_metric([queue_name], age)
+
+    return [rq_queue_oldest_job_age]
+
+
+def build_scheduler_metrics(scheduler_stats):
+    """Build the scheduler metric families.
+
+    Args:
+        scheduler_stats (dict): Scheduler stats by queue updated by `get_jobs_by_queue_batched`
+
+    Returns:
+        list: The `rq_scheduled_jobs_overdue`, `rq_scheduled_jobs_max_lag_seconds`
+            and `rq_scheduler_lock_held` metric families.
+
+    """
+    rq_scheduled_jobs_overdue = GaugeMetricFamily(
+        'rq_scheduled_jobs_overdue', 'RQ scheduled jobs past their scheduled time',
+        labels=['queue'],
+    )
+
+    rq_scheduled_jobs_max_lag = GaugeMetricFamily(
+        'rq_scheduled_jobs_max_lag_seconds', 'Seconds since the earliest overdue scheduled job was due',
+        labels=['queue'],
+    )
+
+    rq_scheduler_lock_held = GaugeMetricFamily(
+        'rq_scheduler_lock_held', 'Whether an RQ scheduler holds the lock of the queue',
+        labels=['queue'],
+    )
+
+    for (queue_name, stats) in scheduler_stats.items():
+        rq_scheduled_jobs_overdue.add_metric([queue_name], stats['overdue'])
+        rq_scheduled_jobs_max_lag.add_metric([queue_name], stats['max_lag'])
+        rq_scheduler_lock_held.add_metric([queue_name], 1 if stats['lock_held'] else 0)
+
+    return [rq_scheduled_jobs_overdue, rq_scheduled_jobs_max_lag, rq_scheduler_lock_held]
+
+
+def build_started_jobs_metrics(started_jobs):
+    """Build the started jobs metric families.
+
+    Args:
+        started_jobs (dict): Expired entries count and running jobs start timestamps
+            by queue returned by `get_started_jobs_by_queue`
+
+    Returns:
+        list: The `rq_job_running_seconds` and `rq_jobs_expired_started` metric families.
+
+    """
+    rq_job_running = GaugeHistogramMetricFamily(
+        'rq_job_running_seconds', 'RQ running jobs time since the job started',
+        labels=['queue'],
+    )
+    rq_jobs_expired_started = GaugeMetricFamily(
+        'rq_jobs_expired_started', 'RQ started jobs past their expiry time (abandoned jobs)',
+        labels=['queue'],
+    )
+
+    now = time.time()
+
+    for (queue_name, (expired, started_at)) in started_jobs.items():
+        rq_jobs_expired_started.add_metric([queue_name], expired)
+
+        running = [max(0, now - ts) for ts in started_at]
+
+        # The running jobs are a snapshot, the bucket counts go up and down between scrapes
+        buckets = [
+            (floatToGoString(bound), sum(1 for value in running if value <= bound))
+            for bound in DEFAULT_BUCKETS
+        ]
+
+        rq_job_running.add_metric([queue_name], buckets, sum(running))
+
+    return [rq_job_running, rq_jobs_expired_started]
+
+
+def build_queued_jobs_metrics(queued_jobs):
+    """Build the queued jobs by function metric family.
+
+    Args:
+        queued_jobs (dict): Jobs count by function name by queue name
+
+    """
+    rq_queued_jobs_by_func = GaugeMetricFamily(
+        'rq_queued_jobs_by_func', 'RQ jobs at the head of the queues by function',
+        labels=['queue', 'func']
+    )
+
+    for (queue_name, counts) in queued_jobs.items():
+        for (func_name, count) in counts.items():
+            rq_queued_jobs_by_func.add_metric([queue_name, func_name], count)
+
+    return [rq_queued_jobs_by_func]
+
+
+def build_partial_scrape_metric(partial=None):
+    """Build the `rq_exporter_partial_scrape` metric family.
+
+    Args:
+        partial (bool): Whether collection phases were skipped, `None` for no sample
+
+    """
+    return GaugeMetricFamily(
+        'rq_exporter_partial_scrape',
+        'Whether collection phases were skipped because the scrape deadline was exceeded',
+        value=int(partial) if partial is not None else None,
+    )
+
+
+def build_circuit_open_metric(is_open=None):
+    """Build the `rq_exporter_circuit_open` metric family.
+
+    Args:
+        is_open (bool): Whether the circuit is open, `None` for no sample
+
+    """
+    return GaugeMetricFamily(
+        'rq_exporter_circuit_open',
+        'Whether the RQ data collections are skipped because Redis is unhealthy',
+        value=int(is_open) if is_open is not None else None,
+    )
+
+
+def build_redis_nodes_metric(nodes=()):
+    """Build the `rq_exporter_redis_node_info` metric family.
+
+    Args:
+        nodes (iterable): `(address, role)` of the Redis nodes that served the collection
+
+    """
+    rq_exporter_redis_node_info = GaugeMetricFamily(
+        'rq_exporter_redis_node_info', 'Redis nodes that served the last RQ data collection',
+        labels=['address', 'role']
+    )
+
+    for (address, role) in sorted(nodes):
+        rq_exporter_redis_node_info.add_metric([address, role], 1)
+
+    return rq_exporter_redis_node_info
+
+
+class StaticCollector(object):
+    """Collector returning already collected metric families.
+
+    Args:
+        metrics (list): Metric families
+
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def collect(self):
+        return self.metrics
+
+
+class _Flight(object):
+    """In-flight collection shared by concurrent requests."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.metrics = None
+        self.error = None
+        self.partial = False
+        self.finished_at = None
+
+    def reusable(self, reuse_window):
+        """Whether a new request can use the result of this collection."""
+        if not self.done.is_set():
+            return True
+
+        return (
+            self.error is None
+            and not self.partial
+            and time.monotonic() - self.finished_at < reuse_window
+        )
+
+
 class RQCollector(object):
     """RQ stats collector.
 
@@ -20,24 +463,177 @@ class RQCollector(object):
         connection (redis.Redis): Redis connection instance.
         worker_class (type): RQ Worker class
         queue_class (type): RQ Queue class
+        batch_size (int): Number of Redis commands per pipeline when collecting
+            the workers stats and jobs counts, `0` disables the batched collection.
+        poll_interval (float): Interval in seconds for collecting the metrics in a
+            background thread, `0` disables polling and the metrics are collected
+            on every request.
+        reuse_window (float): Seconds during which the result of a finished collection
+            is reused by new requests, concurrent requests always share the
+            in-flight collection.
+        summary (prometheus_client.Summary): Summary metric recording the collections,
+            defaults to a new `rq_request_processing_seconds` summary.
+        scan_limit (int): Maximum number of new finished job registry entries read
+            per collection for the job histograms, `0` disables the histograms.
+        started_limit (int): Maximum number of running jobs read per queue for the
+            running jobs histogram, `0` disables the started jobs metrics.
+        worker_aggregation (str): Workers aggregation mode, one of `WORKER_AGGREGATIONS`
+        worker_allowlist (list): Names of the workers kept in detail when aggregating
+        worker_top (int): Number of workers with the highest working time kept in
+            detail when aggregating
+        breaker_threshold (int): Number of consecutive failed collections after which
+            the collections are skipped, `0` disables the circuit breaker.
+        breaker_reset_timeout (float): Seconds during which the collections are skipped
+            before a trial collection is allowed.
+        serve_stale (bool): Serve the metrics of the last successful collection instead
+            of failing while the collections are skipped.
+        streaming (bool): Read the workers and queues sets using `SSCAN` in chunks of
+            `batch_size` (`1000` if not set) and build the metric families as the chunks
+            arrive instead of loading all the workers and queues stats in memory.
+        lua_script (bool): Collect the workers stats and the jobs counts in a single round trip
+            using a Lua script, the client side collection is used if scripting is not
+            available or with Redis Cluster.
+        queued_limit (int): Maximum number of jobs read from the head of each queue for the
+            queued jobs by function metric, `0` disables the metric.
+        queued_cache_size (int): Maximum number of job function names kept between collections
+        failed_scan_limit (int): Maximum number of new failed job registry entries read per
+            collection for the failed jobs by exception counters, `0` disables the counters.
+        scheduler_metrics (bool): Read the overdue scheduled jobs and the scheduler locks
+            with the job counts, only used with `batch_size` and the client side collection.
+        oldest_jobs (bool): Read the enqueue time of the job at the head of each queue in
+            pipelines of `batch_size` (`1000` if not set) commands.
 
     """
 
-    def __init__(self, connection=None, worker_class=None, queue_class=None):
+    def __init__(self, connection=None, worker_class=None, queue_class=None, batch_size=0,
+                 poll_interval=0, reuse_window=0, summary=None, scan_limit=0,
+                 started_limit=0, worker_aggregation='none', worker_allowlist=None,
+                 worker_top=0, breaker_threshold=0, breaker_reset_timeout=30, serve_stale=False,
+                 streaming=False, lua_script=False, queued_limit=0, queued_cache_size=10000,
+                 failed_scan_limit=0, scheduler_metrics=False, oldest_jobs=False):
         self.connection = connection
         self.worker_class = worker_class
         self.queue_class = queue_class
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.reuse_window = reuse_window
+        self.started_limit = started_limit
+        self.queued_limit = queued_limit
+        self.worker_aggregation = worker_aggregation
+        self.worker_allowlist = worker_allowlist
+        self.worker_top = worker_top
+        self.streaming = streaming
+        self.scheduler_metrics = scheduler_metrics
+        self.oldest_jobs = oldest_jobs
+
+        # Sentinel replicas connection pool recording the nodes serving the commands
+        pool = getattr(connection, 'connection_pool', None)
+        self.replica_pool = pool if isinstance(pool, ReplicaConnectionPool) else None
+
+        # Server side collection script, unset if scripting is not available
+        self.script = None
+
+        if lua_script and isinstance(connection, RedisCluster):
+            logger.warning('The Lua collection script is not supported with Redis Cluster')
+        elif lua_script:
+            self.script = CollectionScript(connection, worker_class, queue_class)
+
+        # Enqueue timestamps of the jobs at the head of the queues by job ID
+        self._oldest_jobs_cache = {}
+
+        # Start timestamps of the running jobs by job ID
+        self._started_jobs_cache = {}
+
+        # Function names of the queued jobs by job ID
+        self._queued_jobs_cache = LRUCache(queued_cache_size)
+
+        # Job duration histograms kept across collections
+        self.finished_jobs_scanner = FinishedJobsScanner(scan_limit) if scan_limit > 0 else None
+
+        # Failed jobs counters kept across collections
+        self.failed_jobs_scanner = FailedJobsScanner(failed_scan_limit) if failed_scan_limit > 0 else None
+
+        # Circuit breaker skipping the collections while Redis is unhealthy
+        self.breaker = CircuitBreaker(
+            breaker_threshold, breaker_reset_timeout
+        ) if breaker_threshold > 0 else None
+        self.serve_stale = serve_stale
+        self._last_metrics = None
+
+        # Deadline of the collections started by the current request thread
+        self._scrape = threading.local()
+
+        # Collection shared by concurrent requests
+        self._flight = None
+        self._flight_lock = threading.Lock()
+
+        # Latest snapshot collected by the polling thread
+        self.snapshot = Snapshot(metrics=(), timestamp=None, success=False)
+        self._poll_thread = None
+        self._stop_polling = threading.Event()
 
         # RQ data collection count and time in seconds
-        self.summary = Summary(
+        self.summary = summary if summary is not None else Summary(
             'rq_request_processing_seconds', 'Time spent collecting RQ data'
         )
 
+    def describe(self):
+        """Describe the RQ metrics without accessing Redis.
+
+        Note:
+            Called by the registry on registration instead of `collect`, the metric
+            families are built with the same functions as the collected metrics.
+
+        Returns:
+            list: Metric families of all the metrics that can be collected.
+
+        """
+        metrics = build_metrics([], {}, {} if self.oldest_jobs else None)
+
+        if self.finished_jobs_scanner is not None:
+            metrics.extend(self.finished_jobs_scanner.get_metrics())
+
+        if self.failed_jobs_scanner is not None:
+            metrics.extend(self.failed_jobs_scanner.get_metrics())
+
+        if self.scheduler_metrics and self.batch_size > 0 and not self.streaming:
+            metrics.extend(build_scheduler_metrics({}))
+
+        if self.started_limit > 0:
+            metrics.extend(build_started_jobs_metrics({}))
+
+        if self.queued_limit > 0:
+            metrics.extend(build_queued_jobs_metrics({}))
+
+        command_stats = getattr(self.connection, 'command_stats', None)
+
+        if isinstance(command_stats, CommandStats):
+            metrics.extend(command_stats.get_metrics())
+
+        metrics.append(build_partial_scrape_metric())
+
+        if self.replica_pool is not None:
+            metrics.append(build_redis_nodes_metric())
+
+        if self.poll_interval > 0:
+            metrics.extend(self.get_snapshot_status_metrics(Snapshot(metrics=(), timestamp=0, success=False)))
+
+        if self.breaker is not None:
+            metrics.append(build_circuit_open_metric())
+
+        return metrics
+
     def collect(self):
         """Collect RQ Metrics.
 
         Note:
-            This method will be called on registration and every time the metrics are requested.
+            This method will be called every time the metrics are requested, `describe`
+            is called on registration instead. When polling is enabled, the metrics of the latest snapshot are returned
+            without accessing Redis.
+            Requests arriving while a collection is running wait for its result
+            instead of starting a new one.
+            The collections started within a `deadline` block skip the phases
+            that can't start before the deadline.
 
         Yields:
             RQ metrics for workers and jobs.
@@ -46,55 +642,405 @@ class RQCollector(object):
             redis.exceptions.RedisError: On Redis connection errors
 
         """
+        if self.poll_interval > 0:
+            yield from self.get_snapshot_metrics()
+        else:
+            yield from self.collect_once()
+
+        yield from self.get_circuit_metrics()
+
+    @property
+    def circuit_open(self):
+        """Whether the circuit breaker is open, `None` if the circuit breaker is disabled."""
+        return self.breaker.is_open if self.breaker is not None else None
+
+    def get_circuit_metrics(self, circuit_open=None):
+        """Get the circuit breaker status metrics.
+
+        Args:
+            circuit_open (bool): Circuit state, defaults to the state of the collector circuit breaker
+
+        Returns:
+            list: The `rq_exporter_circuit_open` metric family, empty if the circuit breaker is disabled.
+
+        """
+        circuit_open = circuit_open if circuit_open is not None else self.circuit_open
+
+        return [build_circuit_open_metric(circuit_open)] if circuit_open is not None else []
+
+    @contextmanager
+    def deadline(self, timeout):
+        """Set the deadline of the collections started by the current thread in the block.
+
+        Args:
+            timeout (float): Seconds from now, `None` disables the deadline
+
+        """
+        previous = getattr(self._scrape, 'deadline', None)
+        self._scrape.deadline = time.monotonic() + timeout if timeout is not None else None
+
+        try:
+            yield
+        finally:
+            self._scrape.deadline = previous
+
+    def collect_once(self):
+        """Get the RQ metrics, sharing the collection with concurrent requests.
+
+        Returns:
+            tuple: RQ metric families for workers and jobs.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        with self._flight_lock:
+            flight = self._flight
+
+            if flight is not None and flight.reusable(self.reuse_window):
+                leader = False
+            else:
+                flight = self._flight = _Flight()
+                leader = True
+
+        if not leader:
+            logger.debug('Waiting for the in-flight RQ metrics collection')
+
+            flight.done.wait()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.metrics
+
         logger.debug('Collecting the RQ metrics...')
 
-        with self.summary.time():
-            rq_workers = GaugeMetricFamily(
-                'rq_workers', 'RQ workers',
-                labels=['name', 'state', 'queues'],
-            )
-            rq_workers_success = CounterMetricFamily(
-                'rq_workers_success', 'RQ workers success count',
-                labels=['name', 'queues'],
-            )
-            rq_workers_failed = CounterMetricFamily(
-                'rq_workers_failed', 'RQ workers fail count',
-                labels=['name', 'queues'],
-            )
-            rq_workers_working_time = CounterMetricFamily(
-                'rq_workers_working_time', 'RQ workers spent seconds',
-                labels=['name', 'queues'],
-            )
-            rq_jobs = GaugeMetricFamily(
-                'rq_jobs', 'RQ jobs by state',
-                labels=['queue', 'status'],
-            )
+        deadline = getattr(self._scrape, 'deadline', None)
+
+        try:
+            with self.summary.time():
+                flight.metrics = self.fetch_metrics(deadline)
+                flight.partial = deadline is not None and self._is_partial(flight.metrics)
+        except CircuitOpenError as exc:
+            if not self.serve_stale or self._last_metrics is None:
+                flight.error = exc
+                raise
+
+            logger.debug('Serving the metrics of the last successful collection')
+            flight.metrics = self._last_metrics
+        except Exception as exc:
+            flight.error = exc
+            raise
+        finally:
+            flight.finished_at = time.monotonic()
+            flight.done.set()
+
+        logger.debug('RQ metrics collection finished')
+
+        return flight.metrics
+
+    def fetch_metrics(self, deadline=None):
+        """Get the RQ metrics from Redis through the circuit breaker.
+
+        Args:
+            deadline (float): `time.monotonic` deadline of the collection
+
+        Returns:
+            tuple: RQ metric families for workers and jobs.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+            rq_exporter.breaker.CircuitOpenError: If the collection is skipped
+
+        """
+        if self.breaker is None:
+            return tuple(self.get_metrics(deadline))
+
+        self.breaker.before_call()
+
+        try:
+            metrics = tuple(self.get_metrics(deadline))
+        except BaseException:
+            # Any error ends the trial collection, or the circuit would stay open
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        self._last_metrics = metrics
+
+        return metrics
+
+    def get_metrics(self, deadline=None):
+        """Get the RQ metrics from Redis.
+
+        When a deadline is set, the collection phases starting after the
+        deadline are skipped and the `rq_exporter_partial_scrape` gauge
+        reports whether the metrics are incomplete.
+
+        Args:
+            deadline (float): `time.monotonic` deadline of the collection
 
-            workers = get_workers_stats(self.connection, self.worker_class)
-            for worker in workers:
-                label_queues = ','.join(worker['queues'])
-                rq_workers.add_metric(
-                    [worker['name'], worker['state'], label_queues], 1,
+        Returns:
+            list: RQ metric families for workers and jobs.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        skipped = []
+
+        if self.replica_pool is not None:
+            # Forget the nodes that served the commands sent before this collection
+            self.replica_pool.pop_served_nodes()
+
+        def run(phase, enabled=True):
+            """Whether a collection phase must be run."""
+            if not enabled:
+                return False
+
+            if deadline is not None and time.monotonic() >= deadline:
+                skipped.append(phase)
+                return False
+
+            return True
+
+        queues = None
+
+        def discovered_queues():
+            """Get the queues read by the collection phases, discovered once per collection."""
+            nonlocal queues
+
+            if queues is None:
+                queues = get_queues(self.connection, self.queue_class)
+
+            return queues
+
+        workers = []
+        jobs_by_queue = {}
+        scheduler_stats = None
+        scripted = None
+
+        # The streamed workers and queues are read while building the metric families
+        if run('workers'):
+            if self.script is not None:
+                scripted = self.run_script()
+
+            if scripted is not None:
+                workers, jobs_by_queue = scripted
+            elif self.streaming:
+                workers = iter_workers_stats(
+                    self.connection, self.worker_class, self.batch_size or DEFAULT_BATCH_SIZE
+                )
+            elif self.batch_size > 0:
+                workers = get_workers_stats_batched(
+                    self.connection, self.worker_class, self.batch_size
                 )
-                rq_workers_success.add_metric(
-                    [worker['name'], label_queues], worker['successful_job_count'],
+            else:
+                workers = get_workers_stats(self.connection, self.worker_class)
+
+        metrics = build_workers_metrics(aggregate_workers(
+            workers, self.worker_aggregation, self.worker_allowlist, self.worker_top
+        ))
+
+        if scripted is None and run('queues'):
+            if self.streaming:
+                jobs_by_queue = iter_jobs_by_queue(
+                    self.connection, self.queue_class, self.batch_size or DEFAULT_BATCH_SIZE
                 )
-                rq_workers_failed.add_metric(
-                    [worker['name'], label_queues], worker['failed_job_count'],
+            elif self.batch_size > 0:
+                scheduler_stats = {} if self.scheduler_metrics else None
+                jobs_by_queue = get_jobs_by_queue_batched(
+                    self.connection, self.queue_class, self.batch_size, scheduler_stats,
+                    queues=discovered_queues()
                 )
-                rq_workers_working_time.add_metric(
-                    [worker['name'], label_queues], worker['total_working_time'],
+            else:
+                jobs_by_queue = get_jobs_by_queue(
+                    self.connection, self.queue_class, queues=discovered_queues()
                 )
 
-            yield rq_workers
-            yield rq_workers_success
-            yield rq_workers_failed
-            yield rq_workers_working_time
+        metrics.extend(build_jobs_metrics(jobs_by_queue))
 
-            for (queue_name, jobs) in get_jobs_by_queue(self.connection, self.queue_class).items():
-                for (status, count) in jobs.items():
-                    rq_jobs.add_metric([queue_name, status], count)
+        if scheduler_stats is not None:
+            metrics.extend(build_scheduler_metrics(scheduler_stats))
 
-            yield rq_jobs
+        if run('oldest_jobs', self.oldest_jobs):
+            oldest_jobs = get_oldest_jobs_by_queue(
+                self.connection, self.queue_class, self.batch_size or DEFAULT_BATCH_SIZE,
+                self._oldest_jobs_cache, queues=discovered_queues()
+            )
+            metrics.extend(build_oldest_jobs_metrics(oldest_jobs))
 
-        logger.debug('RQ metrics collection finished')
+        if self.finished_jobs_scanner is not None:
+            # The histograms are kept across collections, only the scan is skipped
+            if run('finished_jobs'):
+                self.finished_jobs_scanner.scan(
+                    self.connection, self.queue_class, self.batch_size or DEFAULT_BATCH_SIZE,
+                    queues=discovered_queues()
+                )
+
+            metrics.extend(self.finished_jobs_scanner.get_metrics())
+
+        if self.failed_jobs_scanner is not None:
+            # The counters are kept across collections, only the scan is skipped
+            if run('failed_jobs'):
+                self.failed_jobs_scanner.scan(
+                    self.connection, self.queue_class, self.batch_size or DEFAULT_BATCH_SIZE,
+                    queues=discovered_queues()
+                )
+
+            metrics.extend(self.failed_jobs_scanner.get_metrics())
+
+        if run('started_jobs', self.started_limit > 0):
+            started_jobs = get_started_jobs_by_queue(
+                self.connection, self.queue_class, self.batch_size or DEFAULT_BATCH_SIZE,
+                self.started_limit, self._started_jobs_cache, queues=discovered_queues()
+            )
+            metrics.extend(build_started_jobs_metrics(started_jobs))
+
+        if run('queued_jobs', self.queued_limit > 0):
+            queued_jobs = get_queued_jobs_by_func(
+                self.connection, self.queue_class, self.batch_size or DEFAULT_BATCH_SIZE,
+                self.queued_limit, self._queued_jobs_cache, queues=discovered_queues()
+            )
+            metrics.extend(build_queued_jobs_metrics(queued_jobs))
+
+        if deadline is not None:
+            if skipped:
+                logger.warning(f'Scrape deadline exceeded, skipped the collection phases: {", ".join(skipped)}')
+
+            metrics.append(build_partial_scrape_metric(bool(skipped)))
+
+        if self.replica_pool is not None:
+            metrics.append(build_redis_nodes_metric(self.replica_pool.pop_served_nodes()))
+
+        command_stats = getattr(self.connection, 'command_stats', None)
+
+        if isinstance(command_stats, CommandStats):
+            command_stats.observe_phases()
+            metrics.extend(command_stats.get_metrics())
+
+        return metrics
+
+    def run_script(self):
+        """Collect the workers stats and the jobs counts using the Lua script.
+
+        The script is disabled if scripting is not available (e.g. disabled
+        command or missing ACL permission).
+
+        Returns:
+            tuple: `(workers, jobs_by_queue)`, `None` if the script is not available.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        try:
+            with command_phase(self.connection, 'script'):
+                return self.script()
+        except ResponseError as exc:
+            logger.warning(f'Lua scripting is not available, using the client side collection: {exc}')
+            self.script = None
+
+        return None
+
+    @staticmethod
+    def _is_partial(metrics):
+        """Whether the metrics of a collection are incomplete."""
+        return any(
+            metric.name == 'rq_exporter_partial_scrape' and metric.samples[0].value
+            for metric in metrics
+        )
+
+    def get_snapshot_metrics(self):
+        """Get the metrics of the latest snapshot.
+
+        Returns:
+            list: The snapshot RQ metric families and the snapshot status metrics.
+
+        """
+        snapshot = self.snapshot
+
+        return list(snapshot.metrics) + self.get_snapshot_status_metrics(snapshot)
+
+    def get_snapshot_status_metrics(self, snapshot=None):
+        """Get the status metrics of a snapshot.
+
+        Args:
+            snapshot (Snapshot): Snapshot, defaults to the latest snapshot
+
+        Returns:
+            list: The `rq_exporter_last_collection_success` and `rq_exporter_snapshot_age_seconds`
+                metric families.
+
+        """
+        snapshot = snapshot if snapshot is not None else self.snapshot
+
+        metrics = [GaugeMetricFamily(
+            'rq_exporter_last_collection_success',
+            'Whether the last RQ data collection succeeded',
+            value=int(snapshot.success),
+        )]
+
+        if snapshot.timestamp is not None:
+            metrics.append(GaugeMetricFamily(
+                'rq_exporter_snapshot_age_seconds',
+                'Seconds since the last successful RQ data collection',
+                value=time.time() - snapshot.timestamp,
+            ))
+
+        return metrics
+
+    def poll(self):
+        """Collect the RQ metrics and replace the current snapshot.
+
+        On errors the metrics of the previous snapshot are kept and the
+        snapshot is marked as failed.
+
+        Returns:
+            Snapshot: The new snapshot.
+
+        """
+        logger.debug('Polling the RQ metrics...')
+
+        try:
+            with self.summary.time():
+                metrics = self.fetch_metrics()
+        except CircuitOpenError:
+            logger.warning('Redis is unhealthy, skipping the RQ metrics collection')
+            self.snapshot = self.snapshot._replace(success=False)
+        except Exception:
+            logger.exception('There was an error collecting the RQ metrics')
+            self.snapshot = self.snapshot._replace(success=False)
+        else:
+            self.snapshot = Snapshot(metrics=metrics, timestamp=time.time(), success=True)
+
+        return self.snapshot
+
+    def start_polling(self):
+        """Start the background thread collecting the metrics every `poll_interval` seconds."""
+        if self._poll_thread is not None:
+            return
+
+        self._stop_polling.clear()
+        self._poll_thread = threading.Thread(
+            target=self._poll_loop, name='rq-exporter-poller', daemon=True
+        )
+        self._poll_thread.start()
+
+        logger.info(f'Polling the RQ metrics every {self.poll_interval} seconds')
+
+    def stop_polling(self):
+        """Stop the background polling thread."""
+        if self._poll_thread is None:
+            return
+
+        self._stop_polling.set()
+        self._poll_thread.join()
+        self._poll_thread = None
+
+    def _poll_loop(self):
+        """Poll the RQ metrics until `stop_polling` is called."""
+        while not self._stop_polling.is_set():
+            start = time.monotonic()
+            self.poll()
+            self._stop_polling.wait(max(0, self.poll_interval - (time.monotonic() - start)))
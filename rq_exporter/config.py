@@ -16,9 +16,46 @@ DEFAULT_REDIS_PORT = '6379'
 DEFAULT_SENTINEL_HOST = None
 DEFAULT_SENTINEL_PORT = '26379'
 DEFAULT_SENTINEL_MASTER = 'master'
+DEFAULT_SENTINEL_REPLICA = 'false'
+DEFAULT_SENTINEL_MAX_LAG = '0'
 DEFAULT_REDIS_DB = '0'
+DEFAULT_REDIS_CLUSTER = 'false'
 DEFAULT_REDIS_PASS = None
 DEFAULT_REDIS_PASS_FILE = None
+DEFAULT_REDIS_MAX_CONNECTIONS = '0'
+DEFAULT_REDIS_SOCKET_TIMEOUT = '0'
+DEFAULT_REDIS_CONNECT_TIMEOUT = '0'
+DEFAULT_REDIS_KEEPALIVE = 'false'
+DEFAULT_REDIS_HEALTH_CHECK_INTERVAL = '0'
+DEFAULT_REDIS_RETRIES = '0'
+DEFAULT_REDIS_RETRY_BACKOFF = '0.1'
+DEFAULT_BATCH_SIZE = '0'
+DEFAULT_STREAM_COLLECTION = 'false'
+DEFAULT_LUA_SCRIPT = 'false'
+DEFAULT_POLL_INTERVAL = '0'
+DEFAULT_REUSE_WINDOW = '0'
+DEFAULT_SCRAPE_TIMEOUT_OFFSET = '0.5'
+DEFAULT_PROBE = 'false'
+DEFAULT_PROBE_TARGETS = None
+DEFAULT_PROBE_CONCURRENCY = '8'
+DEFAULT_PROBE_MAX_TARGETS = '100'
+DEFAULT_ASYNC = 'false'
+DEFAULT_CACHE_EXPOSITION = 'false'
+DEFAULT_SHARED_SNAPSHOT = None
+DEFAULT_INSTRUMENT_REDIS = 'false'
+DEFAULT_SCAN_LIMIT = '0'
+DEFAULT_FAILED_SCAN_LIMIT = '0'
+DEFAULT_STARTED_LIMIT = '0'
+DEFAULT_QUEUED_LIMIT = '0'
+DEFAULT_QUEUED_CACHE_SIZE = '10000'
+DEFAULT_SCHEDULER_METRICS = 'false'
+DEFAULT_OLDEST_JOBS = 'false'
+DEFAULT_WORKER_AGGREGATION = 'none'
+DEFAULT_WORKER_ALLOWLIST = None
+DEFAULT_WORKER_TOP = '0'
+DEFAULT_BREAKER_THRESHOLD = '0'
+DEFAULT_BREAKER_RESET_TIMEOUT = '30'
+DEFAULT_BREAKER_SERVE_STALE = 'false'
 DEFAULT_LOG_LEVEL = 'INFO'
 DEFAULT_LOG_FORMAT = '[%(asctime)s] [%(name)s] [%(levelname)s]: %(message)s'
 DEFAULT_LOG_DATEFMT = '%Y-%m-%d %H:%M:%S'
@@ -30,6 +67,60 @@ RQ_QUEUE_CLASS = os.environ.get('RQ_QUEUE_CLASS', DEFAULT_QUEUE_CLASS)
 # Exporter config
 HOST = os.environ.get('RQ_EXPORTER_HOST', DEFAULT_HOST)
 PORT = os.environ.get('RQ_EXPORTER_PORT', DEFAULT_PORT)
+# Number of Redis commands per pipeline, 0 disables the batched collection
+BATCH_SIZE = os.environ.get('RQ_EXPORTER_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+# Read the workers and queues sets in chunks using SSCAN to bound the memory usage
+STREAM_COLLECTION = os.environ.get('RQ_EXPORTER_STREAM_COLLECTION', DEFAULT_STREAM_COLLECTION).lower() in ('1', 'true', 'yes')
+# Collect the workers and jobs counts in a single round trip using a Lua script
+LUA_SCRIPT = os.environ.get('RQ_EXPORTER_LUA_SCRIPT', DEFAULT_LUA_SCRIPT).lower() in ('1', 'true', 'yes')
+# Background polling interval in seconds, 0 collects the metrics on every request
+POLL_INTERVAL = os.environ.get('RQ_EXPORTER_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+# Seconds during which a finished collection is reused by new requests
+REUSE_WINDOW = os.environ.get('RQ_EXPORTER_REUSE_WINDOW', DEFAULT_REUSE_WINDOW)
+# Seconds subtracted from the X-Prometheus-Scrape-Timeout-Seconds header to get the collection deadline
+SCRAPE_TIMEOUT_OFFSET = os.environ.get('RQ_EXPORTER_SCRAPE_TIMEOUT_OFFSET', DEFAULT_SCRAPE_TIMEOUT_OFFSET)
+# Count the Redis commands, round trips and bytes by collection phase
+INSTRUMENT_REDIS = os.environ.get('RQ_EXPORTER_INSTRUMENT_REDIS', DEFAULT_INSTRUMENT_REDIS).lower() in ('1', 'true', 'yes')
+# Maximum number of new registry entries read per scrape, 0 disables the job histograms
+SCAN_LIMIT = os.environ.get('RQ_EXPORTER_SCAN_LIMIT', DEFAULT_SCAN_LIMIT)
+# Maximum number of new failed job registry entries read per scrape, 0 disables the failed jobs by exception counters
+FAILED_SCAN_LIMIT = os.environ.get('RQ_EXPORTER_FAILED_SCAN_LIMIT', DEFAULT_FAILED_SCAN_LIMIT)
+# Maximum number of running jobs read per queue, 0 disables the started jobs metrics
+STARTED_LIMIT = os.environ.get('RQ_EXPORTER_STARTED_LIMIT', DEFAULT_STARTED_LIMIT)
+# Maximum number of jobs read from the head of each queue, 0 disables the queued jobs by function metric
+QUEUED_LIMIT = os.environ.get('RQ_EXPORTER_QUEUED_LIMIT', DEFAULT_QUEUED_LIMIT)
+# Maximum number of job function names cached between collections
+QUEUED_CACHE_SIZE = os.environ.get('RQ_EXPORTER_QUEUED_CACHE_SIZE', DEFAULT_QUEUED_CACHE_SIZE)
+# Read the overdue scheduled jobs and the scheduler locks with the job counts
+SCHEDULER_METRICS = os.environ.get('RQ_EXPORTER_SCHEDULER_METRICS', DEFAULT_SCHEDULER_METRICS).lower() in ('1', 'true', 'yes')
+# Read the enqueue time of the job at the head of each queue
+OLDEST_JOBS = os.environ.get('RQ_EXPORTER_OLDEST_JOBS', DEFAULT_OLDEST_JOBS).lower() in ('1', 'true', 'yes')
+# Workers aggregation mode: none, queues (by queue set) or queue (by individual queue)
+WORKER_AGGREGATION = os.environ.get('RQ_EXPORTER_WORKER_AGGREGATION', DEFAULT_WORKER_AGGREGATION).lower()
+# Comma separated names of the workers kept in detail when aggregating
+WORKER_ALLOWLIST = os.environ.get('RQ_EXPORTER_WORKER_ALLOWLIST', DEFAULT_WORKER_ALLOWLIST)
+# Number of workers with the highest working time kept in detail when aggregating
+WORKER_TOP = os.environ.get('RQ_EXPORTER_WORKER_TOP', DEFAULT_WORKER_TOP)
+# Number of consecutive failed collections opening the circuit breaker, 0 disables it
+BREAKER_THRESHOLD = os.environ.get('RQ_EXPORTER_BREAKER_THRESHOLD', DEFAULT_BREAKER_THRESHOLD)
+# Seconds during which the collections are skipped when the circuit is open
+BREAKER_RESET_TIMEOUT = os.environ.get('RQ_EXPORTER_BREAKER_RESET_TIMEOUT', DEFAULT_BREAKER_RESET_TIMEOUT)
+# Serve the last successful collection instead of failing when the circuit is open
+BREAKER_SERVE_STALE = os.environ.get('RQ_EXPORTER_BREAKER_SERVE_STALE', DEFAULT_BREAKER_SERVE_STALE).lower() in ('1', 'true', 'yes')
+# Serve the multi-target probe on /probe
+PROBE = os.environ.get('RQ_EXPORTER_PROBE', DEFAULT_PROBE).lower() in ('1', 'true', 'yes')
+# Comma separated Redis URLs allowed to be probed, all the targets are allowed if not set
+PROBE_TARGETS = os.environ.get('RQ_EXPORTER_PROBE_TARGETS', DEFAULT_PROBE_TARGETS)
+# Maximum number of targets probed concurrently
+PROBE_CONCURRENCY = os.environ.get('RQ_EXPORTER_PROBE_CONCURRENCY', DEFAULT_PROBE_CONCURRENCY)
+# Maximum number of probe targets whose connection pool is kept
+PROBE_MAX_TARGETS = os.environ.get('RQ_EXPORTER_PROBE_MAX_TARGETS', DEFAULT_PROBE_MAX_TARGETS)
+# Serve the exporter using asyncio and redis.asyncio
+ASYNC = os.environ.get('RQ_EXPORTER_ASYNC', DEFAULT_ASYNC).lower() in ('1', 'true', 'yes')
+# Render the RQ metrics once per collection and serve the cached output
+CACHE_EXPOSITION = os.environ.get('RQ_EXPORTER_CACHE_EXPOSITION', DEFAULT_CACHE_EXPOSITION).lower() in ('1', 'true', 'yes')
+# Snapshot file shared by the WSGI server processes, a single process polls Redis
+SHARED_SNAPSHOT = os.environ.get('RQ_EXPORTER_SHARED_SNAPSHOT', DEFAULT_SHARED_SNAPSHOT)
 
 # Redis config
 REDIS_URL = os.environ.get('RQ_REDIS_URL', DEFAULT_REDIS_URL)
@@ -39,9 +130,21 @@ REDIS_PORT = os.environ.get('RQ_REDIS_PORT', DEFAULT_REDIS_PORT)
 REDIS_SENTINEL_HOST = os.environ.get('RQ_SENTINEL_HOST', DEFAULT_SENTINEL_HOST)
 REDIS_SENTINEL_PORT = os.environ.get('RQ_SENTINEL_PORT', DEFAULT_SENTINEL_PORT)
 REDIS_SENTINEL_MASTER = os.environ.get('RQ_SENTINEL_MASTER', DEFAULT_SENTINEL_MASTER)
+# Read from the Sentinel master replicas, replicas lagging more than N seconds are skipped (0 disables the check)
+REDIS_SENTINEL_REPLICA = os.environ.get('RQ_SENTINEL_REPLICA', DEFAULT_SENTINEL_REPLICA).lower() in ('1', 'true', 'yes')
+REDIS_SENTINEL_MAX_LAG = os.environ.get('RQ_SENTINEL_MAX_LAG', DEFAULT_SENTINEL_MAX_LAG)
 REDIS_DB = os.environ.get('RQ_REDIS_DB', DEFAULT_REDIS_DB)
+REDIS_CLUSTER = os.environ.get('RQ_REDIS_CLUSTER', DEFAULT_REDIS_CLUSTER).lower() in ('1', 'true', 'yes')
 REDIS_PASS = os.environ.get('RQ_REDIS_PASS', DEFAULT_REDIS_PASS)
 REDIS_PASS_FILE = os.environ.get('RQ_REDIS_PASS_FILE', DEFAULT_REDIS_PASS_FILE)
+# Connection pool options, 0 keeps the redis package default
+REDIS_MAX_CONNECTIONS = os.environ.get('RQ_REDIS_MAX_CONNECTIONS', DEFAULT_REDIS_MAX_CONNECTIONS)
+REDIS_SOCKET_TIMEOUT = os.environ.get('RQ_REDIS_SOCKET_TIMEOUT', DEFAULT_REDIS_SOCKET_TIMEOUT)
+REDIS_CONNECT_TIMEOUT = os.environ.get('RQ_REDIS_CONNECT_TIMEOUT', DEFAULT_REDIS_CONNECT_TIMEOUT)
+REDIS_KEEPALIVE = os.environ.get('RQ_REDIS_KEEPALIVE', DEFAULT_REDIS_KEEPALIVE).lower() in ('1', 'true', 'yes')
+REDIS_HEALTH_CHECK_INTERVAL = os.environ.get('RQ_REDIS_HEALTH_CHECK_INTERVAL', DEFAULT_REDIS_HEALTH_CHECK_INTERVAL)
+REDIS_RETRIES = os.environ.get('RQ_REDIS_RETRIES', DEFAULT_REDIS_RETRIES)
+REDIS_RETRY_BACKOFF = os.environ.get('RQ_REDIS_RETRY_BACKOFF', DEFAULT_REDIS_RETRY_BACKOFF)
 
 # Logging config
 LOG_LEVEL = os.environ.get('RQ_EXPORTER_LOG_LEVEL', DEFAULT_LOG_LEVEL).upper()
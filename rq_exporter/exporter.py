@@ -5,14 +5,21 @@ Register the RQ collector and create the WSGI application instance.
 
 """
 
+import socket
 import logging
+import threading
+from wsgiref.simple_server import make_server, WSGIRequestHandler
 
 from rq.utils import import_attribute
 from prometheus_client import make_wsgi_app
 from prometheus_client.core import REGISTRY
+from prometheus_client.exposition import ThreadingWSGIServer
 
 from .collector import RQCollector
-from .utils import get_redis_connection
+from .exposition import CachedExpositionApp
+from .instrumentation import instrument_connection
+from .probe import RQProbe, make_probe_app, parse_targets
+from .utils import get_redis_connection, get_connection_options, parse_list
 from . import config
 
 
@@ -26,6 +33,9 @@ def create_app():
     This function is suitable for use by WSGI servers like Gunicorn to load
     the WSGI application.
 
+    When `RQ_EXPORTER_SHARED_SNAPSHOT` is set, a single process polls Redis
+    and the metrics are served from the shared snapshot file by all the processes.
+
     Example:
         gunicorn "rq_exporter:create_app()"
 
@@ -46,6 +56,16 @@ def create_app():
 
     logger.debug('Registering the RQ collector...')
 
+    connection_options = get_connection_options(
+        max_connections = int(config.REDIS_MAX_CONNECTIONS),
+        socket_timeout = float(config.REDIS_SOCKET_TIMEOUT),
+        socket_connect_timeout = float(config.REDIS_CONNECT_TIMEOUT),
+        socket_keepalive = config.REDIS_KEEPALIVE,
+        health_check_interval = int(config.REDIS_HEALTH_CHECK_INTERVAL),
+        retries = int(config.REDIS_RETRIES),
+        retry_backoff = float(config.REDIS_RETRY_BACKOFF)
+    )
+
     connection = get_redis_connection(
         url = config.REDIS_URL,
         host = config.REDIS_HOST,
@@ -54,17 +74,164 @@ def create_app():
         sentinel=config.REDIS_SENTINEL_HOST,
         sentinel_port=config.REDIS_SENTINEL_PORT,
         sentinel_master=config.REDIS_SENTINEL_MASTER,
+        sentinel_replica = config.REDIS_SENTINEL_REPLICA,
+        sentinel_max_lag = float(config.REDIS_SENTINEL_MAX_LAG) or None,
         password = config.REDIS_PASS,
-        password_file = config.REDIS_PASS_FILE
+        password_file = config.REDIS_PASS_FILE,
+        cluster = config.REDIS_CLUSTER,
+        options = connection_options
     )
 
+    if config.INSTRUMENT_REDIS:
+        instrument_connection(connection)
+
     worker_class = import_attribute(config.RQ_WORKER_CLASS)
     queue_class = import_attribute(config.RQ_QUEUE_CLASS)
 
-    # Register the RQ collector
-    # The `collect` method is called on registration
-    REGISTRY.register(RQCollector(connection, worker_class, queue_class))
+    collector = RQCollector(
+        connection, worker_class, queue_class,
+        batch_size = int(config.BATCH_SIZE),
+        poll_interval = float(config.POLL_INTERVAL),
+        reuse_window = float(config.REUSE_WINDOW),
+        scan_limit = int(config.SCAN_LIMIT),
+        started_limit = int(config.STARTED_LIMIT),
+        worker_aggregation = config.WORKER_AGGREGATION,
+        worker_allowlist = parse_list(config.WORKER_ALLOWLIST or ''),
+        worker_top = int(config.WORKER_TOP),
+        breaker_threshold = int(config.BREAKER_THRESHOLD),
+        breaker_reset_timeout = float(config.BREAKER_RESET_TIMEOUT),
+        serve_stale = config.BREAKER_SERVE_STALE,
+        streaming = config.STREAM_COLLECTION,
+        lua_script = config.LUA_SCRIPT,
+        queued_limit = int(config.QUEUED_LIMIT),
+        queued_cache_size = int(config.QUEUED_CACHE_SIZE),
+        failed_scan_limit = int(config.FAILED_SCAN_LIMIT),
+        scheduler_metrics = config.SCHEDULER_METRICS,
+        oldest_jobs = config.OLDEST_JOBS
+    )
+
+    if config.SHARED_SNAPSHOT:
+        from .shared import SharedSnapshot, SharedSnapshotApp, SharedSnapshotPoller, DEFAULT_SHARED_POLL_INTERVAL
+
+        # A single process polls Redis, the collector is not registered
+        shared = SharedSnapshot(config.SHARED_SNAPSHOT)
+        poller = SharedSnapshotPoller(
+            collector, shared, collector.poll_interval or DEFAULT_SHARED_POLL_INTERVAL
+        )
+        poller.start()
+
+        logger.debug('RQ shared snapshot poller started')
+
+        app = SharedSnapshotApp(collector, shared)
+    else:
+        # The collector is served by the cached exposition app instead of the registry
+        if not config.CACHE_EXPOSITION:
+            # Register the RQ collector
+            # The `describe` method is called on registration, Redis is not accessed
+            REGISTRY.register(collector)
+
+        if collector.poll_interval > 0:
+            collector.start_polling()
+
+        logger.debug('RQ collector registered')
+
+        app = CachedExpositionApp(collector) if config.CACHE_EXPOSITION else make_wsgi_app()
+        app = make_deadline_app(app, collector, float(config.SCRAPE_TIMEOUT_OFFSET))
+
+    if config.PROBE:
+        probe = RQProbe(
+            worker_class, queue_class,
+            batch_size = int(config.BATCH_SIZE),
+            targets = parse_targets(config.PROBE_TARGETS or ''),
+            max_workers = int(config.PROBE_CONCURRENCY),
+            connection_options = connection_options,
+            max_targets = int(config.PROBE_MAX_TARGETS),
+            oldest_jobs = config.OLDEST_JOBS
+        )
+
+        app = make_probe_app(app, probe)
+
+    return app
+
+
+def get_scrape_timeout(environ, offset=0):
+    """Get the scrape timeout of a Prometheus request.
+
+    Args:
+        environ (dict): WSGI environ
+        offset (float): Seconds subtracted from the timeout to send the response in time,
+            ignored if greater than the timeout
+
+    Returns:
+        float: The `X-Prometheus-Scrape-Timeout-Seconds` header value minus the offset,
+            `None` if the header is missing or invalid.
+
+    """
+    value = environ.get('HTTP_X_PROMETHEUS_SCRAPE_TIMEOUT_SECONDS')
+
+    if not value:
+        return None
+
+    try:
+        timeout = float(value)
+    except ValueError:
+        logger.debug(f'Invalid scrape timeout header: {value}')
+        return None
+
+    if timeout <= 0:
+        return None
+
+    return timeout - offset if timeout > offset else timeout
+
+
+def make_deadline_app(app, collector, offset=0):
+    """Collect the RQ metrics within the Prometheus scrape timeout.
+
+    The collections started by the requests with a `X-Prometheus-Scrape-Timeout-Seconds`
+    header skip the phases that can't start before the timeout.
+
+    Args:
+        app (function): WSGI application serving the exporter metrics
+        collector (rq_exporter.collector.RQCollector): RQ metrics collector
+        offset (float): Seconds subtracted from the scrape timeout
+
+    Returns:
+        function: WSGI application function.
+
+    """
+    def deadline_app(environ, start_response):
+        with collector.deadline(get_scrape_timeout(environ, offset)):
+            return app(environ, start_response)
+
+    return deadline_app
+
+
+class _SilentHandler(WSGIRequestHandler):
+    """WSGI request handler that does not log the requests."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_wsgi_server(app, port, host='0.0.0.0'):
+    """Serve a WSGI application in a daemon thread.
+
+    Args:
+        app (function): WSGI application function
+        port (int): Port number
+        host (str): Hostname or IP address
+
+    Returns:
+        wsgiref.simple_server.WSGIServer: The WSGI server instance.
+
+    """
+    class Server(ThreadingWSGIServer):
+        # Support IPv6 addresses
+        address_family = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][0]
+
+    httpd = make_server(host, port, app, Server, handler_class=_SilentHandler)
 
-    logger.debug('RQ collector registered')
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
 
-    return make_wsgi_app()
+    return httpd
@@ -0,0 +1,200 @@
+"""
+RQ exporter cached exposition.
+
+Render the RQ metrics once per collection and serve the cached plain and
+gzip encoded output with an `ETag`.
+
+"""
+
+import zlib
+import hashlib
+import logging
+import threading
+
+from prometheus_client.core import REGISTRY, CollectorRegistry
+from prometheus_client.exposition import choose_encoder, gzip_accepted
+
+from .collector import StaticCollector, VOLATILE_METRICS
+
+
+logger = logging.getLogger(__name__)
+
+
+# OpenMetrics end of exposition marker
+OPENMETRICS_EOF = b'# EOF\n'
+
+
+def render(metrics, encoder):
+    """Render metric families using an exposition format encoder.
+
+    Args:
+        metrics (list): Metric families
+        encoder (function): Encoder returned by `prometheus_client.exposition.choose_encoder`
+
+    Returns:
+        bytes: The rendered metrics without the OpenMetrics `# EOF` marker.
+
+    """
+    registry = CollectorRegistry(auto_describe=False)
+    registry.register(StaticCollector(metrics))
+
+    output = encoder(registry)
+
+    if output.endswith(OPENMETRICS_EOF):
+        output = output[:-len(OPENMETRICS_EOF)]
+
+    return output
+
+
+def parse_if_none_match(value):
+    """Parse the entity tags of an `If-None-Match` header.
+
+    Args:
+        value (str): `If-None-Match` header value
+
+    Returns:
+        set: The entity tags without the weak validator prefix.
+
+    """
+    return {
+        tag.strip()[2:] if tag.strip().startswith('W/') else tag.strip()
+        for tag in value.split(',') if tag.strip()
+    }
+
+
+class _Rendered(object):
+    """Cached rendering of the RQ metrics of a collection in one exposition format."""
+
+    def __init__(self, metrics, encoder, terminated):
+        self.metrics = metrics
+        self.terminated = terminated
+
+        stable = [metric for metric in metrics if metric.name not in VOLATILE_METRICS]
+        volatile = [metric for metric in metrics if metric.name in VOLATILE_METRICS]
+
+        # The tag is only computed from the stable metrics so it doesn't change while the RQ data don't
+        stable_body = render(stable, encoder)
+
+        self.body = stable_body + render(volatile, encoder) if volatile else stable_body
+        self.etag = hashlib.sha256(stable_body).hexdigest()[:32]
+
+        # The compressor state is kept to append the uncached metrics to the gzip output
+        self.compressor = zlib.compressobj(wbits=31)
+        self.gzip_body = self.compressor.compress(self.body) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def get_body(self, extra, gzip=False):
+        """Get the response body with the `extra` output appended."""
+        if self.terminated:
+            extra += OPENMETRICS_EOF
+
+        if not gzip:
+            return self.body + extra
+
+        compressor = self.compressor.copy()
+
+        return self.gzip_body + compressor.compress(extra) + compressor.flush()
+
+
+class CachedExpositionApp(object):
+    """WSGI application serving the RQ metrics from a cache.
+
+    The RQ metrics are rendered and compressed once per collection, the
+    requests served from the same collection only render the metrics of the
+    `registry` (e.g. the process metrics) which are appended to the cached output.
+
+    The `ETag` of the response only depends on the RQ metrics, requests with a
+    matching `If-None-Match` header get a `304 Not Modified` response. The `ETag`
+    is a weak validator, the metrics of the `registry` and the metric families
+    changing on every collection (`VOLATILE_METRICS`, e.g. the ages relative to
+    the collection time) are not part of the tag.
+
+    Note:
+        The collector must not be registered in the `registry`.
+
+    Args:
+        collector (rq_exporter.collector.RQCollector): RQ metrics collector
+        registry (prometheus_client.core.CollectorRegistry): Registry of the other metrics
+
+    """
+
+    def __init__(self, collector, registry=REGISTRY):
+        self.collector = collector
+        self.registry = registry
+
+        # Content type => _Rendered
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get_metrics(self):
+        """Get the RQ metrics of the current collection and the uncached status metrics.
+
+        Returns:
+            tuple: `(metrics, status)` the RQ metric families of the collection and
+                the metric families rendered on every request.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        if self.collector.poll_interval > 0:
+            snapshot = self.collector.snapshot
+            metrics, status = snapshot.metrics, self.collector.get_snapshot_status_metrics(snapshot)
+        else:
+            metrics, status = self.collector.collect_once(), []
+
+        # The circuit state changes without a new collection
+        return metrics, status + self.collector.get_circuit_metrics()
+
+    def get_rendered(self, metrics, encoder, content_type):
+        """Get the cached rendering of the collection metrics, rendering them if needed."""
+        with self._lock:
+            rendered = self._cache.get(content_type)
+
+            # The metrics tuple is replaced on each collection
+            if rendered is None or rendered.metrics is not metrics:
+                logger.debug(f'Rendering the RQ metrics as {content_type}')
+
+                rendered = self._cache[content_type] = _Rendered(
+                    metrics, encoder, terminated=content_type.startswith('application/openmetrics-text')
+                )
+
+            return rendered
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == '/favicon.ico':
+            start_response('200 OK', [])
+            return [b'']
+
+        encoder, content_type = choose_encoder(environ.get('HTTP_ACCEPT'))
+        use_gzip = gzip_accepted(environ.get('HTTP_ACCEPT_ENCODING', ''))
+
+        metrics, status = self.get_metrics()
+        rendered = self.get_rendered(metrics, encoder, content_type)
+
+        # Weak validator, the registry metrics are not part of the tag
+        tag = f'"{rendered.etag}-gzip"' if use_gzip else f'"{rendered.etag}"'
+        etag = f'W/{tag}'
+
+        headers = [
+            ('Content-Type', content_type),
+            ('ETag', etag),
+            ('Vary', 'Accept, Accept-Encoding'),
+        ]
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+
+        if if_none_match and (
+            if_none_match.strip() == '*' or tag in parse_if_none_match(if_none_match)
+        ):
+            start_response('304 Not Modified', headers)
+            return [b'']
+
+        body = rendered.get_body(render(list(self.registry.collect()) + status, encoder), use_gzip)
+
+        if use_gzip:
+            headers.append(('Content-Encoding', 'gzip'))
+
+        headers.append(('Content-Length', str(len(body))))
+
+        start_response('200 OK', headers)
+        return [body]
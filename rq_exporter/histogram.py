@@ -0,0 +1,68 @@
+"""
+Histograms kept across collections.
+
+"""
+
+import math
+
+from prometheus_client.core import HistogramMetricFamily
+from prometheus_client.utils import floatToGoString
+
+
+# Default histogram buckets in seconds
+DEFAULT_BUCKETS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, math.inf
+)
+
+
+class CumulativeHistogram(object):
+    """Histogram kept across scrapes by label values.
+
+    Args:
+        name (str): Metric name
+        documentation (str): Metric description
+        labels (list): Label names
+        buckets (tuple): Bucket upper bounds, the last one must be `math.inf`
+
+    """
+
+    def __init__(self, name, documentation, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+
+        # Label values => [bucket counts, sum]
+        self._values = {}
+
+    def observe(self, label_values, value):
+        """Record an observation."""
+        counts, total = self._values.get(label_values, ([0] * len(self.buckets), 0))
+
+        for (i, bound) in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+
+        self._values[label_values] = (counts, total + value)
+
+    def to_metric_family(self):
+        """Get the histogram metric family.
+
+        Returns:
+            prometheus_client.core.HistogramMetricFamily: Histogram with cumulative bucket counts.
+
+        """
+        metric = HistogramMetricFamily(self.name, self.documentation, labels=self.labels)
+
+        for (label_values, (counts, total)) in self._values.items():
+            buckets = []
+            cumulative = 0
+
+            for (bound, count) in zip(self.buckets, counts):
+                cumulative += count
+                buckets.append((floatToGoString(bound), cumulative))
+
+            metric.add_metric(list(label_values), buckets, total)
+
+        return metric
@@ -0,0 +1,261 @@
+"""
+Redis command accounting.
+
+Count the commands, round trips and bytes exchanged with Redis and the time
+spent in each phase of the RQ metrics collection.
+
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+from prometheus_client.core import CounterMetricFamily
+from redis.cluster import RedisCluster
+
+from .histogram import CumulativeHistogram
+
+
+# Phase duration histogram buckets in seconds
+PHASE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf')
+)
+
+# Phase of the commands sent outside of a collection phase
+DEFAULT_PHASE = 'other'
+
+
+class CommandStats(object):
+    """Redis commands stats by collection phase.
+
+    Note:
+        The current phase is shared by all the threads using the connection,
+        the collections of an `RQCollector` are never executed concurrently.
+
+    """
+
+    def __init__(self):
+        self.current_phase = DEFAULT_PHASE
+
+        # Phase => [commands, round trips, bytes sent, bytes received]
+        self._counts = {}
+        self._lock = threading.Lock()
+
+        # Phase => time spent in the phase during the current collection
+        self._pending = {}
+
+        self.durations = CumulativeHistogram(
+            'rq_exporter_phase_duration_seconds', 'Time spent in each RQ data collection phase',
+            labels=['phase'], buckets=PHASE_BUCKETS,
+        )
+
+    def add(self, commands=0, round_trips=0, sent=0, received=0):
+        """Add to the counts of the current phase."""
+        with self._lock:
+            counts = self._counts.setdefault(self.current_phase, [0, 0, 0, 0])
+            counts[0] += commands
+            counts[1] += round_trips
+            counts[2] += sent
+            counts[3] += received
+
+    @contextmanager
+    def phase(self, name):
+        """Record the commands sent and the time spent in the block under the phase `name`."""
+        previous = self.current_phase
+        self.current_phase = name
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.current_phase = previous
+
+            with self._lock:
+                self._pending[name] = self._pending.get(name, 0) + duration
+
+    def observe_phases(self):
+        """Observe the time spent in each phase since the last call in the duration histogram.
+
+        Note:
+            Called at the end of each collection, a phase can be entered multiple
+            times during a collection.
+
+        """
+        with self._lock:
+            for (name, duration) in self._pending.items():
+                self.durations.observe((name,), duration)
+
+            self._pending.clear()
+
+    def get_counts(self):
+        """Get the counts of all the phases.
+
+        Returns:
+            dict: `(commands, round trips, bytes sent, bytes received)` tuple by phase
+
+        """
+        with self._lock:
+            return {phase: tuple(counts) for (phase, counts) in self._counts.items()}
+
+    def get_metrics(self):
+        """Get the Redis commands stats metric families.
+
+        Returns:
+            list: The commands, round trips and bytes counters and the phase duration histogram.
+
+        """
+        rq_exporter_redis_commands = CounterMetricFamily(
+            'rq_exporter_redis_commands', 'Redis commands sent by collection phase',
+            labels=['phase'],
+        )
+        rq_exporter_redis_round_trips = CounterMetricFamily(
+            'rq_exporter_redis_round_trips', 'Redis round trips by collection phase',
+            labels=['phase'],
+        )
+        rq_exporter_redis_sent_bytes = CounterMetricFamily(
+            'rq_exporter_redis_sent_bytes', 'Bytes sent to Redis by collection phase',
+            labels=['phase'],
+        )
+        rq_exporter_redis_received_bytes = CounterMetricFamily(
+            'rq_exporter_redis_received_bytes', 'Bytes received from Redis by collection phase',
+            labels=['phase'],
+        )
+
+        with self._lock:
+            for (phase, (commands, round_trips, sent, received)) in self._counts.items():
+                rq_exporter_redis_commands.add_metric([phase], commands)
+                rq_exporter_redis_round_trips.add_metric([phase], round_trips)
+                rq_exporter_redis_sent_bytes.add_metric([phase], sent)
+                rq_exporter_redis_received_bytes.add_metric([phase], received)
+
+            durations = self.durations.to_metric_family()
+
+        return [
+            rq_exporter_redis_commands, rq_exporter_redis_round_trips,
+            rq_exporter_redis_sent_bytes, rq_exporter_redis_received_bytes, durations
+        ]
+
+
+class _CountingSocket(object):
+    """Socket wrapper counting the received bytes."""
+
+    def __init__(self, sock, stats):
+        self._sock = sock
+        self._stats = stats
+
+    def recv(self, *args, **kwargs):
+        data = self._sock.recv(*args, **kwargs)
+        self._stats.add(received=len(data))
+        return data
+
+    def recv_into(self, *args, **kwargs):
+        size = self._sock.recv_into(*args, **kwargs)
+        self._stats.add(received=size)
+        return size
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+
+class InstrumentedConnectionMixin(object):
+    """Redis connection mixin recording the commands in `command_stats`."""
+
+    # CommandStats instance set on the instrumented connection classes
+    command_stats = None
+
+    def _connect(self):
+        return _CountingSocket(super()._connect(), self.command_stats)
+
+    def send_command(self, *args, **kwargs):
+        self.command_stats.add(commands=1)
+        return super().send_command(*args, **kwargs)
+
+    def pack_commands(self, commands):
+        commands = list(commands)
+        self.command_stats.add(commands=len(commands))
+        return super().pack_commands(commands)
+
+    def send_packed_command(self, command, check_health=True):
+        items = [command] if isinstance(command, str) else command
+        self.command_stats.add(
+            round_trips=1,
+            sent=sum(len(item.encode() if isinstance(item, str) else item) for item in items)
+        )
+        return super().send_packed_command(command, check_health)
+
+
+def instrument_connection_pool(pool, stats):
+    """Make the connection pool create connections recording the commands in `stats`.
+
+    Note:
+        The connections already created by the pool are disconnected and discarded.
+
+    Args:
+        pool (redis.ConnectionPool): Redis connection pool
+        stats (CommandStats): Commands stats
+
+    """
+    connection_class = pool.connection_class
+
+    if not issubclass(connection_class, InstrumentedConnectionMixin):
+        pool.connection_class = type(
+            f'Instrumented{connection_class.__name__}',
+            (InstrumentedConnectionMixin, connection_class),
+            {'command_stats': stats}
+        )
+
+    pool.disconnect()
+    pool.reset()
+
+
+def instrument_connection(connection):
+    """Record the commands sent using a Redis connection.
+
+    The stats are available in the `command_stats` attribute of the connection
+    and the collection phases are recorded using `command_phase`.
+
+    Note:
+        Only the nodes known when this function is called are instrumented
+        for Redis Cluster connections.
+
+    Args:
+        connection (redis.Redis, redis.cluster.RedisCluster): Redis connection instance.
+
+    Returns:
+        CommandStats: The commands stats of the connection.
+
+    """
+    stats = CommandStats()
+
+    if isinstance(connection, RedisCluster):
+        for node in connection.get_nodes():
+            if node.redis_connection is not None:
+                instrument_connection_pool(node.redis_connection.connection_pool, stats)
+    else:
+        instrument_connection_pool(connection.connection_pool, stats)
+
+    connection.command_stats = stats
+
+    return stats
+
+
+@contextmanager
+def command_phase(connection, name):
+    """Record the Redis commands sent in the block under the collection phase `name`.
+
+    Does nothing if the connection is not instrumented using `instrument_connection`.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        name (str): Phase name
+
+    """
+    stats = getattr(connection, 'command_stats', None)
+
+    if not isinstance(stats, CommandStats):
+        yield
+        return
+
+    with stats.phase(name):
+        yield
@@ -0,0 +1,263 @@
+"""
+RQ exporter multi-target probe.
+
+Collect the RQ metrics of any Redis server using `/probe?target=<redis-url>`.
+
+"""
+
+import time
+import logging
+import threading
+from urllib.parse import parse_qs, urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Summary, make_wsgi_app
+from prometheus_client.core import CollectorRegistry, GaugeMetricFamily, Metric
+from redis.exceptions import RedisError
+
+from .collector import RQCollector, StaticCollector
+from .utils import get_redis_connection, parse_list, LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_targets(targets):
+    """Parse a comma separated list of Redis URLs.
+
+    Args:
+        targets (str): Comma separated Redis URLs
+
+    Returns:
+        list: List of Redis URLs.
+
+    """
+    return parse_list(targets)
+
+
+def get_target_label(target):
+    """Get the `target` label value of a Redis URL without the credentials.
+
+    Args:
+        target (str): Redis URL
+
+    Returns:
+        str: Redis URL without the username and password.
+
+    """
+    parts = urlsplit(target)
+
+    if parts.hostname is None:
+        return target
+
+    netloc = parts.hostname if parts.port is None else f'{parts.hostname}:{parts.port}'
+
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def add_target_label(metrics, target):
+    """Add the `target` label to the samples of the metric families.
+
+    Args:
+        metrics (list): Metric families
+        target (str): `target` label value
+
+    Returns:
+        list: New metric families with the `target` label.
+
+    """
+    labeled = []
+
+    for family in metrics:
+        metric = Metric(family.name, family.documentation, family.type, family.unit)
+        metric.samples = [
+            sample._replace(labels={**sample.labels, 'target': target})
+            for sample in family.samples
+        ]
+        labeled.append(metric)
+
+    return labeled
+
+
+def build_probe_metrics(target, success, duration):
+    """Build the probe status metric families.
+
+    Args:
+        target (str): `target` label value
+        success (int): `1` if the probe succeeded, `0` otherwise
+        duration (float): Probe duration in seconds
+
+    Returns:
+        list: The `rq_probe_success` and `rq_probe_duration_seconds` metric families.
+
+    """
+    rq_probe_success = GaugeMetricFamily(
+        'rq_probe_success', 'Whether the probe of the target succeeded',
+        labels=['target'],
+    )
+    rq_probe_success.add_metric([target], success)
+
+    rq_probe_duration = GaugeMetricFamily(
+        'rq_probe_duration_seconds', 'Time spent probing the target',
+        labels=['target'],
+    )
+    rq_probe_duration.add_metric([target], duration)
+
+    return [rq_probe_success, rq_probe_duration]
+
+
+class RQProbe(object):
+    """WSGI application collecting the RQ metrics of the requested target.
+
+    A Redis connection pool and an `RQCollector` are kept for the `max_targets`
+    most recently probed targets, the connection pools of the other targets are
+    disconnected. The collections are executed in a thread pool of `max_workers` threads.
+
+    Args:
+        worker_class (type): RQ Worker class
+        queue_class (type): RQ Queue class
+        batch_size (int): Number of Redis commands per pipeline, `0` disables batching
+        targets (list): Allowed Redis URLs, all the targets are allowed if empty
+        max_workers (int): Maximum number of targets collected concurrently
+        connection_options (dict): Connection pool options of the targets returned by
+            `get_connection_options`
+        max_targets (int): Maximum number of targets whose collector is kept
+        oldest_jobs (bool): Read the enqueue time of the job at the head of each queue
+
+    """
+
+    def __init__(self, worker_class=None, queue_class=None, batch_size=0, targets=None,
+                 max_workers=8, connection_options=None, max_targets=100, oldest_jobs=False):
+        self.worker_class = worker_class
+        self.queue_class = queue_class
+        self.batch_size = batch_size
+        self.oldest_jobs = oldest_jobs
+        self.targets = set(targets or [])
+        self.connection_options = connection_options
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='rq-exporter-probe'
+        )
+
+        self._collectors = LRUCache(max_targets)
+        self._collectors_lock = threading.Lock()
+
+        # Probe collection count and time in seconds by target
+        self.summary = Summary(
+            'rq_probe_processing_seconds', 'Time spent collecting RQ data of probe targets',
+            labelnames=['target'],
+        )
+
+    def is_allowed(self, target):
+        """Whether the target is allowed to be probed."""
+        return not self.targets or target in self.targets
+
+    def get_collector(self, target):
+        """Get the `RQCollector` of a target, created on first use.
+
+        Args:
+            target (str): Redis URL
+
+        Returns:
+            RQCollector: Collector using a connection pool to the target.
+
+        """
+        with self._collectors_lock:
+            collector = self._collectors.get(target)
+
+            if collector is None:
+                collector = RQCollector(
+                    get_redis_connection(url=target, options=self.connection_options),
+                    self.worker_class,
+                    self.queue_class,
+                    batch_size=self.batch_size,
+                    oldest_jobs=self.oldest_jobs,
+                    summary=self.summary.labels(get_target_label(target)),
+                )
+
+                for (evicted_target, evicted) in self._collectors.set(target, collector):
+                    self.close_collector(evicted_target, evicted)
+
+            return collector
+
+    def close_collector(self, target, collector):
+        """Disconnect the connection pool of a target no longer kept.
+
+        Note:
+            A collection of the target still running fails with a connection error.
+
+        Args:
+            target (str): Redis URL
+            collector (RQCollector): Collector of the target
+
+        """
+        logger.debug(f'Closing the connection pool of the target {get_target_label(target)}')
+
+        try:
+            self.summary.remove(get_target_label(target))
+        except KeyError:
+            # Another target URL with the same label was removed
+            pass
+
+        collector.connection.close()
+
+    def probe(self, target):
+        """Collect the RQ metrics of a target.
+
+        Args:
+            target (str): Redis URL
+
+        Returns:
+            list: The target metric families with the `target` label and the probe metrics.
+
+        """
+        label = get_target_label(target)
+        start = time.perf_counter()
+
+        try:
+            future = self.executor.submit(self.get_collector(target).collect_once)
+            metrics = add_target_label(future.result(), label)
+            success = 1
+        except (RedisError, ValueError):
+            logger.exception(f'There was an error probing the target {label}')
+            metrics = []
+            success = 0
+
+        return metrics + build_probe_metrics(label, success, time.perf_counter() - start)
+
+    def __call__(self, environ, start_response):
+        params = parse_qs(environ.get('QUERY_STRING', ''))
+        target = params.get('target', [None])[0]
+
+        if not target:
+            start_response('400 Bad Request', [('Content-Type', 'text/plain')])
+            return [b'The "target" parameter is required\n']
+
+        if not self.is_allowed(target):
+            start_response('403 Forbidden', [('Content-Type', 'text/plain')])
+            return [b'The target is not allowed\n']
+
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(StaticCollector(self.probe(target)))
+
+        return make_wsgi_app(registry)(environ, start_response)
+
+
+def make_probe_app(app, probe):
+    """Serve the probe on `/probe` and the other requests using `app`.
+
+    Args:
+        app (function): WSGI application serving the exporter metrics
+        probe (RQProbe): Probe WSGI application
+
+    Returns:
+        function: WSGI application function.
+
+    """
+    def probe_app(environ, start_response):
+        if environ.get('PATH_INFO') == '/probe':
+            return probe(environ, start_response)
+
+        return app(environ, start_response)
+
+    return probe_app
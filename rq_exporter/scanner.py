@@ -0,0 +1,492 @@
+"""
+Incremental RQ job registry scanners.
+
+The scanners keep a score watermark for each queue registry and only read
+the registry entries added since the previous scan.
+
+The registry scores are expiration times (the time the job finished or
+failed plus its result or failure TTL), not completion times. A job finishing
+after the entries already read but with a shorter TTL gets a score below the
+watermark. The last `window_size` entries processed for each queue are kept
+and the scores between the oldest of them and the watermark are read again,
+the entries that were not processed yet (late entries) are processed. A late
+entry is still missed when its score is below the whole window, e.g. a job
+with a much shorter TTL than the others while many jobs finish.
+
+"""
+
+import re
+import math
+import zlib
+import binascii
+import threading
+from base64 import b64decode
+from itertools import chain, zip_longest
+
+from prometheus_client.core import CounterMetricFamily
+from rq.results import Result
+from rq.utils import as_text
+
+from .histogram import CumulativeHistogram, DEFAULT_BUCKETS
+from .instrumentation import command_phase
+from .utils import execute_pipelined, get_queues, parse_timestamp, parse_func_name, LRUCache
+
+
+# Exception class name at the start of the last line of a traceback, e.g. `myapp.errors.RetryError`
+EXC_TYPE_PATTERN = re.compile(r'^([A-Za-z_][\w.]*)(?::|$)')
+
+# Label value of the failures without a function name or an exception class
+UNKNOWN = 'unknown'
+
+# Number of processed entries kept below the watermark of each queue to find the late entries
+DEFAULT_WINDOW_SIZE = 100
+
+
+def parse_exc_type(exc_string):
+    """Get the exception class name from a formatted traceback.
+
+    Args:
+        exc_string (str): Traceback formatted by RQ
+
+    Returns:
+        str: Exception class name, `None` if the last line is not an exception
+            (e.g. the work horse was killed).
+
+    """
+    lines = [line for line in (exc_string or '').splitlines() if line.strip()]
+
+    if not lines:
+        return None
+
+    match = EXC_TYPE_PATTERN.match(lines[-1].strip())
+
+    return match.group(1) if match else None
+
+
+def decompress_exc_string(value, encoded=False):
+    """Decompress an exception string saved by RQ.
+
+    Args:
+        value (bytes, str): Compressed exception string
+        encoded (bool): Whether the value is base64 encoded (job results)
+
+    Returns:
+        str: The exception string, the value as is if it's not compressed.
+
+    """
+    if not value:
+        return None
+
+    try:
+        data = b64decode(value) if encoded else value
+        return as_text(zlib.decompress(data))
+    except (zlib.error, binascii.Error, TypeError):
+        return as_text(value)
+
+
+class RegistryScanner(object):
+    """Read the new entries of a job registry of each queue.
+
+    Subclasses must set `fields`, the job hash fields to read, and
+    implement `get_registry` and `process`. Subclasses reading other
+    keys override `get_commands`.
+
+    Args:
+        max_entries (int): Maximum number of new entries read per scan for all the queues
+        window_size (int): Number of processed entries kept below the watermark of each
+            queue to find the late entries, `0` disables the late entries
+
+    """
+
+    # Job hash fields read for each new entry
+    fields = ()
+
+    # Collection phase of the scan commands
+    phase = 'registry_scan'
+
+    def __init__(self, max_entries=1000, window_size=DEFAULT_WINDOW_SIZE):
+        self.max_entries = max_entries
+        self.window_size = window_size
+
+        # Queue name => (score, job IDs with this score)
+        self.watermarks = {}
+        # Queue name => {job ID: score} of the last processed entries
+        self.windows = {}
+        # Index of the first queue read by the next scan when there are more queues than entries
+        self._next_queue = 0
+        self._lock = threading.Lock()
+
+    def get_registry(self, queue):
+        """Get the job registry of a queue to scan."""
+        raise NotImplementedError
+
+    def get_commands(self, queue, job_id):
+        """Get the commands reading the data of a new registry entry.
+
+        Args:
+            queue (rq.Queue): RQ Queue instance
+            job_id (str): Job ID
+
+        Returns:
+            list: `(command, key, *args)` tuples, `HMGET` of the `fields` of the job hash by default.
+
+        """
+        return [('hmget', queue.job_class.key_for(job_id), self.fields)]
+
+    def process(self, queue, job_id, replies, score):
+        """Process a new registry entry.
+
+        Args:
+            queue (rq.Queue): RQ Queue instance
+            job_id (str): Job ID
+            replies (list): Replies of the `get_commands` commands
+            score (float): Registry entry score
+
+        """
+        raise NotImplementedError
+
+    def scan(self, connection, queue_class=None, batch_size=1000, queues=None):
+        """Read and process the registries entries added since the last scan.
+
+        The late entries below the watermarks are read first (`read_late_entries`),
+        then the entries of all the queues are read using a pipeline of `ZRANGEBYSCORE`
+        commands starting from the stored watermarks, then the job fields are
+        read using pipelined `HMGET` commands (the `get_commands` commands).
+
+        Note:
+            Entries with an infinite score (jobs kept forever) can't be ordered and are ignored.
+
+        Args:
+            connection (redis.Redis): Redis connection instance.
+            queue_class (type): RQ Queue class
+            batch_size (int): Maximum number of commands per pipeline
+            queues (list): RQ Queue instances, discovered using `get_queues` if not set
+
+        Returns:
+            int: Number of processed entries
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        with self._lock:
+            if queues is None:
+                queues = get_queues(connection, queue_class)
+
+            queues = sorted(queues, key=lambda q: q.name)
+
+            late_entries = self.read_late_entries(connection, queues, batch_size)
+            entries_by_queue = self.read_entries(connection, queues, batch_size)
+
+            # Take the late entries then the oldest entries of the queues in turn up to the limit
+            entries = late_entries + [
+                entry for entry in chain.from_iterable(zip_longest(*entries_by_queue))
+                if entry is not None
+            ]
+            entries = entries[:self.max_entries]
+
+            commands = [self.get_commands(q, job_id) for (q, job_id, _) in entries]
+
+            with command_phase(connection, self.phase):
+                replies = iter(execute_pipelined(connection, list(chain.from_iterable(commands)), batch_size))
+
+            for ((q, job_id, score), entry_commands) in zip(entries, commands):
+                self.process(q, job_id, [next(replies) for _ in entry_commands], score)
+
+                if self.window_size > 0:
+                    self.windows.setdefault(q.name, {})[job_id] = score
+
+                watermark, seen = self.watermarks.get(q.name, (None, ()))
+
+                if watermark is not None and score < watermark:
+                    # Late entry, the watermark doesn't move back
+                    continue
+
+                if watermark == score:
+                    self.watermarks[q.name] = (score, seen + (job_id,))
+                else:
+                    self.watermarks[q.name] = (score, (job_id,))
+
+            # Keep the entries with the highest scores
+            for name in {q.name for (q, _, _) in entries} & set(self.windows):
+                window = self.windows[name]
+
+                if len(window) > self.window_size:
+                    self.windows[name] = dict(
+                        sorted(window.items(), key=lambda item: item[1])[-self.window_size:]
+                    )
+
+            return len(entries)
+
+    def read_late_entries(self, connection, queues, batch_size=1000):
+        """Read the entries added below the watermarks of the queues since they were passed.
+
+        The entries between the lowest score of the window of a queue and its
+        watermark are read using a pipeline of `ZRANGEBYSCORE` commands, the
+        entries that are not in the window are late entries.
+
+        Args:
+            connection (redis.Redis): Redis connection instance.
+            queues (list): RQ Queue instances
+            batch_size (int): Maximum number of commands per pipeline
+
+        Returns:
+            list: `(queue, job_id, score)` late entries of all the queues, in score order by queue.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        queues = [q for q in queues if self.windows.get(q.name) and q.name in self.watermarks]
+
+        if not queues:
+            return []
+
+        commands = []
+
+        for q in queues:
+            window = self.windows[q.name]
+            watermark, _ = self.watermarks[q.name]
+
+            # The window entries are read again, up to `max_entries` late entries. The lowest
+            # score is excluded, entries with this score may have been dropped from the window
+            commands.append((
+                'zrangebyscore', self.get_registry(q).key, f'({min(window.values())}', watermark,
+                0, len(window) + self.max_entries, True
+            ))
+
+        with command_phase(connection, self.phase):
+            replies_by_queue = execute_pipelined(connection, commands, batch_size)
+
+        entries = []
+
+        for (q, replies) in zip(queues, replies_by_queue):
+            window = self.windows[q.name]
+            _, seen = self.watermarks[q.name]
+
+            entries.extend(
+                (q, job_id, job_score)
+                for (job_id, job_score) in ((as_text(job_id), job_score) for (job_id, job_score) in replies)
+                if job_id not in window and job_id not in seen
+            )
+
+        return entries
+
+    def read_entries(self, connection, queues, batch_size=1000):
+        """Read the new registry entries of the queues, about `max_entries` in total.
+
+        Each queue is read up to its share of the remaining entries, the queues
+        that had more entries than their share are read again with the entries
+        left by the other queues. When there are more queues than `max_entries`,
+        the queues are read in turn across the scans.
+
+        Args:
+            connection (redis.Redis): Redis connection instance.
+            queues (list): RQ Queue instances
+            batch_size (int): Maximum number of commands per pipeline
+
+        Returns:
+            list: `(queue, job_id, score)` entries of each queue, in score order.
+
+        Raises:
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        count = min(len(queues), self.max_entries)
+        start = self._next_queue % len(queues) if queues else 0
+        pending = (queues[start:] + queues[:start])[:count]
+        self._next_queue = start + count
+
+        # Queue name => (score, job IDs with this score) to read the next entries from
+        cursors = {q.name: self.watermarks.get(q.name, ('-inf', ())) for q in pending}
+        entries = {q.name: [] for q in pending}
+        remaining = self.max_entries
+
+        while pending and remaining > 0:
+            limit = math.ceil(remaining / len(pending))
+            commands = []
+
+            for q in pending:
+                score, seen = cursors[q.name]
+                # Entries with the cursor score that were already read are skipped
+                commands.append((
+                    'zrangebyscore', self.get_registry(q).key, score, '(+inf', 0, limit + len(seen), True
+                ))
+
+            with command_phase(connection, self.phase):
+                replies_by_queue = execute_pipelined(connection, commands, batch_size)
+
+            more = []
+
+            for (q, replies) in zip(pending, replies_by_queue):
+                score, seen = cursors[q.name]
+
+                new_entries = [
+                    (q, job_id, job_score)
+                    for (job_id, job_score) in ((as_text(job_id), job_score) for (job_id, job_score) in replies)
+                    if job_id not in seen
+                ]
+
+                if not new_entries:
+                    continue
+
+                entries[q.name].extend(new_entries)
+                remaining -= len(new_entries)
+
+                last_score = new_entries[-1][2]
+                last_ids = tuple(job_id for (_, job_id, job_score) in new_entries if job_score == last_score)
+                cursors[q.name] = (last_score, (seen if last_score == score else ()) + last_ids)
+
+                # The queue may have more entries than its share
+                if len(replies) == limit + len(seen):
+                    more.append(q)
+
+            pending = more
+
+        return list(entries.values())
+
+
+class FinishedJobsScanner(RegistryScanner):
+    """Job execution and wait time histograms from the finished job registries.
+
+    Note:
+        The finished job registry scores are the expiration time of the job results,
+        the jobs are processed in the order of their expiration time, the jobs with a
+        shorter `result_ttl` are read from the window below the watermark.
+
+    Args:
+        max_entries (int): Maximum number of new entries read per scan for all the queues
+        buckets (tuple): Histograms buckets in seconds
+        window_size (int): Number of processed entries kept below the watermark of each queue
+
+    """
+
+    fields = ('enqueued_at', 'started_at', 'ended_at')
+    phase = 'finished_jobs'
+
+    def __init__(self, max_entries=1000, buckets=DEFAULT_BUCKETS, window_size=DEFAULT_WINDOW_SIZE):
+        super().__init__(max_entries, window_size)
+
+        self.duration = CumulativeHistogram(
+            'rq_job_duration_seconds', 'RQ finished jobs execution time',
+            labels=['queue'], buckets=buckets,
+        )
+        self.wait = CumulativeHistogram(
+            'rq_job_wait_seconds', 'RQ finished jobs time spent in the queue before starting',
+            labels=['queue'], buckets=buckets,
+        )
+
+    def get_registry(self, queue):
+        return queue.finished_job_registry
+
+    def process(self, queue, job_id, replies, score):
+        enqueued_at, started_at, ended_at = map(parse_timestamp, replies[0])
+
+        if started_at is not None and ended_at is not None:
+            self.duration.observe((queue.name,), max(0, ended_at - started_at))
+
+        if enqueued_at is not None and started_at is not None:
+            self.wait.observe((queue.name,), max(0, started_at - enqueued_at))
+
+    def get_metrics(self):
+        """Get the histograms metric families."""
+        with self._lock:
+            return [self.duration.to_metric_family(), self.wait.to_metric_family()]
+
+
+class FailedJobsScanner(RegistryScanner):
+    """Failed jobs counters by function and exception class from the failed job registries.
+
+    The exception string is read from the latest result of the job, or from the
+    `exc_info` field of the job hash when no result was saved, only the exception
+    class is kept. The function name is read from the job description like the
+    queued jobs by function, the custom descriptions are counted as `other`.
+
+    Note:
+        The failed job registry scores are the expiration time of the failures,
+        the jobs are processed in the order of their expiration time, the jobs with a
+        shorter `failure_ttl` are read from the window below the watermark. The function
+        and exception class of a job are memoised, a job failing again is counted
+        without being read again.
+
+    Args:
+        max_entries (int): Maximum number of new entries read per scan for all the queues
+        memo_size (int): Maximum number of jobs memoised
+        window_size (int): Number of processed entries kept below the watermark of each queue
+
+    """
+
+    fields = ('description', 'exc_info')
+    phase = 'failed_jobs'
+
+    def __init__(self, max_entries=1000, memo_size=10000, window_size=DEFAULT_WINDOW_SIZE):
+        super().__init__(max_entries, window_size)
+
+        # Job ID => (function name, exception class)
+        self.memo = LRUCache(memo_size)
+
+        # Labels of the memoised jobs of the current scan, they can be evicted
+        # from the memo by the jobs processed before them
+        self._memoised = {}
+
+        # (queue, function name, exception class) => failures count
+        self.counts = {}
+
+    def get_registry(self, queue):
+        return queue.failed_job_registry
+
+    def scan(self, *args, **kwargs):
+        try:
+            return super().scan(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._memoised.clear()
+
+    def get_commands(self, queue, job_id):
+        labels = self.memo.get(job_id)
+
+        if labels is not None:
+            self._memoised[job_id] = labels
+            return []
+
+        return [
+            *super().get_commands(queue, job_id),
+            ('xrevrange', Result.get_key(job_id), '+', '-', 1),
+        ]
+
+    def process(self, queue, job_id, replies, score):
+        if not replies:
+            # Memoised when the commands were built
+            labels = self._memoised[job_id]
+        else:
+            (description, exc_info), results = replies
+
+            # The latest result of the job, the failure
+            payload = results[0][1] if results else {}
+            exc_string = decompress_exc_string(payload.get(b'exc_string'), encoded=True)
+
+            if exc_string is None:
+                exc_string = decompress_exc_string(exc_info)
+
+            labels = (
+                parse_func_name(description) or UNKNOWN,
+                parse_exc_type(exc_string) or UNKNOWN
+            )
+
+            self.memo.set(job_id, labels)
+
+        key = (queue.name, *labels)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def get_metrics(self):
+        """Get the failed jobs counter metric family."""
+        rq_failed_jobs_by_exception = CounterMetricFamily(
+            'rq_failed_jobs_by_exception', 'RQ failed jobs by function and exception class',
+            labels=['queue', 'func', 'exc_type']
+        )
+
+        with self._lock:
+            for (labels, count) in self.counts.items():
+                rq_failed_jobs_by_exception.add_metric(labels, count)
+
+        return [rq_failed_jobs_by_exception]
@@ -0,0 +1,145 @@
+"""
+Server side RQ data collection using a Lua script.
+
+The script reads the queues and workers sets, counts the jobs of each queue
+and reads the workers hash fields inside Redis, returning all the data in a
+single round trip.
+
+"""
+
+from rq import Queue, Worker
+from rq.utils import as_text
+
+from .utils import get_queue_keys, parse_workers_stats, WORKER_FIELDS
+
+
+# ARGV: workers set key, worker key prefix, queues set key, queue key prefix,
+# number of worker fields, the worker fields, then a (command, key prefix, key suffix)
+# triple for each job status count
+COLLECT_SCRIPT = """
+local workers_key, worker_prefix, queues_key, queue_prefix = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local fields_count = tonumber(ARGV[5])
+local fields = {unpack(ARGV, 6, 5 + fields_count)}
+
+local queues = {}
+
+for _, key in ipairs(redis.call('SMEMBERS', queues_key)) do
+    if string.sub(key, 1, #queue_prefix) == queue_prefix then
+        local name = string.sub(key, #queue_prefix + 1)
+        local row = {name}
+
+        for i = 6 + fields_count, #ARGV, 3 do
+            row[#row + 1] = redis.call(ARGV[i], ARGV[i + 1] .. name .. ARGV[i + 2])
+        end
+
+        queues[#queues + 1] = row
+    end
+end
+
+local workers = {}
+
+for _, key in ipairs(redis.call('SMEMBERS', workers_key)) do
+    if string.sub(key, 1, #worker_prefix) == worker_prefix then
+        local row = redis.call('HMGET', key, unpack(fields))
+        table.insert(row, 1, key)
+        workers[#workers + 1] = row
+    end
+end
+
+return {queues, workers}
+"""
+
+# Queue name used to get the key templates of the queue classes
+QUEUE_NAME_PLACEHOLDER = '\x00'
+
+
+def get_queue_key_templates(connection, queue_class):
+    """Get the Redis commands counting the jobs of a queue by status, as key templates.
+
+    Note:
+        No Redis commands are executed, the keys are taken from a queue
+        instance to respect custom RQ classes.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+
+    Returns:
+        dict: `(command, key prefix, key suffix)` tuple by job status
+
+    """
+    queue = queue_class(QUEUE_NAME_PLACEHOLDER, connection=connection)
+
+    return {
+        status: (command, *key.split(QUEUE_NAME_PLACEHOLDER, 1))
+        for (status, (command, key)) in get_queue_keys(queue).items()
+    }
+
+
+class CollectionScript(object):
+    """Collect the workers stats and the jobs count of each queue in a single round trip.
+
+    The script is loaded once using `SCRIPT LOAD` and called using `EVALSHA`,
+    it's loaded again if the script cache of the server is flushed.
+
+    Note:
+        The script reads keys that are not passed in `KEYS`, it can't be used
+        with Redis Cluster. Redis is blocked while the script is running.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        worker_class (type): RQ Worker class
+        queue_class (type): RQ Queue class
+
+    """
+
+    def __init__(self, connection, worker_class=None, queue_class=None):
+        self.connection = connection
+        self.worker_class = worker_class if worker_class is not None else Worker
+        self.queue_class = queue_class if queue_class is not None else Queue
+
+        self.templates = get_queue_key_templates(connection, self.queue_class)
+        self.script = connection.register_script(COLLECT_SCRIPT)
+
+    def get_args(self):
+        """Get the script arguments."""
+        args = [
+            self.worker_class.redis_workers_keys,
+            self.worker_class.redis_worker_namespace_prefix,
+            self.queue_class.redis_queues_keys,
+            self.queue_class.redis_queue_namespace_prefix,
+            len(WORKER_FIELDS),
+            *WORKER_FIELDS,
+        ]
+
+        for template in self.templates.values():
+            args.extend(template)
+
+        return args
+
+    def __call__(self):
+        """Run the script.
+
+        Returns:
+            tuple: `(workers, jobs_by_queue)` the same data as `get_workers_stats`
+                and `get_jobs_by_queue`.
+
+        Raises:
+            redis.exceptions.ResponseError: If scripting is disabled or not permitted
+            redis.exceptions.RedisError: On Redis connection errors
+
+        """
+        queues, workers = self.script(args=self.get_args())
+
+        jobs_by_queue = {
+            as_text(name): dict(zip(self.templates, counts))
+            for (name, *counts) in queues
+        }
+
+        workers = parse_workers_stats(
+            self.worker_class,
+            [as_text(key) for (key, *_) in workers],
+            [values for (_, *values) in workers]
+        )
+
+        return workers, jobs_by_queue
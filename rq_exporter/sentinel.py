@@ -0,0 +1,180 @@
+"""
+Redis Sentinel replica reads.
+
+The exporter only reads from Redis, its commands can be sent to the replicas
+of the Sentinel master instead of the master serving the RQ workers.
+
+"""
+
+import time
+import threading
+
+from redis.exceptions import ConnectionError
+from redis.sentinel import SentinelConnectionPool, SentinelManagedConnection
+from rq.utils import as_text
+
+
+# Role label of the replicas in `INFO replication`
+REPLICA_ROLE = 'slave'
+
+
+def parse_replication_info(info):
+    """Parse the reply of the `INFO replication` command.
+
+    Args:
+        info (bytes, str): `INFO replication` reply
+
+    Returns:
+        dict: Replication fields by name, the values are strings.
+
+    """
+    fields = {}
+
+    for line in as_text(info).splitlines():
+        if line and not line.startswith('#') and ':' in line:
+            name, value = line.split(':', 1)
+            fields[name] = value
+
+    return fields
+
+
+def get_replication_lag(fields):
+    """Get the replication lag of a replica from its `INFO replication` fields.
+
+    The lag is the number of seconds since the last interaction with the master,
+    the same measure used by the Redis `min-replicas-max-lag` option.
+
+    Args:
+        fields (dict): Fields returned by `parse_replication_info`
+
+    Returns:
+        float: Lag in seconds, `None` if the replica is not connected to its master.
+
+    """
+    if fields.get('master_link_status') != 'up':
+        return None
+
+    try:
+        return float(fields.get('master_last_io_seconds_ago', ''))
+    except ValueError:
+        return None
+
+
+class ReplicaManagedConnection(SentinelManagedConnection):
+    """Sentinel managed connection skipping the replicas lagging behind the master.
+
+    The replication lag is checked using `INFO replication` when connecting
+    and then at most every `max_replication_lag` seconds, a lagging replica is disconnected
+    and the next replica (or the master if none is left) is used instead.
+
+    Args:
+        max_replication_lag (float): Maximum replication lag in seconds, `None` disables the check
+
+    """
+
+    def __init__(self, max_replication_lag=None, **kwargs):
+        self.max_replication_lag = max_replication_lag
+
+        # Role of the connected node and `time.monotonic` time of the last lag check
+        self.role = None
+        self.checked_at = None
+
+        super().__init__(**kwargs)
+
+    def connect_to(self, address):
+        super().connect_to(address)
+
+        if not self.check_replication():
+            self.disconnect()
+            raise ConnectionError(f'The replica {address[0]}:{address[1]} is lagging behind the master')
+
+    def check_replication(self):
+        """Read the role of the connected node and check its replication lag.
+
+        Returns:
+            bool: Whether the node can serve the exporter reads.
+
+        """
+        self.send_command('INFO', 'replication')
+        fields = parse_replication_info(self.read_response())
+
+        self.role = fields.get('role')
+        self.checked_at = time.monotonic()
+
+        if self.role != REPLICA_ROLE or self.max_replication_lag is None:
+            return True
+
+        lag = get_replication_lag(fields)
+
+        return lag is not None and lag <= self.max_replication_lag
+
+    def is_checked(self):
+        """Whether the replication lag was checked recently."""
+        return (
+            self.role != REPLICA_ROLE
+            or self.max_replication_lag is None
+            or time.monotonic() - self.checked_at < self.max_replication_lag
+        )
+
+    def disconnect(self, *args, **kwargs):
+        self.role = None
+        self.checked_at = None
+
+        return super().disconnect(*args, **kwargs)
+
+
+class ReplicaConnectionPool(SentinelConnectionPool):
+    """Sentinel connection pool spreading the connections across the replicas.
+
+    The replicas are used in turn and the master is used when no replica is
+    available. The nodes serving the commands are recorded and returned by
+    `pop_served_nodes`.
+
+    Args:
+        service_name (str): Sentinel master name
+        sentinel_manager (redis.sentinel.Sentinel): Sentinel instance
+        **kwargs: Connection pool options, `max_replication_lag` sets the maximum
+            replication lag in seconds of the replicas.
+
+    """
+
+    def __init__(self, service_name, sentinel_manager, **kwargs):
+        kwargs.setdefault('connection_class', ReplicaManagedConnection)
+        kwargs['is_master'] = False
+
+        super().__init__(service_name, sentinel_manager, **kwargs)
+
+        # `(address, role)` of the nodes that served commands since the last call to `pop_served_nodes`
+        self._served_nodes = set()
+        self._served_lock = threading.Lock()
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+
+        try:
+            # Move to another node if the replica started lagging since the last check
+            if not connection.is_checked() and not connection.check_replication():
+                connection.disconnect()
+                connection.connect()
+        except BaseException:
+            self.release(connection)
+            raise
+
+        role = 'replica' if connection.role == REPLICA_ROLE else connection.role
+
+        with self._served_lock:
+            self._served_nodes.add((f'{connection.host}:{connection.port}', role))
+
+        return connection
+
+    def pop_served_nodes(self):
+        """Get and clear the nodes that served commands since the last call.
+
+        Returns:
+            set: `(address, role)` tuples, the role is `master` or `replica`.
+
+        """
+        with self._served_lock:
+            served_nodes, self._served_nodes = self._served_nodes, set()
+
+        return served_nodes
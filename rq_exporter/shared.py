@@ -0,0 +1,324 @@
+"""
+RQ metrics snapshot shared by multiple processes.
+
+A single process, holding an exclusive lock on `<path>.lock`, polls Redis
+and writes the rendered metrics to a file, all the processes serve the
+requests from a memory map of this file without accessing Redis.
+
+"""
+
+import os
+import time
+import math
+import mmap
+import fcntl
+import gzip
+import struct
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+
+from prometheus_client.core import REGISTRY
+from prometheus_client.exposition import (
+    generate_latest, gzip_accepted, CONTENT_TYPE_PLAIN_0_0_4
+)
+from prometheus_client.openmetrics import exposition as openmetrics
+
+from .collector import Snapshot
+from .exposition import render, OPENMETRICS_EOF
+
+
+logger = logging.getLogger(__name__)
+
+
+# Snapshot file header
+# Magic, timestamp of the last successful collection (NaN if none), success flag,
+# circuit state (-1 if the circuit breaker is disabled), text format and OpenMetrics format lengths
+HEADER = struct.Struct('<8sd?bII')
+MAGIC = b'RQSNAP02'
+
+# Snapshot polling interval in seconds when `poll_interval` is not set
+DEFAULT_SHARED_POLL_INTERVAL = 10
+
+# Metrics read from a snapshot file
+# `text` and `openmetrics` are memory views of the rendered metrics
+# `circuit_open` is `None` if the circuit breaker is disabled
+SharedMetrics = namedtuple('SharedMetrics', ['timestamp', 'success', 'circuit_open', 'text', 'openmetrics'])
+
+
+class SharedSnapshot(object):
+    """Snapshot file of the rendered RQ metrics.
+
+    The file is replaced atomically on each write, the readers map the
+    current file and map it again when it's replaced.
+
+    Args:
+        path (str): Snapshot file path
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+
+        self._lock_file = None
+
+        # Rendered metrics of the last written snapshot
+        self._rendered = (None, b'', b'')
+
+        # Current mapped file, its (inode, modification time) and metrics
+        self._key = None
+        self._mmap = None
+        self._metrics = None
+        self._read_lock = threading.Lock()
+
+    def acquire(self):
+        """Try to take the exclusive lock of the snapshot file, without blocking.
+
+        The lock is released by the operating system when the process exits.
+
+        Returns:
+            bool: Whether the lock is held by this process.
+
+        """
+        if self._lock_file is not None:
+            return True
+
+        lock_file = open(self.lock_path, 'a')
+
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+
+        return True
+
+    def release(self):
+        """Release the exclusive lock of the snapshot file."""
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def write(self, snapshot, circuit_open=None):
+        """Write a snapshot in the text and OpenMetrics formats.
+
+        Note:
+            The metrics are only rendered again when the snapshot metrics change.
+
+        Args:
+            snapshot (rq_exporter.collector.Snapshot): Snapshot to write
+            circuit_open (bool): Circuit breaker state, `None` if the circuit breaker is disabled
+
+        """
+        metrics, text, om = self._rendered
+
+        if metrics is not snapshot.metrics:
+            text = render(snapshot.metrics, generate_latest)
+            om = render(snapshot.metrics, openmetrics.generate_latest)
+            self._rendered = (snapshot.metrics, text, om)
+
+        timestamp = snapshot.timestamp if snapshot.timestamp is not None else math.nan
+        circuit = int(circuit_open) if circuit_open is not None else -1
+        header = HEADER.pack(MAGIC, timestamp, snapshot.success, circuit, len(text), len(om))
+
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.')
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(text)
+                f.write(om)
+
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def read(self):
+        """Read the current snapshot.
+
+        Returns:
+            SharedMetrics: The snapshot metrics, `None` if no snapshot was written yet.
+
+        Raises:
+            ValueError: If the file is not a snapshot file
+
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        key = (stat.st_ino, stat.st_mtime_ns)
+
+        with self._read_lock:
+            if key != self._key:
+                with open(self.path, 'rb') as f:
+                    # The mapping stays valid after the file is replaced
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+                magic, timestamp, success, circuit, text_length, om_length = HEADER.unpack_from(self._mmap)
+
+                if magic != MAGIC:
+                    raise ValueError(f'Invalid snapshot file: {self.path}')
+
+                view = memoryview(self._mmap)
+                start = HEADER.size
+
+                self._key = key
+                self._metrics = SharedMetrics(
+                    timestamp=None if math.isnan(timestamp) else timestamp,
+                    success=success,
+                    circuit_open=bool(circuit) if circuit >= 0 else None,
+                    text=view[start:start + text_length],
+                    openmetrics=view[start + text_length:start + text_length + om_length],
+                )
+
+            return self._metrics
+
+
+class SharedSnapshotPoller(object):
+    """Poll the RQ metrics and write the shared snapshot when holding the snapshot lock.
+
+    The processes not holding the lock try to take it on every interval and
+    take over the polling when the process holding it exits.
+
+    Args:
+        collector (rq_exporter.collector.RQCollector): RQ metrics collector
+        shared (SharedSnapshot): Shared snapshot file
+        poll_interval (float): Polling interval in seconds
+
+    """
+
+    def __init__(self, collector, shared, poll_interval=DEFAULT_SHARED_POLL_INTERVAL):
+        self.collector = collector
+        self.shared = shared
+        self.poll_interval = poll_interval
+
+        self.leader = False
+
+        self._thread = None
+        self._stop = threading.Event()
+
+    def poll(self):
+        """Write a new snapshot if the snapshot lock is held by this process.
+
+        Returns:
+            bool: Whether this process is the leader.
+
+        """
+        if not self.leader and self.shared.acquire():
+            logger.info(f'Polling the RQ metrics for the shared snapshot {self.shared.path}')
+            self.leader = True
+
+        if self.leader:
+            snapshot = self.collector.poll()
+
+            try:
+                self.shared.write(snapshot, self.collector.circuit_open)
+            except OSError:
+                logger.exception('There was an error writing the shared snapshot')
+
+        return self.leader
+
+    def start(self):
+        """Start the polling thread."""
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='rq-exporter-shared-poller', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the polling thread and release the snapshot lock."""
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        self.shared.release()
+        self.leader = False
+
+    def _run(self):
+        while not self._stop.is_set():
+            start = time.monotonic()
+            self.poll()
+            self._stop.wait(max(0, self.poll_interval - (time.monotonic() - start)))
+
+
+class SharedSnapshotApp(object):
+    """WSGI application serving the RQ metrics from the shared snapshot.
+
+    The snapshot status metrics and the metrics of the `registry` (e.g. the
+    process metrics) are rendered on every request.
+
+    Args:
+        collector (rq_exporter.collector.RQCollector): RQ metrics collector
+        shared (SharedSnapshot): Shared snapshot file
+        registry (prometheus_client.core.CollectorRegistry): Registry of the other metrics
+
+    """
+
+    def __init__(self, collector, shared, registry=REGISTRY):
+        self.collector = collector
+        self.shared = shared
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO') == '/favicon.ico':
+            start_response('200 OK', [])
+            return [b'']
+
+        accept = environ.get('HTTP_ACCEPT') or ''
+        use_openmetrics = any(
+            a.split(';')[0].strip() == 'application/openmetrics-text' for a in accept.split(',')
+        )
+
+        if use_openmetrics:
+            encoder, content_type = openmetrics.generate_latest, openmetrics.CONTENT_TYPE_LATEST
+        else:
+            encoder, content_type = generate_latest, CONTENT_TYPE_PLAIN_0_0_4
+
+        metrics = self.shared.read()
+
+        if metrics is None:
+            snapshot = Snapshot(metrics=(), timestamp=None, success=False)
+            circuit_open = None
+            parts = []
+        else:
+            snapshot = Snapshot(metrics=(), timestamp=metrics.timestamp, success=metrics.success)
+            circuit_open = metrics.circuit_open
+            parts = [metrics.openmetrics if use_openmetrics else metrics.text]
+
+        # The circuit breaker of the polling process
+        status = self.collector.get_snapshot_status_metrics(snapshot)
+
+        if circuit_open is not None:
+            status.extend(self.collector.get_circuit_metrics(circuit_open))
+        parts.append(render(list(self.registry.collect()) + status, encoder))
+
+        if use_openmetrics:
+            parts.append(OPENMETRICS_EOF)
+
+        body = b''.join(parts)
+        headers = [('Content-Type', content_type), ('Vary', 'Accept, Accept-Encoding')]
+
+        if gzip_accepted(environ.get('HTTP_ACCEPT_ENCODING', '')):
+            body = gzip.compress(body)
+            headers.append(('Content-Encoding', 'gzip'))
+
+        headers.append(('Content-Length', str(len(body))))
+
+        start_response('200 OK', headers)
+        return [body]
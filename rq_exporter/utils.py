@@ -3,19 +3,144 @@ RQ exporter utility functions.
 
 """
 
+import re
+from collections import OrderedDict
+from datetime import timezone
+from concurrent.futures import ThreadPoolExecutor
+
 from redis import Redis
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError, TimeoutError
+from redis.cluster import RedisCluster
+from redis.retry import Retry
 from redis.sentinel import Sentinel
 from rq import Queue, Worker
 from rq.job import JobStatus
+from rq.scheduler import RQScheduler
+from rq.worker import WorkerStatus
+from rq.utils import as_text, current_timestamp, utcparse
+
+from .instrumentation import command_phase
+from .sentinel import ReplicaConnectionPool
+
+
+# Number of commands per pipeline used when batching is not configured
+DEFAULT_BATCH_SIZE = 1000
+
+# Maximum delay in seconds between the retries of a failed Redis command
+RETRY_BACKOFF_CAP = 2
+
+# Worker hash fields read by `get_workers_stats_batched`
+WORKER_FIELDS = (
+    'state', 'queues', 'successful_job_count', 'failed_job_count', 'total_working_time',
+    'last_heartbeat', 'current_job_working_time'
+)
+
+# Dotted callable name at the start of a job call string, e.g. `tasks.send_email`
+FUNC_NAME_PATTERN = re.compile(r'^[\w.]+$')
+
+# Function label of the jobs whose description isn't a call string
+OTHER_FUNC = 'other'
+
+
+def get_connection_options(max_connections=None, socket_timeout=None, socket_connect_timeout=None,
+                           socket_keepalive=False, health_check_interval=0, retries=0,
+                           retry_backoff=0.1):
+    """Get the Redis connection pool options.
+
+    Only the configured options are returned, the other options keep the
+    `redis` package defaults.
+
+    Args:
+        max_connections (int): Maximum number of connections of the pool
+        socket_timeout (float): Seconds to wait for a command reply
+        socket_connect_timeout (float): Seconds to wait for the connection to be established
+        socket_keepalive (bool): Enable TCP keepalive on the connections
+        health_check_interval (int): Seconds after which an idle connection is checked
+            using `PING` before being used, `0` disables the health checks
+        retries (int): Number of retries of the commands failing with connection or timeout errors
+        retry_backoff (float): Base delay in seconds of the exponential backoff between retries
+
+    Returns:
+        dict: Keyword arguments for the Redis client or connection pool.
+
+    """
+    options = {}
+
+    if max_connections:
+        options['max_connections'] = max_connections
+
+    if socket_timeout:
+        options['socket_timeout'] = socket_timeout
+
+    if socket_connect_timeout:
+        options['socket_connect_timeout'] = socket_connect_timeout
+
+    if socket_keepalive:
+        options['socket_keepalive'] = True
+
+    if health_check_interval:
+        options['health_check_interval'] = health_check_interval
+
+    if retries:
+        options['retry'] = Retry(
+            ExponentialBackoff(cap=RETRY_BACKOFF_CAP, base=retry_backoff), retries
+        )
+        # Without `retry_on_error` only the connection is retried, not the commands
+        options['retry_on_error'] = [ConnectionError, TimeoutError]
+
+    return options
+
+
+def read_password(password=None, password_file=None):
+    """Get the Redis password, reading it from the password file if provided.
+
+    Args:
+        password (str): Redis password
+        password_file (str): Redis password file path
+
+    Returns:
+        str: The password file content, `password` if the file is not provided.
+
+    Raises:
+        IOError: On errors opening the password file.
+
+    """
+    if not password_file:
+        return password
+
+    with open(password_file, 'r') as f:
+        return f.read().strip()
+
+
+def parse_sentinel_addresses(sentinel, sentinel_port='26379'):
+    """Parse the comma separated Sentinel addresses.
+
+    Args:
+        sentinel (str): Sentinel hosts, e.g. `sentinel1:26380,sentinel2`
+        sentinel_port (str, int): Port of the hosts without a port
+
+    Returns:
+        list: `(host, port)` tuples.
+
+    """
+    return [
+        (
+            address.split(':')[0],
+            address.split(':')[1] if ':' in address else sentinel_port
+        )
+        for address in sentinel.split(',')
+    ]
 
 
 def get_redis_connection(host='localhost', port='6379', db='0', sentinel=None,
                          sentinel_port='26379', sentinel_master=None,
-                         password=None, password_file=None, url=None):
+                         password=None, password_file=None, url=None, cluster=False,
+                         options=None, sentinel_replica=False, sentinel_max_lag=None):
     """Get the Redis connection instance.
 
     Note:
-        If the `url` is provided, all the other options are ignored.
+        If the `url` is provided, all the other options are ignored except `cluster` and `options`.
         If `password_file` is provided it will be used instead of `password.`
 
     Args:
@@ -28,37 +153,74 @@ def get_redis_connection(host='localhost', port='6379', db='0', sentinel=None,
         password (str): Redis password
         password_file (str): Redis password file path
         url (str): Full Redis connection URL
+        cluster (bool): Connect to a Redis Cluster using `host` and `port` as a startup node
+        options (dict): Connection pool options returned by `get_connection_options`
+        sentinel_replica (bool): Read from the replicas of the Sentinel master, in turn,
+            the master is used when no replica is available.
+        sentinel_max_lag (float): Maximum replication lag in seconds of the replicas
+            used with `sentinel_replica`, `None` disables the check.
 
     Returns:
-        redis.Redis: Redis connection instance.
+        redis.Redis: Redis connection instance, `redis.cluster.RedisCluster` in cluster mode.
 
     Raises:
         IOError: On errors opening the password file.
 
     """
+    options = options or {}
+
     if url:
-        return Redis.from_url(url)
+        return RedisCluster.from_url(url, **options) if cluster else Redis.from_url(url, **options)
 
     # Use password file if provided
-    if password_file:
-        with open(password_file, 'r') as f:
-            password = f.read().strip()
+    password = read_password(password, password_file)
+
+    if cluster:
+        return RedisCluster(host=host, port=int(port), password=password, **options)
 
     if sentinel:
-        addr_list = [
-            (
-                url.split(':')[0],
-                url.split(':')[1] if ':' in url else sentinel_port
+        sentinel_manager = Sentinel(
+            parse_sentinel_addresses(sentinel, sentinel_port),
+            sentinel_kwargs={'password': password, 'socket_timeout': 1}
+        )
+
+        if sentinel_replica:
+            return sentinel_manager.slave_for(
+                sentinel_master, connection_pool_class=ReplicaConnectionPool,
+                max_replication_lag=sentinel_max_lag, password=password, db=db,
+                **{'socket_timeout': 1, **options}
             )
-            for url in sentinel.split(",")
-        ]
 
-        return Sentinel(
-            addr_list,
-            sentinel_kwargs={'password': password, 'socket_timeout': 1}
-        ).master_for(sentinel_master, password=password, db=db, socket_timeout=1)
+        return sentinel_manager.master_for(sentinel_master, password=password, db=db, **{'socket_timeout': 1, **options})
+
+    return Redis(host=host, port=port, db=db, password=password, **options)
 
-    return Redis(host=host, port=port, db=db, password=password)
+
+def get_current_job_started_at(state, last_heartbeat, working_time):
+    """Estimate the start time of the current job of a worker.
+
+    The worker saves the time spent on its current job with each heartbeat
+    while the job is running, the job started `working_time` seconds before
+    the last heartbeat.
+
+    Note:
+        Only the busy workers have a current job, the same rule is used by all
+        the collection modes so they export the same current job times.
+
+    Args:
+        state (str): Worker state
+        last_heartbeat (float): Timestamp of the last heartbeat of the worker
+        working_time (str, float): `current_job_working_time` of the worker
+
+    Returns:
+        float: Start timestamp of the current job, `None` if the worker isn't
+            busy or without heartbeat.
+
+    """
+    if state != WorkerStatus.BUSY or last_heartbeat is None:
+        return None
+
+    return last_heartbeat - float(working_time or 0)
 
 
 def get_workers_stats(connection, worker_class=None):
@@ -77,19 +239,210 @@ def get_workers_stats(connection, worker_class=None):
     """
     worker_class = worker_class if worker_class is not None else Worker
 
-    workers = worker_class.all(connection)
+    with command_phase(connection, 'worker_stats'):
+        workers = worker_class.all(connection)
 
-    return [
-        {
+    workers_stats = []
+
+    for w in workers:
+        state = w.get_state()
+        last_heartbeat = to_timestamp(w.last_heartbeat)
+
+        workers_stats.append({
             'name': w.name,
             'queues': w.queue_names(),
-            'state': w.get_state(),
+            'state': state,
             'successful_job_count': w.successful_job_count,
             'failed_job_count': w.failed_job_count,
-            'total_working_time': w.total_working_time
+            'total_working_time': w.total_working_time,
+            'last_heartbeat': last_heartbeat,
+            'current_job_started_at': get_current_job_started_at(
+                state, last_heartbeat, w.current_job_working_time
+            )
+        })
+
+    return workers_stats
+
+
+def get_workers_stats_batched(connection, worker_class=None, batch_size=1000):
+    """Get the RQ workers stats using pipelined Redis commands.
+
+    Same as `get_workers_stats` but without creating a `Worker` instance
+    for each worker, the worker keys are read once and only the needed hash
+    fields are fetched using `HMGET` in pipelines of `batch_size` commands.
+
+    Note:
+        Worker keys that do not start with the key prefix of the `worker_class`
+        are ignored, as well as the keys of the workers that no longer exist.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        worker_class (type): RQ Worker class
+        batch_size (int): Maximum number of commands per pipeline
+
+    Returns:
+        list: List of worker stats as a dict {name, queues, state}
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    worker_class = worker_class if worker_class is not None else Worker
+
+    with command_phase(connection, 'worker_discovery'):
+        worker_keys = get_worker_keys(
+            worker_class, connection.smembers(worker_class.redis_workers_keys)
+        )
+
+    with command_phase(connection, 'worker_stats'):
+        replies = execute_pipelined(
+            connection,
+            [('hmget', key, WORKER_FIELDS) for key in worker_keys],
+            batch_size
+        )
+
+    return parse_workers_stats(worker_class, worker_keys, replies)
+
+
+def get_worker_keys(worker_class, keys):
+    """Get the worker keys that belong to a Worker class.
+
+    Args:
+        worker_class (type): RQ Worker class
+        keys (iterable): Worker keys from the workers set
+
+    Returns:
+        list: Decoded worker keys starting with the worker class key prefix
+
+    """
+    prefix = worker_class.redis_worker_namespace_prefix
+
+    return [key for key in map(as_text, keys) if key.startswith(prefix)]
+
+
+def parse_workers_stats(worker_class, worker_keys, replies):
+    """Parse the `HMGET` replies of the `WORKER_FIELDS` of each worker.
+
+    Args:
+        worker_class (type): RQ Worker class
+        worker_keys (list): Worker keys
+        replies (list): `HMGET` reply of each worker key
+
+    Returns:
+        list: List of worker stats as a dict {name, queues, state}
+
+    """
+    prefix = worker_class.redis_worker_namespace_prefix
+
+    workers = []
+
+    for (key, values) in zip(worker_keys, replies):
+        # The worker key has expired
+        if not any(values):
+            continue
+
+        data = {
+            field: as_text(value) for (field, value) in zip(WORKER_FIELDS, values)
+            if value is not None
         }
-        for w in workers
-    ]
+
+        state = data.get('state') or '?'
+        last_heartbeat = parse_timestamp(data.get('last_heartbeat'))
+
+        workers.append({
+            'name': key[len(prefix):],
+            'queues': data['queues'].split(',') if data.get('queues') else [],
+            'state': state,
+            'successful_job_count': int(data.get('successful_job_count') or 0),
+            'failed_job_count': int(data.get('failed_job_count') or 0),
+            'total_working_time': float(data.get('total_working_time') or 0),
+            'last_heartbeat': last_heartbeat,
+            'current_job_started_at': get_current_job_started_at(
+                state, last_heartbeat, data.get('current_job_working_time')
+            )
+        })
+
+    return workers
+
+
+def scan_set_members(connection, key, count=1000):
+    """Iterate over the members of a set in chunks using `SSCAN`.
+
+    Note:
+        Members added or removed during the iteration may or may not be returned
+        and a member may be returned more than once.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        key (str): Set key
+        count (int): `SSCAN` count hint, the approximate number of members per chunk
+
+    Yields:
+        list: Chunk of set members
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    cursor = 0
+
+    while True:
+        cursor, members = connection.sscan(key, cursor, count=count)
+
+        if members:
+            yield members
+
+        if int(cursor) == 0:
+            break
+
+
+def iter_workers_stats(connection, worker_class=None, chunk_size=1000):
+    """Iterate over the RQ workers stats, reading the workers in chunks.
+
+    Same as `get_workers_stats_batched` but the workers set is read using
+    `SSCAN` and the worker hashes of each chunk are read using a single
+    pipeline, the stats are yielded as the chunks arrive so only a chunk
+    of workers is held in memory.
+
+    Note:
+        Only the keys of the returned workers are kept to skip the duplicate
+        members returned by `SSCAN`.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        worker_class (type): RQ Worker class
+        chunk_size (int): Approximate number of workers per chunk
+
+    Yields:
+        dict: Worker stats {name, queues, state}
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    worker_class = worker_class if worker_class is not None else Worker
+
+    seen = set()
+    chunks = scan_set_members(connection, worker_class.redis_workers_keys, chunk_size)
+
+    while True:
+        with command_phase(connection, 'worker_discovery'):
+            keys = next(chunks, None)
+
+        if keys is None:
+            return
+
+        worker_keys = [key for key in get_worker_keys(worker_class, keys) if key not in seen]
+        seen.update(worker_keys)
+
+        with command_phase(connection, 'worker_stats'):
+            replies = execute_pipelined(
+                connection,
+                [('hmget', key, WORKER_FIELDS) for key in worker_keys],
+                chunk_size
+            )
+
+        yield from parse_workers_stats(worker_class, worker_keys, replies)
 
 
 def get_queue_jobs(connection, queue_name, queue_class=None):
@@ -121,12 +474,33 @@ def get_queue_jobs(connection, queue_name, queue_class=None):
     }
 
 
-def get_jobs_by_queue(connection, queue_class=None):
+def get_queues(connection, queue_class=None):
+    """Discover the RQ queues.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+
+    Returns:
+        list: RQ Queue instances
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    queue_class = queue_class if queue_class is not None else Queue
+
+    with command_phase(connection, 'queue_discovery'):
+        return queue_class.all(connection)
+
+
+def get_jobs_by_queue(connection, queue_class=None, queues=None):
     """Get the current jobs by queue.
 
     Args:
         connection (redis.Redis): Redis connection instance.
         queue_class (type): RQ Queue class
+        queues (list): RQ Queue instances, discovered using `get_queues` if not set
 
     Returns:
         dict: Dictionary of job count by status for each queue
@@ -137,8 +511,652 @@ def get_jobs_by_queue(connection, queue_class=None):
     """
     queue_class = queue_class if queue_class is not None else Queue
 
-    queues = queue_class.all(connection)
+    if queues is None:
+        queues = get_queues(connection, queue_class)
+
+    with command_phase(connection, 'queue_counts'):
+        return {
+            q.name: get_queue_jobs(connection, q.name, queue_class) for q in queues
+        }
+
 
+def get_queue_keys(queue):
+    """Get the Redis keys holding the jobs of a Queue by job status.
+
+    Note:
+        No Redis commands are executed, the keys are taken from the queue
+        and its registries to respect custom RQ classes.
+
+    Args:
+        queue (rq.Queue): RQ Queue instance
+
+    Returns:
+        dict: Redis command and key tuple `(command, key)` by job status
+
+    """
     return {
-        q.name: get_queue_jobs(connection, q.name, queue_class) for q in queues
+        JobStatus.QUEUED: ('llen', queue.key),
+        JobStatus.STARTED: ('zcard', queue.started_job_registry.key),
+        JobStatus.FINISHED: ('zcard', queue.finished_job_registry.key),
+        JobStatus.FAILED: ('zcard', queue.failed_job_registry.key),
+        JobStatus.DEFERRED: ('zcard', queue.deferred_job_registry.key),
+        JobStatus.SCHEDULED: ('zcard', queue.scheduled_job_registry.key)
     }
+
+
+def execute_pipelined(connection, commands, batch_size):
+    """Execute Redis commands using pipelines.
+
+    The commands are sent in chunks of `batch_size` commands, each chunk
+    is sent in a single round trip using a non transactional pipeline.
+
+    Note:
+        On Redis Cluster the commands are grouped by the node serving their
+        key and the pipelines of each node are sent in parallel.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        commands (list): List of `(command, key, *args)` tuples, e.g. `('llen', key)`
+        batch_size (int): Maximum number of commands per pipeline
+
+    Returns:
+        list: The commands replies in the same order as `commands`
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    if isinstance(connection, RedisCluster):
+        return execute_pipelined_cluster(connection, commands, batch_size)
+
+    results = []
+
+    for i in range(0, len(commands), batch_size):
+        with connection.pipeline(transaction=False) as pipeline:
+            for (command, *args) in commands[i:i + batch_size]:
+                getattr(pipeline, command)(*args)
+
+            results.extend(pipeline.execute())
+
+    return results
+
+
+def execute_pipelined_cluster(connection, commands, batch_size):
+    """Execute Redis commands on a Redis Cluster using a pipeline per node.
+
+    The commands are grouped by the node serving the hash slot of their key,
+    each node receives its commands in pipelines of `batch_size` commands
+    and the nodes are queried in parallel.
+
+    Args:
+        connection (redis.cluster.RedisCluster): Redis Cluster connection instance.
+        commands (list): List of `(command, key, *args)` tuples, e.g. `('llen', key)`
+        batch_size (int): Maximum number of commands per pipeline
+
+    Returns:
+        list: The commands replies in the same order as `commands`
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    # Command indexes by node name
+    nodes = {}
+    indexes = {}
+
+    for (index, (command, key, *args)) in enumerate(commands):
+        node = connection.get_node_from_key(key)
+        nodes[node.name] = node
+        indexes.setdefault(node.name, []).append(index)
+
+    if not nodes:
+        return []
+
+    def execute_on_node(name):
+        node_commands = [commands[i] for i in indexes[name]]
+        return execute_pipelined(nodes[name].redis_connection, node_commands, batch_size)
+
+    results = [None] * len(commands)
+
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        for (name, replies) in zip(nodes, executor.map(execute_on_node, nodes)):
+            for (index, reply) in zip(indexes[name], replies):
+                results[index] = reply
+
+    return results
+
+
+def get_jobs_by_queue_batched(connection, queue_class=None, batch_size=1000, scheduler_stats=None, queues=None):
+    """Get the current jobs by queue using pipelined Redis commands.
+
+    Same as `get_jobs_by_queue` but all the counts of all the queues are
+    fetched in `ceil(queues * 6 / batch_size)` round trips instead of
+    6 round trips per queue.
+
+    Note:
+        When a `scheduler_stats` dict is passed, the commands returned by
+        `get_scheduler_commands` are sent in the same pipelines and the dict
+        is updated with the scheduler stats of each queue.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+        batch_size (int): Maximum number of commands per pipeline
+        scheduler_stats (dict): Updated with the scheduler stats by queue name
+        queues (list): RQ Queue instances, discovered using `get_queues` if not set
+
+    Returns:
+        dict: Dictionary of job count by status for each queue
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    if queues is None:
+        queues = get_queues(connection, queue_class)
+
+    commands = list(get_queues_commands(queues).values())
+    count = len(commands)
+
+    if scheduler_stats is not None:
+        now = current_timestamp()
+        commands.extend(get_scheduler_commands(queues, now).values())
+
+    with command_phase(connection, 'queue_counts'):
+        replies = execute_pipelined(connection, commands, batch_size)
+
+    if scheduler_stats is not None:
+        scheduler_stats.update(parse_scheduler_stats(queues, replies[count:], now))
+
+    return parse_jobs_by_queue(queues, replies[:count])
+
+
+def iter_jobs_by_queue(connection, queue_class=None, chunk_size=1000):
+    """Iterate over the current jobs by queue, reading the queues in chunks.
+
+    Same as `get_jobs_by_queue_batched` but the queues set is read using
+    `SSCAN` and the counts of each chunk of queues are read using pipelines,
+    the counts are yielded as the chunks arrive.
+
+    Note:
+        Queue keys that do not start with the key prefix of the `queue_class` are ignored.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+        chunk_size (int): Approximate number of queues per chunk
+
+    Yields:
+        tuple: `(queue_name, jobs)` the job count by status of each queue
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    queue_class = queue_class if queue_class is not None else Queue
+    prefix = queue_class.redis_queue_namespace_prefix
+
+    seen = set()
+    chunks = scan_set_members(connection, queue_class.redis_queues_keys, chunk_size)
+
+    while True:
+        with command_phase(connection, 'queue_discovery'):
+            keys = next(chunks, None)
+
+        if keys is None:
+            return
+
+        queues = [
+            queue_class.from_queue_key(key, connection=connection)
+            for key in map(as_text, keys) if key.startswith(prefix) and key not in seen
+        ]
+        seen.update(q.key for q in queues)
+
+        commands = get_queues_commands(queues)
+
+        with command_phase(connection, 'queue_counts'):
+            replies = execute_pipelined(connection, list(commands.values()), chunk_size)
+
+        yield from parse_jobs_by_queue(queues, replies).items()
+
+
+def get_queues_commands(queues):
+    """Get the Redis commands counting the jobs of the queues.
+
+    Args:
+        queues (list): RQ Queue instances
+
+    Returns:
+        dict: Redis command tuple by `(queue_name, status)`
+
+    """
+    return {
+        (q.name, status): command
+        for q in queues
+        for (status, command) in get_queue_keys(q).items()
+    }
+
+
+def parse_jobs_by_queue(queues, replies):
+    """Parse the replies of the commands returned by `get_queues_commands`.
+
+    Args:
+        queues (list): RQ Queue instances
+        replies (list): Replies in the same order as the commands
+
+    Returns:
+        dict: Dictionary of job count by status for each queue
+
+    """
+    jobs = {q.name: {} for q in queues}
+
+    for ((queue_name, status), count) in zip(get_queues_commands(queues), replies):
+        jobs[queue_name][status] = count
+
+    return jobs
+
+
+def get_scheduler_commands(queues, now):
+    """Get the Redis commands reading the scheduler stats of the queues.
+
+    The overdue jobs are counted using `ZCOUNT` on the scheduled job registry,
+    the earliest scheduled job is read using `ZRANGE 0 0 WITHSCORES` and the
+    RQ scheduler lock of the queue is checked using `EXISTS`.
+
+    Args:
+        queues (list): RQ Queue instances
+        now (int): Unix timestamp the scheduled times are compared to
+
+    Returns:
+        dict: Redis command tuple by `(queue_name, stat)`
+
+    """
+    commands = {}
+
+    for q in queues:
+        key = q.scheduled_job_registry.key
+
+        commands[(q.name, 'overdue')] = ('zcount', key, '-inf', now)
+        # Positional `desc` and `withscores` arguments of `zrange`
+        commands[(q.name, 'earliest')] = ('zrange', key, 0, 0, False, True)
+        commands[(q.name, 'lock')] = ('exists', RQScheduler.get_locking_key(q.name))
+
+    return commands
+
+
+def parse_scheduler_stats(queues, replies, now):
+    """Parse the replies of the commands returned by `get_scheduler_commands`.
+
+    Args:
+        queues (list): RQ Queue instances
+        replies (list): Replies in the same order as the commands
+        now (int): Unix timestamp passed to `get_scheduler_commands`
+
+    Returns:
+        dict: Scheduler stats by queue name, a dict with the number of `overdue`
+            jobs, the `max_lag` in seconds of the earliest overdue job (`0` if no
+            job is overdue) and whether the scheduler `lock_held`.
+
+    """
+    stats = {q.name: {} for q in queues}
+
+    for ((queue_name, stat), reply) in zip(get_scheduler_commands(queues, now), replies):
+        if stat == 'overdue':
+            stats[queue_name]['overdue'] = reply
+        elif stat == 'earliest':
+            stats[queue_name]['max_lag'] = max(0, now - reply[0][1]) if reply else 0
+        else:
+            stats[queue_name]['lock_held'] = bool(reply)
+
+    return stats
+
+
+def parse_list(value):
+    """Parse a comma separated list of values.
+
+    Args:
+        value (str): Comma separated values
+
+    Returns:
+        list: List of the non empty values.
+
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def parse_timestamp(value):
+    """Parse an RQ date string to a Unix timestamp.
+
+    Args:
+        value (bytes, str): Date in the RQ format, e.g. `2020-05-01T10:00:00.000000Z`
+
+    Returns:
+        float: Unix timestamp, `None` if the value is missing or invalid
+
+    """
+    if not value:
+        return None
+
+    try:
+        date = utcparse(as_text(value))
+    except ValueError:
+        return None
+
+    return to_timestamp(date)
+
+
+def to_timestamp(date):
+    """Convert an RQ date to a Unix timestamp.
+
+    Args:
+        date (datetime.datetime): Date, naive dates are in UTC
+
+    Returns:
+        float: Unix timestamp, `None` if the date is `None`
+
+    """
+    if date is None:
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return date.timestamp()
+
+
+def parse_func_name(description):
+    """Get the function name of a job from its description.
+
+    Note:
+        The description of a job is its call string (e.g. `tasks.add(1, 2)`) unless
+        set when enqueuing it, the custom descriptions that aren't a dotted callable
+        name are replaced with `OTHER_FUNC` to bound the number of label values. The
+        func name of the job data is not used, it can only be read by unpickling the job data.
+
+    Args:
+        description (bytes, str): Job description
+
+    Returns:
+        str: Function name, `OTHER_FUNC` for custom descriptions, `None` if the description is missing
+
+    """
+    if not description:
+        return None
+
+    func_name = as_text(description).partition('(')[0].strip()
+
+    return func_name if FUNC_NAME_PATTERN.match(func_name) else OTHER_FUNC
+
+
+class LRUCache(object):
+    """Size bounded mapping discarding the least recently used entries.
+
+    Args:
+        max_size (int): Maximum number of entries
+
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Get the value of a key and mark it as recently used."""
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            return default
+
+        return self._entries[key]
+
+    def set(self, key, value):
+        """Set the value of a key, discarding the least recently used entries above `max_size`.
+
+        Returns:
+            list: The discarded `(key, value)` entries.
+
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        evicted = []
+
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False))
+
+        return evicted
+
+
+def get_oldest_jobs_by_queue(connection, queue_class=None, batch_size=1000, cache=None, queues=None):
+    """Get the enqueue time of the job at the head of each queue.
+
+    The head job IDs of all the queues are read in a pipeline using `LINDEX`
+    then the `enqueued_at` field of these jobs is read using pipelined `HGET`
+    commands, so the number of round trips doesn't depend on the number of
+    queues or jobs.
+
+    Note:
+        The `cache` dict is updated with the enqueue time of the current head
+        jobs, the jobs that are still at the head of their queue on the next
+        call are not read again.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+        batch_size (int): Maximum number of commands per pipeline
+        cache (dict): Enqueue timestamps by job ID from the previous call
+        queues (list): RQ Queue instances, discovered using `get_queues` if not set
+
+    Returns:
+        dict: Enqueue timestamp of the oldest job by queue name, `None` for empty queues
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    cache = cache if cache is not None else {}
+
+    if queues is None:
+        queues = get_queues(connection, queue_class)
+
+    with command_phase(connection, 'oldest_jobs'):
+        head_ids = execute_pipelined(
+            connection, [('lindex', q.key, 0) for q in queues], batch_size
+        )
+
+    heads = {
+        q.name: (q, as_text(job_id) if job_id is not None else None)
+        for (q, job_id) in zip(queues, head_ids)
+    }
+
+    # Only the jobs that were not at the head of a queue on the last call
+    new_jobs = {
+        job_id: q.job_class.key_for(job_id)
+        for (q, job_id) in heads.values()
+        if job_id is not None and job_id not in cache
+    }
+
+    with command_phase(connection, 'oldest_jobs'):
+        replies = execute_pipelined(
+            connection, [('hget', key, 'enqueued_at') for key in new_jobs.values()], batch_size
+        )
+
+    timestamps = {
+        job_id: cache.get(job_id) for (_, job_id) in heads.values() if job_id is not None
+    }
+    timestamps.update(zip(new_jobs, map(parse_timestamp, replies)))
+
+    # Keep only the current head jobs
+    cache.clear()
+    cache.update((job_id, ts) for (job_id, ts) in timestamps.items() if ts is not None)
+
+    oldest_jobs = {}
+
+    for (queue_name, (_, job_id)) in heads.items():
+        if job_id is None:
+            oldest_jobs[queue_name] = None
+        elif timestamps[job_id] is not None:
+            oldest_jobs[queue_name] = timestamps[job_id]
+
+    return oldest_jobs
+
+
+def get_started_jobs_by_queue(connection, queue_class=None, batch_size=1000, limit=100, cache=None, queues=None):
+    """Get the expired entries count and the start time of the running jobs of each queue.
+
+    The started job registries of all the queues are read in a single pipeline,
+    `ZCOUNT` counts the entries whose score (the execution heartbeat expiry time)
+    is in the past and `ZRANGEBYSCORE` reads at most `limit` entries that are
+    not expired yet. The `started_at` field of the running jobs is then read
+    using pipelined `HGET` commands.
+
+    Note:
+        Unlike `StartedJobRegistry.get_job_ids` no cleanup is done, the expired
+        entries are only counted and are moved to the failed job registry by
+        the workers maintenance.
+        The `cache` dict is updated with the start time of the current running
+        jobs, the jobs still running on the next call are not read again.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+        batch_size (int): Maximum number of commands per pipeline
+        limit (int): Maximum number of running jobs read per queue
+        cache (dict): Start timestamps by job ID from the previous call
+        queues (list): RQ Queue instances, discovered using `get_queues` if not set
+
+    Returns:
+        dict: `(expired count, list of start timestamps)` tuple by queue name
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    cache = cache if cache is not None else {}
+
+    if queues is None:
+        queues = get_queues(connection, queue_class)
+
+    now = current_timestamp()
+
+    commands = []
+
+    for q in queues:
+        key = q.started_job_registry.key
+        commands.append(('zcount', key, '-inf', now))
+        commands.append(('zrangebyscore', key, f'({now}', '+inf', 0, limit))
+
+    with command_phase(connection, 'started_jobs'):
+        replies = execute_pipelined(connection, commands, batch_size)
+
+    running = {}
+
+    for (q, expired, entries) in zip(queues, replies[::2], replies[1::2]):
+        # The entries are `<job ID>:<execution ID>` composite keys
+        job_ids = [as_text(entry).rpartition(':')[0] or as_text(entry) for entry in entries]
+        running[q.name] = (q, expired, job_ids)
+
+    new_jobs = {
+        job_id: q.job_class.key_for(job_id)
+        for (q, _, job_ids) in running.values()
+        for job_id in job_ids
+        if job_id not in cache
+    }
+
+    with command_phase(connection, 'started_jobs'):
+        replies = execute_pipelined(
+            connection, [('hget', key, 'started_at') for key in new_jobs.values()], batch_size
+        )
+
+    timestamps = {
+        job_id: cache.get(job_id) for (_, _, job_ids) in running.values() for job_id in job_ids
+    }
+    timestamps.update(zip(new_jobs, map(parse_timestamp, replies)))
+
+    # Keep only the current running jobs
+    cache.clear()
+    cache.update((job_id, ts) for (job_id, ts) in timestamps.items() if ts is not None)
+
+    return {
+        queue_name: (expired, [timestamps[job_id] for job_id in job_ids if timestamps[job_id] is not None])
+        for (queue_name, (_, expired, job_ids)) in running.items()
+    }
+
+
+def get_queued_jobs_by_func(connection, queue_class=None, batch_size=1000, limit=100, cache=None, queues=None):
+    """Count the jobs at the head of each queue by function name.
+
+    At most `limit` job IDs are read from the head of each queue using pipelined
+    `LRANGE` commands, then the `description` field of the jobs missing from the
+    cache is read using pipelined `HGET` commands.
+
+    Note:
+        The job descriptions never change after the jobs are enqueued, the function
+        names are kept in the `cache` so that only the jobs enqueued since the last
+        call are read. Jobs deleted before being read are not counted.
+
+    Args:
+        connection (redis.Redis): Redis connection instance.
+        queue_class (type): RQ Queue class
+        batch_size (int): Maximum number of commands per pipeline
+        limit (int): Maximum number of jobs read per queue
+        cache (LRUCache): Function names by job ID from the previous calls
+        queues (list): RQ Queue instances, discovered using `get_queues` if not set
+
+    Returns:
+        dict: Jobs count by function name by queue name
+
+    Raises:
+        redis.exceptions.RedisError: On Redis connection errors
+
+    """
+    cache = cache if cache is not None else LRUCache()
+
+    if queues is None:
+        queues = get_queues(connection, queue_class)
+
+    with command_phase(connection, 'queued_jobs'):
+        replies = execute_pipelined(
+            connection, [('lrange', q.key, 0, limit - 1) for q in queues], batch_size
+        )
+
+    job_ids_by_queue = [
+        (q, [as_text(job_id) for job_id in job_ids]) for (q, job_ids) in zip(queues, replies)
+    ]
+
+    new_jobs = {
+        job_id: q.job_class.key_for(job_id)
+        for (q, job_ids) in job_ids_by_queue
+        for job_id in job_ids
+        if job_id not in cache
+    }
+
+    with command_phase(connection, 'queued_jobs'):
+        replies = execute_pipelined(
+            connection, [('hget', key, 'description') for key in new_jobs.values()], batch_size
+        )
+
+    for (job_id, description) in zip(new_jobs, replies):
+        func_name = parse_func_name(description)
+
+        if func_name is not None:
+            cache.set(job_id, func_name)
+
+    queued_jobs = {}
+
+    for (q, job_ids) in job_ids_by_queue:
+        counts = queued_jobs[q.name] = {}
+
+        for job_id in job_ids:
+            func_name = cache.get(job_id)
+
+            if func_name is not None:
+                counts[func_name] = counts.get(func_name, 0) + 1
+
+    return queued_jobs
@@ -0,0 +1,272 @@
+"""
+Tests for the rq_exporter.aio module.
+
+"""
+
+import asyncio
+import unittest
+from unittest.mock import patch, mock_open, Mock, MagicMock, AsyncMock
+
+from rq.job import JobStatus
+from redis.exceptions import RedisError
+from prometheus_client import Summary
+from prometheus_client.core import CollectorRegistry
+
+from rq_exporter.aio import (
+    execute_pipelined_async, get_workers_stats_async, get_jobs_by_queue_async,
+    get_async_redis_connection, AsyncRQCollector, AsyncExporter
+)
+from rq_exporter.utils import WORKER_FIELDS
+from rq_exporter.__main__ import parse_args, get_async_unsupported_options
+
+
+def mock_connection(*replies):
+    """Create a `redis.asyncio` connection mock with the pipelines replies."""
+    connection = MagicMock()
+    # The pipeline commands are buffered synchronously, only `execute` is awaited
+    pipeline = Mock()
+    pipeline.execute = AsyncMock(side_effect=list(replies))
+    connection.pipeline.return_value.__aenter__.return_value = pipeline
+    connection.smembers = AsyncMock()
+
+    return connection, pipeline
+
+
+class ExecutePipelinedAsyncTestCase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the `execute_pipelined_async` function."""
+
+    async def test_commands_are_sent_in_chunks(self):
+        """The commands must be sent in pipelines of at most `batch_size` commands."""
+        connection, pipeline = mock_connection([1, 2], [3])
+
+        results = await execute_pipelined_async(
+            connection,
+            [('llen', 'a'), ('zcard', 'b'), ('llen', 'c')],
+            batch_size=2
+        )
+
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(pipeline.execute.await_count, 2)
+        connection.pipeline.assert_called_with(transaction=False)
+
+    async def test_without_commands(self):
+        """No pipelines must be executed without any commands."""
+        connection, _ = mock_connection()
+
+        self.assertEqual(await execute_pipelined_async(connection, [], batch_size=10), [])
+
+        connection.pipeline.assert_not_called()
+
+
+class GetStatsAsyncTestCase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the `get_workers_stats_async` and `get_jobs_by_queue_async` functions."""
+
+    async def test_get_workers_stats_async(self):
+        """The worker hash fields must be fetched with HMGET and decoded."""
+        connection, pipeline = mock_connection([[b'busy', b'default', b'1', b'2', b'3']])
+        connection.smembers.return_value = [b'rq:worker:worker_one']
+
+        workers = await get_workers_stats_async(connection)
+
+        connection.smembers.assert_awaited_once_with('rq:workers')
+        pipeline.hmget.assert_called_once_with('rq:worker:worker_one', WORKER_FIELDS)
+
+        self.assertEqual(workers, [{
+            'name': 'worker_one',
+            'queues': ['default'],
+            'state': 'busy',
+            'successful_job_count': 1,
+            'failed_job_count': 2,
+            'total_working_time': 3,
+            'last_heartbeat': None,
+            'current_job_started_at': None
+        }])
+
+    async def test_get_jobs_by_queue_async(self):
+        """The jobs counts of each queue must be returned."""
+        connection, pipeline = mock_connection([2, 3, 15, 5, 1, 4])
+        connection.smembers.return_value = [b'rq:queue:default']
+
+        jobs = await get_jobs_by_queue_async(connection)
+
+        connection.smembers.assert_awaited_once_with('rq:queues')
+        pipeline.llen.assert_called_once_with('rq:queue:default')
+
+        self.assertEqual(jobs, {
+            'default': {
+                JobStatus.QUEUED: 2,
+                JobStatus.STARTED: 3,
+                JobStatus.FINISHED: 15,
+                JobStatus.FAILED: 5,
+                JobStatus.DEFERRED: 1,
+                JobStatus.SCHEDULED: 4
+            }
+        })
+
+
+@patch('rq_exporter.aio.get_jobs_by_queue_async')
+@patch('rq_exporter.aio.get_workers_stats_async')
+class AsyncRQCollectorTestCase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the `AsyncRQCollector` and `AsyncExporter` classes."""
+
+    def setUp(self):
+        """Register the summary metric on a test registry."""
+        self.registry = CollectorRegistry(auto_describe=True)
+
+        new_default_args = tuple(
+            self.registry if isinstance(arg, CollectorRegistry)
+            else arg for arg in Summary.__init__.__defaults__
+        )
+
+        patch(
+            'prometheus_client.metrics.Summary.__init__.__defaults__',
+            new_default_args
+        ).start()
+
+        self.addCleanup(patch.stopall)
+
+    async def test_concurrent_requests_share_the_collection(self, get_workers_stats_async,
+                                                            get_jobs_by_queue_async):
+        """Concurrent requests must wait for the in-flight collection."""
+        async def jobs_by_queue(*args):
+            await asyncio.sleep(0.01)
+            return {'default': {JobStatus.QUEUED: 2}}
+
+        get_workers_stats_async.return_value = []
+        get_jobs_by_queue_async.side_effect = jobs_by_queue
+
+        collector = AsyncRQCollector(Mock())
+
+        results = await asyncio.gather(*(collector.collect_once() for _ in range(3)))
+
+        get_jobs_by_queue_async.assert_awaited_once()
+        self.assertTrue(all(r is results[0] for r in results))
+        self.assertEqual(1, self.registry.get_sample_value('rq_request_processing_seconds_count'))
+
+    async def test_exporter_responses(self, get_workers_stats_async, get_jobs_by_queue_async):
+        """Test the exporter response for each request path."""
+        get_workers_stats_async.return_value = []
+        get_jobs_by_queue_async.return_value = {'default': {JobStatus.QUEUED: 2}}
+
+        exporter = AsyncExporter(AsyncRQCollector(Mock()))
+
+        status, metrics, _ = await exporter.get_response('GET', '/metrics', '')
+        self.assertEqual(status, '200 OK')
+        self.assertIn('rq_jobs', [m.name for m in metrics])
+
+        status, _, _ = await exporter.get_response('POST', '/metrics', '')
+        self.assertEqual(status, '405 Method Not Allowed')
+
+        get_jobs_by_queue_async.side_effect = RedisError('Connection error')
+
+        with self.assertLogs('rq_exporter.aio', 'ERROR'):
+            status, metrics, _ = await exporter.get_response('GET', '/metrics', '')
+
+        self.assertEqual(status, '500 Internal Server Error')
+        self.assertEqual(metrics, None)
+
+
+class AsyncExporterHandleTestCase(unittest.IsolatedAsyncioTestCase):
+    """Tests for the `AsyncExporter.handle` method."""
+
+    def setUp(self):
+        self.collector = Mock()
+        self.collector.collect_once = AsyncMock(return_value=[])
+
+        self.exporter = AsyncExporter(self.collector, request_timeout=0.05)
+
+    async def handle(self, data, eof=True):
+        """Handle a request with the `data` sent by the client, return the response."""
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+
+        if eof:
+            reader.feed_eof()
+
+        writer = Mock()
+        writer.drain = AsyncMock()
+
+        await self.exporter.handle(reader, writer)
+
+        writer.close.assert_called_once()
+
+        return b''.join(c[0][0] for c in writer.write.call_args_list)
+
+    async def test_request(self):
+        """A valid request must get the metrics."""
+        response = await self.handle(b'GET /metrics HTTP/1.1\r\nAccept: text/plain\r\n\r\n')
+
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.collector.collect_once.assert_awaited_once()
+
+    async def test_malformed_requests(self):
+        """Malformed request lines and headers must get a 400 response."""
+        for data in [
+            b'GET /metrics\r\n\r\n',
+            b'GET /m\xc3\xa9trics HTTP/1.1\r\n\r\n',
+            b'GET /metrics HTTP/1.1\r\nnot a header\r\n\r\n',
+            b'GET /metrics HTTP/1.1\r\n' + b'X-Header: 1\r\n' * 101 + b'\r\n',
+        ]:
+            with self.subTest(data=data[:40]):
+                response = await self.handle(data)
+
+                self.assertTrue(response.startswith(b'HTTP/1.1 400 Bad Request\r\n'))
+
+        self.collector.collect_once.assert_not_awaited()
+
+    async def test_request_timeout(self):
+        """The connection of a client not sending its request must be closed without response."""
+        response = await self.handle(b'GET /metrics HTTP/1.1\r\n', eof=False)
+
+        self.assertEqual(response, b'')
+        self.collector.collect_once.assert_not_awaited()
+
+    async def test_closed_without_request(self):
+        """A connection closed without request must not get a response."""
+        self.assertEqual(await self.handle(b''), b'')
+
+
+class GetAsyncRedisConnectionTestCase(unittest.TestCase):
+    """Tests for the `get_async_redis_connection` function."""
+
+    def test_sentinel_and_password_file(self):
+        """The Sentinel addresses and the password file must be parsed like the synchronous connection."""
+        with patch('builtins.open', mock_open(read_data='secret\n')) as open_mock, \
+                patch('rq_exporter.aio.Sentinel') as Sentinel:
+            connection = get_async_redis_connection(
+                sentinel='sentinel1:26380,sentinel2', sentinel_master='mymaster', password_file='/run/pass'
+            )
+
+        open_mock.assert_called_once_with('/run/pass', 'r')
+        Sentinel.assert_called_once_with(
+            [('sentinel1', '26380'), ('sentinel2', '26379')],
+            sentinel_kwargs={'password': 'secret', 'socket_timeout': 1}
+        )
+        Sentinel().master_for.assert_called_once_with(
+            'mymaster', password='secret', db='0', socket_timeout=1
+        )
+        self.assertEqual(connection, Sentinel().master_for.return_value)
+
+
+class AsyncUnsupportedOptionsTestCase(unittest.TestCase):
+    """Tests for the `get_async_unsupported_options` function."""
+
+    def parse_args(self, *argv):
+        with patch('sys.argv', ['rq-exporter', '--async', *argv]):
+            return parse_args()
+
+    def test_default_options(self):
+        """The default options must be supported."""
+        self.assertEqual(get_async_unsupported_options(self.parse_args('--batch-size', '100', '--probe')), [])
+
+    def test_unsupported_options(self):
+        """The unsupported options that are set must be returned."""
+        args = self.parse_args(
+            '--redis-retries', '3', '--oldest-jobs', '--worker-aggregation', 'queues',
+            '--breaker-threshold', '5', '--breaker-reset-timeout', '10'
+        )
+
+        self.assertEqual(
+            get_async_unsupported_options(args),
+            ['--redis-retries', '--oldest-jobs', '--worker-aggregation', '--breaker-threshold']
+        )
@@ -0,0 +1,59 @@
+"""
+Tests for the rq_exporter.breaker module.
+
+"""
+
+import unittest
+from unittest.mock import patch
+
+from rq_exporter.breaker import CircuitBreaker, CircuitOpenError
+
+
+@patch('rq_exporter.breaker.time.monotonic', return_value=100)
+class CircuitBreakerTestCase(unittest.TestCase):
+    """Tests for the `CircuitBreaker` class."""
+
+    def test_opens_after_consecutive_failures(self, monotonic):
+        """The circuit must open after `failure_threshold` consecutive failures."""
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        breaker.before_call()
+        self.assertFalse(breaker.is_open)
+
+        breaker.record_failure()
+
+        self.assertTrue(breaker.is_open)
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_half_open_trial(self, monotonic):
+        """A single trial call must be allowed after `reset_timeout`."""
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+        breaker.record_failure()
+
+        monotonic.return_value = 131
+
+        breaker.before_call()
+
+        # Only one trial at a time
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        # A failed trial opens the circuit again
+        breaker.record_failure()
+
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        monotonic.return_value = 162
+
+        breaker.before_call()
+        breaker.record_success()
+
+        self.assertFalse(breaker.is_open)
+        breaker.before_call()
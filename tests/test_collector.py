@@ -3,14 +3,20 @@ Tests for the rq_exporter.collector module.
 
 """
 
+import time
 import unittest
+import threading
 from unittest.mock import patch, Mock
 
+from redis.exceptions import RedisError, ResponseError
+
 from rq.job import JobStatus
 from prometheus_client import Summary
 from prometheus_client.core import CollectorRegistry
 
+from rq_exporter.breaker import CircuitOpenError
 from rq_exporter.collector import RQCollector
+from rq_exporter.sentinel import ReplicaConnectionPool
 
 
 @patch('rq_exporter.collector.get_jobs_by_queue')
@@ -24,6 +30,9 @@ class RQCollectorTestCase(unittest.TestCase):
     workers_failed_metric = 'rq_workers_failed_total'
     workers_working_time_metric = 'rq_workers_working_time_total'
     jobs_metric = 'rq_jobs'
+    oldest_job_age_metric = 'rq_queue_oldest_job_age_seconds'
+    snapshot_age_metric = 'rq_exporter_snapshot_age_seconds'
+    collection_success_metric = 'rq_exporter_last_collection_success'
 
     def setUp(self):
         """Prepare for the tests.
@@ -52,6 +61,10 @@ class RQCollectorTestCase(unittest.TestCase):
             new_default_args
         ).start()
 
+        # The queues are discovered once per collection and passed to the phases
+        self.queues = []
+        self.get_queues = patch('rq_exporter.collector.get_queues', return_value=self.queues).start()
+
         # On cleanup call patch.stopall
         self.addCleanup(patch.stopall)
 
@@ -101,7 +114,7 @@ class RQCollectorTestCase(unittest.TestCase):
         list(collector.collect())
 
         get_workers_stats.assert_called_once_with(connection, None)
-        get_jobs_by_queue.assert_called_once_with(connection, None)
+        get_jobs_by_queue.assert_called_once_with(connection, None, queues=self.queues)
 
     def test_passed_rq_classes_are_used(self, get_workers_stats, get_jobs_by_queue):
         """Test that the RQ classes passed to `RQCollector` are used to get the workers and jobs."""
@@ -121,7 +134,100 @@ class RQCollectorTestCase(unittest.TestCase):
         list(collector.collect())
 
         get_workers_stats.assert_called_once_with(connection, worker_class)
-        get_jobs_by_queue.assert_called_once_with(connection, queue_class)
+        get_jobs_by_queue.assert_called_once_with(connection, queue_class, queues=self.queues)
+
+    @patch('rq_exporter.collector.get_oldest_jobs_by_queue')
+    @patch('rq_exporter.collector.get_jobs_by_queue_batched')
+    @patch('rq_exporter.collector.get_workers_stats_batched')
+    def test_batched_collection(self, get_workers_stats_batched, get_jobs_by_queue_batched,
+                                get_oldest_jobs_by_queue, get_workers_stats, get_jobs_by_queue):
+        """When `batch_size` is set the workers and jobs must be collected using pipelines."""
+        get_workers_stats_batched.return_value = [{
+            'name': 'worker_one',
+            'queues': ['default'],
+            'state': 'idle',
+            'successful_job_count': 1,
+            'failed_job_count': 2,
+            'total_working_time': 3,
+        }]
+        get_jobs_by_queue_batched.return_value = {'default': {JobStatus.QUEUED: 3}}
+        get_oldest_jobs_by_queue.return_value = {'default': time.time() - 60, 'empty': None}
+
+        connection = Mock()
+
+        collector = RQCollector(connection, batch_size=100, oldest_jobs=True)
+
+        self.registry.register(collector)
+        list(self.registry.collect())
+
+        get_workers_stats_batched.assert_called_once_with(connection, None, 100)
+        get_jobs_by_queue_batched.assert_called_once_with(connection, None, 100, None, queues=self.queues)
+        get_oldest_jobs_by_queue.assert_called_once_with(connection, None, 100, collector._oldest_jobs_cache, queues=self.queues)
+
+        get_workers_stats.assert_not_called()
+        get_jobs_by_queue.assert_not_called()
+
+        self.assertEqual(1, self.registry.get_sample_value(
+            self.workers_metric, {'name': 'worker_one', 'state': 'idle', 'queues': 'default'}
+        ))
+        self.assertEqual(3, self.registry.get_sample_value(
+            self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+        ))
+
+        self.assertTrue(60 <= self.registry.get_sample_value(
+            self.oldest_job_age_metric, {'queue': 'default'}
+        ) < 70)
+        self.assertEqual(0, self.registry.get_sample_value(
+            self.oldest_job_age_metric, {'queue': 'empty'}
+        ))
+
+    @patch('rq_exporter.collector.get_oldest_jobs_by_queue')
+    def test_oldest_jobs_option(self, get_oldest_jobs_by_queue, get_workers_stats, get_jobs_by_queue):
+        """The oldest jobs must only be read when `oldest_jobs` is set, with or without `batch_size`."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+        get_oldest_jobs_by_queue.return_value = {'default': None}
+
+        connection = Mock()
+
+        collector = RQCollector(connection)
+        metrics = {m.name for m in collector.collect()}
+
+        get_oldest_jobs_by_queue.assert_not_called()
+        self.assertNotIn(self.oldest_job_age_metric, metrics)
+
+        collector.oldest_jobs = True
+        metrics = {m.name for m in collector.collect()}
+
+        get_oldest_jobs_by_queue.assert_called_once_with(connection, None, 1000, collector._oldest_jobs_cache, queues=self.queues)
+        self.assertIn(self.oldest_job_age_metric, metrics)
+
+    @patch('rq_exporter.collector.get_queued_jobs_by_func', return_value={})
+    @patch('rq_exporter.collector.get_started_jobs_by_queue', return_value={})
+    @patch('rq_exporter.collector.get_oldest_jobs_by_queue', return_value={})
+    def test_queues_discovered_once(self, get_oldest_jobs_by_queue, get_started_jobs_by_queue,
+                                    get_queued_jobs_by_func, get_workers_stats, get_jobs_by_queue):
+        """The queues must be discovered once per collection and passed to all the phases."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        connection = Mock()
+        collector = RQCollector(
+            connection, oldest_jobs=True, started_limit=10, queued_limit=10, scan_limit=10
+        )
+
+        with patch.object(collector.finished_jobs_scanner, 'scan') as scan:
+            list(collector.collect())
+
+        self.get_queues.assert_called_once_with(connection, None)
+
+        for phase in (get_jobs_by_queue, get_oldest_jobs_by_queue, get_started_jobs_by_queue,
+                      get_queued_jobs_by_func, scan):
+            self.assertIs(phase.call_args[1]['queues'], self.queues)
+
+        list(collector.collect())
+
+        self.assertEqual(self.get_queues.call_count, 2)
 
     def test_metrics_with_empty_data(self, get_workers_stats, get_jobs_by_queue):
         """Test the workers and jobs metrics when there's no data."""
@@ -182,11 +288,11 @@ class RQCollectorTestCase(unittest.TestCase):
 
         connection = Mock()
 
-        # On registration the `collect` method is called
         self.registry.register(RQCollector(connection))
+        list(self.registry.collect())
 
         get_workers_stats.assert_called_once_with(connection, None)
-        get_jobs_by_queue.assert_called_once_with(connection, None)
+        get_jobs_by_queue.assert_called_once_with(connection, None, queues=self.queues)
 
         for w in workers:
             self.assertEqual(1, self.registry.get_sample_value(
@@ -221,3 +327,588 @@ class RQCollectorTestCase(unittest.TestCase):
                         {'queue': queue, 'status': status}
                     )
                 )
+
+    def test_polling_registration_does_not_collect(self, get_workers_stats, get_jobs_by_queue):
+        """When polling is enabled, the registration must not access Redis."""
+        self.registry.register(RQCollector(Mock(), poll_interval=10))
+
+        get_workers_stats.assert_not_called()
+        get_jobs_by_queue.assert_not_called()
+
+        self.assertEqual(0, self.registry.get_sample_value(self.collection_success_metric))
+        self.assertEqual(None, self.registry.get_sample_value(self.snapshot_age_metric))
+
+    def test_polling_serves_the_latest_snapshot(self, get_workers_stats, get_jobs_by_queue):
+        """When polling is enabled, the metrics must be served from the latest snapshot."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {'default': {JobStatus.QUEUED: 2}}
+
+        collector = RQCollector(Mock(), poll_interval=10)
+        self.registry.register(collector)
+
+        collector.poll()
+
+        # Scrapes don't access Redis
+        for _ in range(3):
+            self.assertEqual(2, self.registry.get_sample_value(
+                self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+            ))
+
+        get_jobs_by_queue.assert_called_once()
+
+        self.assertEqual(1, self.registry.get_sample_value(self.collection_success_metric))
+        self.assertTrue(self.registry.get_sample_value(self.snapshot_age_metric) >= 0)
+        self.assertEqual(1, self.registry.get_sample_value(f'{self.summary_metric}_count'))
+
+    def test_polling_error_keeps_the_previous_snapshot(self, get_workers_stats, get_jobs_by_queue):
+        """On collection errors, the previous snapshot must be kept and marked as failed."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.side_effect = [
+            {'default': {JobStatus.QUEUED: 2}},
+            RedisError('Connection error')
+        ]
+
+        collector = RQCollector(Mock(), poll_interval=10)
+        self.registry.register(collector)
+
+        collector.poll()
+        timestamp = collector.snapshot.timestamp
+
+        with self.assertLogs('rq_exporter.collector', 'ERROR'):
+            collector.poll()
+
+        self.assertEqual(timestamp, collector.snapshot.timestamp)
+        self.assertEqual(0, self.registry.get_sample_value(self.collection_success_metric))
+        self.assertEqual(2, self.registry.get_sample_value(
+            self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+        ))
+
+    def test_polling_thread(self, get_workers_stats, get_jobs_by_queue):
+        """The polling thread must collect the metrics until it's stopped."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), poll_interval=0.01)
+        collector.start_polling()
+        self.addCleanup(collector.stop_polling)
+
+        for _ in range(100):
+            if get_jobs_by_queue.call_count >= 2:
+                break
+            time.sleep(0.01)
+
+        collector.stop_polling()
+
+        self.assertTrue(get_jobs_by_queue.call_count >= 2)
+        self.assertTrue(collector.snapshot.success)
+
+    def test_concurrent_requests_share_the_collection(self, get_workers_stats, get_jobs_by_queue):
+        """Requests arriving during a collection must wait for its result."""
+        started = threading.Event()
+        release = threading.Event()
+
+        def blocking_workers_stats(*args):
+            started.set()
+            release.wait(5)
+            return []
+
+        get_workers_stats.side_effect = blocking_workers_stats
+        get_jobs_by_queue.return_value = {'default': {JobStatus.QUEUED: 2}}
+
+        collector = RQCollector(Mock())
+        results = []
+
+        def scrape():
+            results.append(list(collector.collect()))
+
+        threads = [threading.Thread(target=scrape) for _ in range(3)]
+        threads[0].start()
+        started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        # Let the waiting requests reach the in-flight collection
+        time.sleep(0.05)
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        get_workers_stats.assert_called_once()
+        get_jobs_by_queue.assert_called_once()
+
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(r == results[0] for r in results))
+
+    def test_reuse_window(self, get_workers_stats, get_jobs_by_queue):
+        """A finished collection must be reused only within the reuse window."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), reuse_window=60)
+
+        list(collector.collect())
+        list(collector.collect())
+
+        get_jobs_by_queue.assert_called_once()
+
+        # Without a reuse window every request starts a new collection
+        collector.reuse_window = 0
+
+        list(collector.collect())
+        list(collector.collect())
+
+        self.assertEqual(get_jobs_by_queue.call_count, 3)
+
+    def test_failed_collection_is_not_reused(self, get_workers_stats, get_jobs_by_queue):
+        """A failed collection must not be reused by the next requests."""
+        get_workers_stats.side_effect = [RedisError('Connection error'), []]
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), reuse_window=60)
+
+        with self.assertRaises(RedisError):
+            list(collector.collect())
+
+        list(collector.collect())
+
+        self.assertEqual(get_workers_stats.call_count, 2)
+
+    def test_finished_jobs_histograms(self, get_workers_stats, get_jobs_by_queue):
+        """When `scan_limit` is set the finished jobs must be scanned on each collection."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        connection = Mock()
+        collector = RQCollector(connection, scan_limit=100)
+
+        with patch.object(collector.finished_jobs_scanner, 'scan') as scan:
+            list(collector.collect())
+
+            scan.assert_called_once_with(connection, None, 1000, queues=self.queues)
+
+        self.assertEqual(collector.finished_jobs_scanner.max_entries, 100)
+
+    def test_failed_jobs_counters(self, get_workers_stats, get_jobs_by_queue):
+        """When `failed_scan_limit` is set the failed jobs must be scanned on each collection."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        connection = Mock()
+        collector = RQCollector(connection, failed_scan_limit=100)
+        collector.failed_jobs_scanner.counts[('default', 'tasks.add', 'ValueError')] = 3
+
+        with patch.object(collector.failed_jobs_scanner, 'scan') as scan:
+            metrics = {metric.name: metric for metric in collector.collect()}
+
+            scan.assert_called_once_with(connection, None, 1000, queues=self.queues)
+
+        self.assertEqual(metrics['rq_failed_jobs_by_exception'].samples[0].value, 3)
+        self.assertEqual(collector.failed_jobs_scanner.max_entries, 100)
+
+    @patch('rq_exporter.collector.time.time', return_value=1588327300)
+    @patch('rq_exporter.collector.get_started_jobs_by_queue')
+    def test_started_jobs_metrics(self, get_started_jobs_by_queue, time_mock,
+                                  get_workers_stats, get_jobs_by_queue):
+        """When `started_limit` is set the running jobs histogram and the expired count must be collected."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+        get_started_jobs_by_queue.return_value = {'default': (2, [1588327299, 1588327000])}
+
+        connection = Mock()
+        collector = RQCollector(connection, started_limit=20)
+
+        self.registry.register(collector)
+        list(self.registry.collect())
+
+        get_started_jobs_by_queue.assert_called_once_with(
+            connection, None, 1000, 20, collector._started_jobs_cache, queues=self.queues
+        )
+
+        self.assertEqual(2, self.registry.get_sample_value(
+            'rq_jobs_expired_started', {'queue': 'default'}
+        ))
+        self.assertEqual(1, self.registry.get_sample_value(
+            'rq_job_running_seconds_bucket', {'queue': 'default', 'le': '1.0'}
+        ))
+        self.assertEqual(1, self.registry.get_sample_value(
+            'rq_job_running_seconds_bucket', {'queue': 'default', 'le': '120.0'}
+        ))
+        self.assertEqual(2, self.registry.get_sample_value(
+            'rq_job_running_seconds_bucket', {'queue': 'default', 'le': '300.0'}
+        ))
+        self.assertEqual(2, self.registry.get_sample_value(
+            'rq_job_running_seconds_gcount', {'queue': 'default'}
+        ))
+        self.assertEqual(301, self.registry.get_sample_value(
+            'rq_job_running_seconds_gsum', {'queue': 'default'}
+        ))
+
+    @patch('rq_exporter.collector.get_queued_jobs_by_func')
+    def test_queued_jobs_metrics(self, get_queued_jobs_by_func, get_workers_stats, get_jobs_by_queue):
+        """When `queued_limit` is set the queued jobs must be counted by function."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+        get_queued_jobs_by_func.return_value = {'default': {'tasks.add': 3}}
+
+        connection = Mock()
+        collector = RQCollector(connection, queued_limit=50, queued_cache_size=100)
+
+        self.registry.register(collector)
+
+        self.assertEqual(3, self.registry.get_sample_value(
+            'rq_queued_jobs_by_func', {'queue': 'default', 'func': 'tasks.add'}
+        ))
+
+        get_queued_jobs_by_func.assert_called_with(
+            connection, None, 1000, 50, collector._queued_jobs_cache, queues=self.queues
+        )
+        self.assertEqual(collector._queued_jobs_cache.max_size, 100)
+
+    def test_worker_aggregation(self, get_workers_stats, get_jobs_by_queue):
+        """The workers must be aggregated by queue set except the workers kept in detail."""
+        get_workers_stats.return_value = [
+            {'name': 'w1', 'state': 'idle', 'queues': ['default'], 'successful_job_count': 1,
+             'failed_job_count': 0, 'total_working_time': 10},
+            {'name': 'w2', 'state': 'idle', 'queues': ['default'], 'successful_job_count': 2,
+             'failed_job_count': 1, 'total_working_time': 20},
+            {'name': 'w3', 'state': 'busy', 'queues': ['default', 'high'], 'successful_job_count': 3,
+             'failed_job_count': 0, 'total_working_time': 30},
+            {'name': 'w4', 'state': 'busy', 'queues': ['high'], 'successful_job_count': 4,
+             'failed_job_count': 0, 'total_working_time': 1},
+        ]
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(
+            Mock(), worker_aggregation='queues', worker_allowlist=['w4'], worker_top=1
+        )
+
+        self.registry.register(collector)
+
+        # Kept in detail
+        self.assertEqual(1, self.registry.get_sample_value(
+            self.workers_metric, {'name': 'w3', 'state': 'busy', 'queues': 'default,high'}
+        ))
+        self.assertEqual(4, self.registry.get_sample_value(
+            self.workers_success_metric, {'name': 'w4', 'queues': 'high'}
+        ))
+
+        # Aggregated
+        self.assertEqual(2, self.registry.get_sample_value(
+            self.workers_metric, {'name': '', 'state': 'idle', 'queues': 'default'}
+        ))
+        self.assertEqual(3, self.registry.get_sample_value(
+            self.workers_success_metric, {'name': '', 'queues': 'default'}
+        ))
+        self.assertEqual(30, self.registry.get_sample_value(
+            self.workers_working_time_metric, {'name': '', 'queues': 'default'}
+        ))
+        self.assertIsNone(self.registry.get_sample_value(
+            self.workers_metric, {'name': 'w1', 'state': 'idle', 'queues': 'default'}
+        ))
+
+    def test_worker_aggregation_by_queue(self, get_workers_stats, get_jobs_by_queue):
+        """A worker listening on multiple queues must be counted for each queue."""
+        get_workers_stats.return_value = [
+            {'name': 'w1', 'state': 'busy', 'queues': ['default', 'high'], 'successful_job_count': 3,
+             'failed_job_count': 1, 'total_working_time': 30},
+            {'name': 'w2', 'state': 'busy', 'queues': ['high'], 'successful_job_count': 4,
+             'failed_job_count': 0, 'total_working_time': 1},
+        ]
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), worker_aggregation='queue')
+
+        self.registry.register(collector)
+
+        self.assertEqual(1, self.registry.get_sample_value(
+            self.workers_metric, {'name': '', 'state': 'busy', 'queues': 'default'}
+        ))
+        self.assertEqual(2, self.registry.get_sample_value(
+            self.workers_metric, {'name': '', 'state': 'busy', 'queues': 'high'}
+        ))
+        self.assertEqual(7, self.registry.get_sample_value(
+            self.workers_success_metric, {'name': '', 'queues': 'high'}
+        ))
+        self.assertEqual(1, self.registry.get_sample_value(
+            self.workers_failed_metric, {'name': '', 'queues': 'default'}
+        ))
+
+    @patch('rq_exporter.collector.time.time', return_value=1000)
+    def test_worker_aggregation_with_mixed_states(self, time_mock, get_workers_stats, get_jobs_by_queue):
+        """The counters of the idle and busy workers of a queue set must be summed in a single series."""
+        get_workers_stats.return_value = [
+            {'name': 'w1', 'state': 'idle', 'queues': ['q'], 'successful_job_count': 5,
+             'failed_job_count': 1, 'total_working_time': 10, 'last_heartbeat': 990,
+             'current_job_started_at': None},
+            {'name': 'w2', 'state': 'busy', 'queues': ['q'], 'successful_job_count': 7,
+             'failed_job_count': 2, 'total_working_time': 20, 'last_heartbeat': 995,
+             'current_job_started_at': 950},
+        ]
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), worker_aggregation='queues')
+
+        metrics = {m.name: m for m in collector.collect()}
+
+        self.assertEqual(
+            sorted((s.labels['state'], s.value) for s in metrics['rq_workers'].samples),
+            [('busy', 1), ('idle', 1)]
+        )
+
+        for (name, value) in [('rq_workers_success', 12), ('rq_workers_failed', 3),
+                              ('rq_workers_working_time', 30), ('rq_worker_heartbeat_age_seconds', 10),
+                              ('rq_worker_current_job_seconds', 50)]:
+            samples = [s for s in metrics[name].samples if not s.name.endswith('_created')]
+            self.assertEqual([(s.labels, s.value) for s in samples], [({'name': '', 'queues': 'q'}, value)])
+
+    @patch('rq_exporter.collector.time.time', return_value=1000)
+    def test_worker_heartbeat_and_current_job(self, time_mock, get_workers_stats, get_jobs_by_queue):
+        """The heartbeat age and the current job time must be exported, the oldest when aggregated."""
+        get_workers_stats.return_value = [
+            {'name': 'w1', 'state': 'busy', 'queues': ['default'], 'successful_job_count': 1,
+             'failed_job_count': 0, 'total_working_time': 10, 'last_heartbeat': 990,
+             'current_job_started_at': 900},
+            {'name': 'w2', 'state': 'busy', 'queues': ['default'], 'successful_job_count': 2,
+             'failed_job_count': 0, 'total_working_time': 20, 'last_heartbeat': 995,
+             'current_job_started_at': 950},
+            {'name': 'w3', 'state': 'idle', 'queues': ['high'], 'successful_job_count': 0,
+             'failed_job_count': 0, 'total_working_time': 0, 'last_heartbeat': 998,
+             'current_job_started_at': None},
+        ]
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), worker_aggregation='queues')
+
+        self.registry.register(collector)
+
+        self.assertEqual(10, self.registry.get_sample_value(
+            'rq_worker_heartbeat_age_seconds', {'name': '', 'queues': 'default'}
+        ))
+        self.assertEqual(100, self.registry.get_sample_value(
+            'rq_worker_current_job_seconds', {'name': '', 'queues': 'default'}
+        ))
+        self.assertEqual(2, self.registry.get_sample_value(
+            'rq_worker_heartbeat_age_seconds', {'name': '', 'queues': 'high'}
+        ))
+        self.assertIsNone(self.registry.get_sample_value(
+            'rq_worker_current_job_seconds', {'name': '', 'queues': 'high'}
+        ))
+
+    @patch('rq_exporter.collector.get_oldest_jobs_by_queue', return_value={})
+    @patch('rq_exporter.collector.get_jobs_by_queue_batched')
+    @patch('rq_exporter.collector.get_workers_stats_batched')
+    def test_scheduler_metrics(self, get_workers_stats_batched, get_jobs_by_queue_batched,
+                               get_oldest_jobs_by_queue, get_workers_stats, get_jobs_by_queue):
+        """The scheduler stats must be read with the batched job counts."""
+        def jobs_by_queue(connection, queue_class, batch_size, scheduler_stats, queues):
+            scheduler_stats['default'] = {'overdue': 3, 'max_lag': 120, 'lock_held': False}
+            return {'default': {JobStatus.SCHEDULED: 5}}
+
+        get_workers_stats_batched.return_value = []
+        get_jobs_by_queue_batched.side_effect = jobs_by_queue
+
+        collector = RQCollector(Mock(), batch_size=100, scheduler_metrics=True)
+
+        metrics = {m.name: m for m in collector.collect()}
+
+        self.assertEqual(metrics['rq_scheduled_jobs_overdue'].samples[0].value, 3)
+        self.assertEqual(metrics['rq_scheduled_jobs_max_lag_seconds'].samples[0].value, 120)
+        self.assertEqual(metrics['rq_scheduler_lock_held'].samples[0].value, 0)
+
+    def test_circuit_breaker(self, get_workers_stats, get_jobs_by_queue):
+        """The collections must fail fast while the circuit is open."""
+        get_workers_stats.side_effect = RedisError
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), breaker_threshold=2)
+
+        for _ in range(2):
+            with self.assertRaises(RedisError):
+                collector.collect_once()
+
+        with self.assertRaises(CircuitOpenError):
+            collector.collect_once()
+
+        self.assertEqual(get_workers_stats.call_count, 2)
+
+    def test_circuit_breaker_trial_error(self, get_workers_stats, get_jobs_by_queue):
+        """A trial collection failing with any error must not keep the circuit open."""
+        get_workers_stats.side_effect = RedisError
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), breaker_threshold=1, breaker_reset_timeout=0)
+
+        with self.assertRaises(RedisError):
+            collector.collect_once()
+
+        get_workers_stats.side_effect = ValueError
+
+        with self.assertRaises(ValueError):
+            collector.collect_once()
+
+        get_workers_stats.side_effect = None
+        get_workers_stats.return_value = []
+
+        collector.collect_once()
+
+        self.assertFalse(collector.breaker.is_open)
+
+    def test_circuit_breaker_serve_stale(self, get_workers_stats, get_jobs_by_queue):
+        """The last successful collection must be served while the circuit is open."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {'default': {JobStatus.QUEUED: 2}}
+
+        collector = RQCollector(Mock(), breaker_threshold=1, serve_stale=True)
+
+        self.registry.register(collector)
+        list(self.registry.collect())
+
+        get_jobs_by_queue.side_effect = RedisError
+
+        with self.assertRaises(RedisError):
+            collector.collect_once()
+
+        self.assertEqual(2, self.registry.get_sample_value(
+            self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+        ))
+        self.assertEqual(1, self.registry.get_sample_value('rq_exporter_circuit_open'))
+        self.assertEqual(get_jobs_by_queue.call_count, 2)
+
+    def test_scrape_deadline(self, get_workers_stats, get_jobs_by_queue):
+        """The collection phases starting after the deadline must be skipped."""
+        get_jobs_by_queue.return_value = {'default': {JobStatus.QUEUED: 2}}
+
+        collector = RQCollector(Mock())
+
+        self.registry.register(collector)
+
+        # The deadline is exceeded while collecting the workers
+        get_workers_stats.side_effect = lambda *args: time.sleep(0.02) or []
+
+        with collector.deadline(0.01):
+            self.assertEqual(1, self.registry.get_sample_value('rq_exporter_partial_scrape'))
+
+        get_jobs_by_queue.assert_not_called()
+
+        with collector.deadline(10):
+            self.assertEqual(0, self.registry.get_sample_value('rq_exporter_partial_scrape'))
+            self.assertEqual(2, self.registry.get_sample_value(
+                self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+            ))
+
+        # Without a deadline the marker is not exported
+        self.assertIsNone(self.registry.get_sample_value('rq_exporter_partial_scrape'))
+
+    def test_partial_collection_is_not_reused(self, get_workers_stats, get_jobs_by_queue):
+        """A partial collection must not be reused by the next requests."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        collector = RQCollector(Mock(), reuse_window=60)
+
+        with collector.deadline(0):
+            list(collector.collect())
+
+        list(collector.collect())
+
+        get_workers_stats.assert_called_once()
+
+    def test_registration_does_not_collect(self, get_workers_stats, get_jobs_by_queue):
+        """The registration must not access Redis."""
+        collector = RQCollector(Mock(), batch_size=100, scan_limit=10, started_limit=10,
+                                poll_interval=10, breaker_threshold=1, oldest_jobs=True)
+
+        self.registry.register(collector)
+
+        get_workers_stats.assert_not_called()
+        get_jobs_by_queue.assert_not_called()
+
+        names = {metric.name for metric in collector.describe()}
+
+        self.assertTrue({
+            'rq_workers', 'rq_jobs', 'rq_queue_oldest_job_age_seconds', 'rq_job_duration_seconds',
+            'rq_job_running_seconds', 'rq_exporter_partial_scrape', 'rq_exporter_circuit_open',
+            'rq_exporter_snapshot_age_seconds',
+        } <= names)
+
+        # A second collector exporting the same metrics can't be registered
+        with self.assertRaises(ValueError):
+            self.registry.register(RQCollector(Mock(), summary=Mock()))
+
+    @patch('rq_exporter.collector.iter_jobs_by_queue')
+    @patch('rq_exporter.collector.iter_workers_stats')
+    def test_streaming_collection(self, iter_workers_stats, iter_jobs_by_queue,
+                                  get_workers_stats, get_jobs_by_queue):
+        """When `streaming` is set the workers and queues must be read in chunks."""
+        iter_workers_stats.return_value = iter([{
+            'name': 'worker_one',
+            'queues': ['default'],
+            'state': 'idle',
+            'successful_job_count': 1,
+            'failed_job_count': 2,
+            'total_working_time': 3,
+        }])
+        iter_jobs_by_queue.return_value = iter([('default', {JobStatus.QUEUED: 3})])
+
+        connection = Mock()
+        collector = RQCollector(connection, streaming=True)
+
+        metrics = {metric.name: metric for metric in collector.get_metrics()}
+
+        iter_workers_stats.assert_called_once_with(connection, None, 1000)
+        iter_jobs_by_queue.assert_called_once_with(connection, None, 1000)
+        get_workers_stats.assert_not_called()
+        get_jobs_by_queue.assert_not_called()
+
+        self.assertEqual(metrics['rq_workers'].samples[0].labels['name'], 'worker_one')
+        self.assertEqual(metrics['rq_jobs'].samples[0].value, 3)
+
+    def test_lua_script_collection(self, get_workers_stats, get_jobs_by_queue):
+        """When `lua_script` is set the workers and jobs must be collected using the script."""
+        collector = RQCollector(Mock(), lua_script=True)
+        collector.script = Mock(return_value=([], {'default': {JobStatus.QUEUED: 3}}))
+
+        self.registry.register(collector)
+
+        self.assertEqual(3, self.registry.get_sample_value(
+            self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+        ))
+
+        collector.script.assert_called_once()
+        get_workers_stats.assert_not_called()
+        get_jobs_by_queue.assert_not_called()
+
+    def test_redis_nodes_metric(self, get_workers_stats, get_jobs_by_queue):
+        """The nodes that served the collection must be exported with Sentinel replica reads."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {}
+
+        pool = Mock(spec=ReplicaConnectionPool)
+        pool.pop_served_nodes.side_effect = [{('10.0.0.1:6379', 'master')}, {('10.0.0.2:6379', 'replica')}]
+
+        collector = RQCollector(Mock(connection_pool=pool))
+
+        metric = next(m for m in collector.collect() if m.name == 'rq_exporter_redis_node_info')
+
+        # The nodes recorded before the collection are discarded
+        self.assertEqual(
+            [(s.labels, s.value) for s in metric.samples],
+            [({'address': '10.0.0.2:6379', 'role': 'replica'}, 1)]
+        )
+
+    def test_lua_script_fallback(self, get_workers_stats, get_jobs_by_queue):
+        """The client side collection must be used when scripting is not available."""
+        get_workers_stats.return_value = []
+        get_jobs_by_queue.return_value = {'default': {JobStatus.QUEUED: 2}}
+
+        collector = RQCollector(Mock(), lua_script=True)
+        collector.script = Mock(side_effect=ResponseError('unknown command `EVALSHA`'))
+
+        self.registry.register(collector)
+
+        self.assertEqual(2, self.registry.get_sample_value(
+            self.jobs_metric, {'queue': 'default', 'status': JobStatus.QUEUED}
+        ))
+        self.assertIsNone(collector.script)
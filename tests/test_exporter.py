@@ -0,0 +1,46 @@
+"""
+Tests for the rq_exporter.exporter module.
+
+"""
+
+import unittest
+from unittest.mock import Mock, MagicMock
+
+from rq_exporter.exporter import get_scrape_timeout, make_deadline_app
+
+
+class GetScrapeTimeoutTestCase(unittest.TestCase):
+    """Tests for the `get_scrape_timeout` function."""
+
+    def test_missing_header(self):
+        """`None` must be returned if the header is missing."""
+        self.assertIsNone(get_scrape_timeout({}, 0.5))
+
+    def test_invalid_header(self):
+        """`None` must be returned if the header is invalid."""
+        for value in ('', 'invalid', '0', '-5'):
+            self.assertIsNone(get_scrape_timeout({'HTTP_X_PROMETHEUS_SCRAPE_TIMEOUT_SECONDS': value}, 0.5))
+
+    def test_offset(self):
+        """The offset must be subtracted unless it's greater than the timeout."""
+        self.assertEqual(get_scrape_timeout({'HTTP_X_PROMETHEUS_SCRAPE_TIMEOUT_SECONDS': '10'}, 0.5), 9.5)
+        self.assertEqual(get_scrape_timeout({'HTTP_X_PROMETHEUS_SCRAPE_TIMEOUT_SECONDS': '0.2'}, 0.5), 0.2)
+
+
+class MakeDeadlineAppTestCase(unittest.TestCase):
+    """Tests for the `make_deadline_app` function."""
+
+    def test_deadline_is_set(self):
+        """The request must be served within the collector deadline block."""
+        collector = MagicMock()
+        app = Mock(return_value=[b'metrics'])
+        start_response = Mock()
+
+        deadline_app = make_deadline_app(app, collector, 1)
+        environ = {'HTTP_X_PROMETHEUS_SCRAPE_TIMEOUT_SECONDS': '10'}
+
+        self.assertEqual(deadline_app(environ, start_response), [b'metrics'])
+
+        collector.deadline.assert_called_once_with(9)
+        collector.deadline.return_value.__enter__.assert_called_once()
+        app.assert_called_once_with(environ, start_response)
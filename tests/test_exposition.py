@@ -0,0 +1,172 @@
+"""
+Tests for the rq_exporter.exposition module.
+
+"""
+
+import gzip
+import unittest
+from unittest.mock import Mock, patch
+
+from prometheus_client.core import CollectorRegistry, GaugeMetricFamily
+
+from rq_exporter.collector import RQCollector, Snapshot, StaticCollector
+from rq_exporter.exposition import CachedExpositionApp, parse_if_none_match
+
+
+class CachedExpositionAppTestCase(unittest.TestCase):
+    """Tests for the `CachedExpositionApp` class."""
+
+    def setUp(self):
+        self.metrics = (GaugeMetricFamily('rq_test', 'RQ test metric', value=1),)
+
+        self.collector = Mock(poll_interval=0)
+        self.collector.collect_once.side_effect = lambda: self.metrics
+        self.collector.get_circuit_metrics.return_value = []
+
+        self.registry = CollectorRegistry(auto_describe=False)
+        self.registry.register(StaticCollector([
+            GaugeMetricFamily('other_metric', 'Other metric', value=2)
+        ]))
+
+        self.app = CachedExpositionApp(self.collector, self.registry)
+
+    def request(self, **headers):
+        """Send a GET request to the WSGI app."""
+        start_response = Mock()
+
+        environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/metrics'}
+        environ.update((f'HTTP_{name.upper()}', value) for (name, value) in headers.items())
+
+        body = b''.join(self.app(environ, start_response))
+        status, response_headers = start_response.call_args[0]
+
+        return status, dict(response_headers), body
+
+    def test_response(self):
+        """The RQ metrics and the registry metrics must be served with an ETag."""
+        status, headers, body = self.request()
+
+        self.assertEqual(status, '200 OK')
+        self.assertIn(b'rq_test 1.0\n', body)
+        self.assertIn(b'other_metric 2.0\n', body)
+        self.assertTrue(headers['ETag'].startswith('W/"'))
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+
+    def test_metrics_rendered_once_per_collection(self):
+        """The RQ metrics of a collection must only be rendered once."""
+        self.request()
+        rendered = self.app._cache.copy()
+
+        self.request()
+        self.assertEqual(rendered, self.app._cache)
+
+        self.metrics = (GaugeMetricFamily('rq_test', 'RQ test metric', value=5),)
+
+        _, _, body = self.request()
+
+        self.assertNotEqual(rendered, self.app._cache)
+        self.assertIn(b'rq_test 5.0\n', body)
+
+    def test_gzip(self):
+        """The gzip output must contain both the cached and the registry metrics."""
+        _, plain_headers, plain_body = self.request()
+        status, headers, body = self.request(accept_encoding='gzip')
+
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), plain_body)
+        self.assertNotEqual(headers['ETag'], plain_headers['ETag'])
+
+    def test_openmetrics(self):
+        """The OpenMetrics output must end with a single EOF marker."""
+        _, headers, body = self.request(accept='application/openmetrics-text; version=1.0.0')
+
+        self.assertTrue(headers['Content-Type'].startswith('application/openmetrics-text'))
+        self.assertTrue(body.endswith(b'other_metric 2.0\n# EOF\n'))
+        self.assertEqual(body.count(b'# EOF'), 1)
+
+    def test_not_modified(self):
+        """Requests with a matching `If-None-Match` header must get a 304 response."""
+        _, headers, _ = self.request()
+
+        status, _, body = self.request(if_none_match=f'W/"other", {headers["ETag"]}')
+        self.assertEqual(status, '304 Not Modified')
+
+        # Weak comparison, the strong tag matches too
+        status, _, body = self.request(if_none_match=headers['ETag'][2:])
+
+        self.assertEqual(status, '304 Not Modified')
+        self.assertEqual(body, b'')
+
+        # The ETag only depends on the RQ metrics
+        self.metrics = (GaugeMetricFamily('rq_test', 'RQ test metric', value=1),)
+        status, _, _ = self.request(if_none_match=headers['ETag'])
+        self.assertEqual(status, '304 Not Modified')
+
+        self.metrics = (GaugeMetricFamily('rq_test', 'RQ test metric', value=3),)
+        status, _, _ = self.request(if_none_match=headers['ETag'])
+        self.assertEqual(status, '200 OK')
+
+    @patch('rq_exporter.collector.get_queues', return_value=[])
+    @patch('rq_exporter.collector.get_jobs_by_queue')
+    @patch('rq_exporter.collector.get_workers_stats')
+    @patch('rq_exporter.collector.time.time')
+    def test_etag_stable_across_collections(self, time_mock, get_workers_stats, get_jobs_by_queue, get_queues):
+        """Two collections of unchanged RQ data must get the same ETag, the ages are not part of it."""
+        get_workers_stats.return_value = [
+            {'name': 'w1', 'state': 'busy', 'queues': ['default'], 'successful_job_count': 1,
+             'failed_job_count': 0, 'total_working_time': 10, 'last_heartbeat': 990,
+             'current_job_started_at': 900},
+        ]
+        get_jobs_by_queue.return_value = {}
+
+        self.app = CachedExpositionApp(RQCollector(Mock()), self.registry)
+
+        time_mock.return_value = 1000
+        _, headers, body = self.request()
+
+        self.assertIn(b'rq_worker_heartbeat_age_seconds{name="w1",queues="default"} 10.0\n', body)
+
+        time_mock.return_value = 1030
+        status, next_headers, body = self.request()
+
+        self.assertEqual(status, '200 OK')
+        self.assertIn(b'rq_worker_heartbeat_age_seconds{name="w1",queues="default"} 40.0\n', body)
+        self.assertEqual(headers['ETag'], next_headers['ETag'])
+
+        status, _, _ = self.request(if_none_match=headers['ETag'])
+        self.assertEqual(status, '304 Not Modified')
+
+        # A change of the RQ data changes the tag
+        get_workers_stats.return_value[0]['successful_job_count'] = 2
+        _, next_headers, _ = self.request()
+
+        self.assertNotEqual(headers['ETag'], next_headers['ETag'])
+
+    def test_polling_snapshot(self):
+        """When polling, the snapshot metrics must be served with the uncached status metrics."""
+        self.collector.poll_interval = 10
+        self.collector.snapshot = Snapshot(metrics=self.metrics, timestamp=None, success=False)
+        self.collector.get_snapshot_status_metrics.return_value = [
+            GaugeMetricFamily('rq_exporter_last_collection_success', 'Status', value=0)
+        ]
+
+        _, _, body = self.request()
+
+        self.collector.collect_once.assert_not_called()
+        self.assertIn(b'rq_test 1.0\n', body)
+        self.assertIn(b'rq_exporter_last_collection_success 0.0\n', body)
+
+    def test_circuit_open(self):
+        """The circuit breaker state must be served with the uncached metrics."""
+        self.collector.get_circuit_metrics.return_value = [
+            GaugeMetricFamily('rq_exporter_circuit_open', 'Circuit', value=1)
+        ]
+
+        _, _, body = self.request()
+
+        self.assertIn(b'rq_exporter_circuit_open 1.0\n', body)
+
+    def test_parse_if_none_match(self):
+        """The entity tags must be parsed without the weak validator prefix."""
+        self.assertEqual(parse_if_none_match('W/"a", "b" ,'), {'"a"', '"b"'})
@@ -0,0 +1,116 @@
+"""
+Tests for the rq_exporter.instrumentation module.
+
+"""
+
+import socket
+import unittest
+from unittest.mock import patch, Mock
+
+from redis import Redis
+from redis.connection import Connection
+
+from rq_exporter.instrumentation import (
+    CommandStats, InstrumentedConnectionMixin, instrument_connection, command_phase
+)
+
+
+class CommandStatsTestCase(unittest.TestCase):
+    """Tests for the `CommandStats` class."""
+
+    def get_samples(self, stats):
+        return {
+            (s.name, tuple(sorted(s.labels.items()))): s.value
+            for metric in stats.get_metrics() for s in metric.samples
+        }
+
+    def test_counts_by_phase(self):
+        """The counts must be added to the current phase."""
+        stats = CommandStats()
+
+        stats.add(commands=1, round_trips=1)
+
+        with stats.phase('queue_counts'):
+            stats.add(commands=6, round_trips=1, sent=100, received=20)
+
+        samples = self.get_samples(stats)
+
+        self.assertEqual(samples[('rq_exporter_redis_commands_total', (('phase', 'other'),))], 1)
+        self.assertEqual(samples[('rq_exporter_redis_commands_total', (('phase', 'queue_counts'),))], 6)
+        self.assertEqual(samples[('rq_exporter_redis_round_trips_total', (('phase', 'queue_counts'),))], 1)
+        self.assertEqual(samples[('rq_exporter_redis_sent_bytes_total', (('phase', 'queue_counts'),))], 100)
+        self.assertEqual(samples[('rq_exporter_redis_received_bytes_total', (('phase', 'queue_counts'),))], 20)
+
+    @patch('rq_exporter.instrumentation.time.perf_counter', side_effect=[0, 1, 10, 12])
+    def test_phase_durations(self, perf_counter):
+        """The time spent in a phase during a collection must be observed once."""
+        stats = CommandStats()
+
+        with stats.phase('queue_discovery'):
+            pass
+
+        with stats.phase('queue_discovery'):
+            pass
+
+        stats.observe_phases()
+
+        samples = self.get_samples(stats)
+
+        self.assertEqual(samples[('rq_exporter_phase_duration_seconds_count', (('phase', 'queue_discovery'),))], 1)
+        self.assertEqual(samples[('rq_exporter_phase_duration_seconds_sum', (('phase', 'queue_discovery'),))], 3)
+
+
+class InstrumentedConnectionTestCase(unittest.TestCase):
+    """Tests for the instrumented Redis connections."""
+
+    def setUp(self):
+        self.client_socket, self.server_socket = socket.socketpair()
+        self.addCleanup(self.client_socket.close)
+        self.addCleanup(self.server_socket.close)
+
+    def test_commands_are_counted(self):
+        """The commands, round trips and bytes must be counted."""
+        client_socket = self.client_socket
+
+        class SocketPairConnection(Connection):
+            def _connect(self):
+                return client_socket
+
+        stats = CommandStats()
+        connection_class = type(
+            'InstrumentedSocketPairConnection',
+            (InstrumentedConnectionMixin, SocketPairConnection),
+            {'command_stats': stats}
+        )
+
+        connection = connection_class(lib_name=None, lib_version=None)
+
+        self.server_socket.sendall(b'+PONG\r\n:1\r\n:2\r\n')
+
+        with stats.phase('test'):
+            connection.send_command('PING')
+            self.assertEqual(connection.read_response(), b'PONG')
+
+            connection.send_packed_command(connection.pack_commands([('LLEN', 'a'), ('LLEN', 'b')]))
+            self.assertEqual(connection.read_response(), 1)
+            self.assertEqual(connection.read_response(), 2)
+
+        self.assertEqual(stats._counts['test'][:3], [3, 2, 14 + 2 * 21])
+        self.assertEqual(stats._counts['test'][3], 15)
+
+        connection.disconnect()
+
+    def test_instrument_connection(self):
+        """The connection pool must create instrumented connections."""
+        connection = Redis()
+
+        stats = instrument_connection(connection)
+
+        self.assertIs(connection.command_stats, stats)
+        self.assertTrue(issubclass(connection.connection_pool.connection_class, InstrumentedConnectionMixin))
+        self.assertIs(connection.connection_pool.connection_class.command_stats, stats)
+
+    def test_command_phase_without_instrumentation(self):
+        """The phase must be ignored for connections that are not instrumented."""
+        with command_phase(Mock(), 'test'):
+            pass
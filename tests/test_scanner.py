@@ -0,0 +1,362 @@
+"""
+Tests for the rq_exporter.scanner module.
+
+"""
+
+import math
+import zlib
+import unittest
+from base64 import b64encode
+from unittest.mock import patch, Mock, call
+
+import rq
+
+from rq_exporter.histogram import CumulativeHistogram
+from rq_exporter.scanner import FinishedJobsScanner, FailedJobsScanner, parse_exc_type
+
+
+class CumulativeHistogramTestCase(unittest.TestCase):
+    """Tests for the `CumulativeHistogram` class."""
+
+    def test_observations_are_cumulative(self):
+        """The bucket counts must be cumulative and kept by label values."""
+        histogram = CumulativeHistogram('test', 'Test', ['queue'], buckets=(1, 10, math.inf))
+
+        histogram.observe(('default',), 0.5)
+        histogram.observe(('default',), 5)
+        histogram.observe(('default',), 50)
+        histogram.observe(('high',), 1)
+
+        samples = {
+            (s.name, tuple(sorted(s.labels.items()))): s.value
+            for s in histogram.to_metric_family().samples
+        }
+
+        self.assertEqual(samples[('test_bucket', (('le', '1.0'), ('queue', 'default')))], 1)
+        self.assertEqual(samples[('test_bucket', (('le', '10.0'), ('queue', 'default')))], 2)
+        self.assertEqual(samples[('test_bucket', (('le', '+Inf'), ('queue', 'default')))], 3)
+        self.assertEqual(samples[('test_count', (('queue', 'default'),))], 3)
+        self.assertEqual(samples[('test_sum', (('queue', 'default'),))], 55.5)
+        self.assertEqual(samples[('test_bucket', (('le', '1.0'), ('queue', 'high')))], 1)
+
+
+@patch('rq_exporter.scanner.execute_pipelined')
+class FinishedJobsScannerTestCase(unittest.TestCase):
+    """Tests for the `FinishedJobsScanner` class."""
+
+    def setUp(self):
+        connection = Mock()
+        self.queue_class = Mock()
+        self.queue_class.all.return_value = [
+            rq.Queue('default', connection=connection),
+            rq.Queue('high', connection=connection)
+        ]
+
+    def get_sample(self, scanner, name, labels):
+        for metric in scanner.get_metrics():
+            for sample in metric.samples:
+                if sample.name == name and sample.labels == labels:
+                    return sample.value
+
+    def test_scan_reads_new_entries(self, execute_pipelined):
+        """The new entries must be read from the watermark and fed to the histograms."""
+        execute_pipelined.side_effect = [
+            [[(b'job_one', 100.0)], []],
+            [[b'2020-05-01T10:00:00Z', b'2020-05-01T10:00:02Z', b'2020-05-01T10:00:07Z']]
+        ]
+
+        connection = Mock()
+        scanner = FinishedJobsScanner(max_entries=10)
+
+        self.assertEqual(scanner.scan(connection, self.queue_class, 50), 1)
+
+        execute_pipelined.assert_has_calls([
+            call(connection, [
+                ('zrangebyscore', 'rq:finished:default', '-inf', '(+inf', 0, 5, True),
+                ('zrangebyscore', 'rq:finished:high', '-inf', '(+inf', 0, 5, True)
+            ], 50),
+            call(connection, [
+                ('hmget', 'rq:job:job_one', ('enqueued_at', 'started_at', 'ended_at'))
+            ], 50)
+        ])
+
+        self.assertEqual(scanner.watermarks, {'default': (100.0, ('job_one',))})
+
+        self.assertEqual(5, self.get_sample(
+            scanner, 'rq_job_duration_seconds_sum', {'queue': 'default'}
+        ))
+        self.assertEqual(2, self.get_sample(
+            scanner, 'rq_job_wait_seconds_sum', {'queue': 'default'}
+        ))
+
+    def test_scan_starts_from_the_watermark(self, execute_pipelined):
+        """Entries already processed at the watermark score must be skipped."""
+        execute_pipelined.side_effect = [
+            [[(b'job_one', 100.0), (b'job_two', 100.0), (b'job_three', 120.0)], []],
+            [[None, None, None], [None, None, None]]
+        ]
+
+        connection = Mock()
+        scanner = FinishedJobsScanner(max_entries=10)
+        scanner.watermarks['default'] = (100.0, ('job_one',))
+
+        self.assertEqual(scanner.scan(connection, self.queue_class), 2)
+
+        self.assertEqual(
+            execute_pipelined.call_args_list[0][0][1][0],
+            ('zrangebyscore', 'rq:finished:default', 100.0, '(+inf', 0, 6, True)
+        )
+        self.assertEqual(
+            [c[1] for c in execute_pipelined.call_args_list[1][0][1]],
+            ['rq:job:job_two', 'rq:job:job_three']
+        )
+
+        self.assertEqual(scanner.watermarks['default'], (120.0, ('job_three',)))
+
+    def test_scan_limit(self, execute_pipelined):
+        """At most `max_entries` entries must be processed, taking the queues in turn."""
+        execute_pipelined.side_effect = [
+            [[(b'd1', 1.0), (b'd2', 2.0)], [(b'h1', 1.0)]],
+            [[None] * 3] * 3
+        ]
+
+        scanner = FinishedJobsScanner(max_entries=3)
+
+        self.assertEqual(scanner.scan(Mock(), self.queue_class), 3)
+
+        self.assertEqual(
+            [c[1] for c in execute_pipelined.call_args_list[1][0][1]],
+            ['rq:job:d1', 'rq:job:h1', 'rq:job:d2']
+        )
+
+        self.assertEqual(scanner.watermarks, {
+            'default': (2.0, ('d2',)),
+            'high': (1.0, ('h1',))
+        })
+
+    def test_scan_limit_carry_over(self, execute_pipelined):
+        """The entries left by a queue must be read from the queues having more entries."""
+        execute_pipelined.side_effect = [
+            [[(b'd1', 1.0), (b'd2', 2.0)], []],
+            [[(b'd2', 2.0), (b'd3', 3.0), (b'd4', 4.0)]],
+            [[None] * 3] * 4
+        ]
+
+        scanner = FinishedJobsScanner(max_entries=4)
+
+        self.assertEqual(scanner.scan(Mock(), self.queue_class), 4)
+
+        self.assertEqual(execute_pipelined.call_args_list[1][0][1], [
+            ('zrangebyscore', 'rq:finished:default', 2.0, '(+inf', 0, 3, True)
+        ])
+        self.assertEqual(scanner.watermarks, {'default': (4.0, ('d4',))})
+
+    def test_late_entries_with_mixed_ttls(self, execute_pipelined):
+        """An entry added below the watermark (shorter TTL) must be read from the window once."""
+        hmget_reply = [b'2020-05-01T10:00:00Z', b'2020-05-01T10:00:02Z', b'2020-05-01T10:00:07Z']
+
+        execute_pipelined.side_effect = [
+            # Jobs finished at 800 and 900 with a 500 seconds TTL
+            [[(b'job_a', 1300.0), (b'job_b', 1400.0)], []],
+            [hmget_reply, hmget_reply],
+            # Job finished at 1000 with a 350 seconds TTL, below the watermark
+            [[(b'job_short', 1350.0), (b'job_b', 1400.0)]],
+            [[], []],
+            [hmget_reply],
+            # The late entry is only processed once
+            [[(b'job_short', 1350.0), (b'job_b', 1400.0)]],
+            [[], []],
+            [],
+        ]
+
+        connection = Mock()
+        scanner = FinishedJobsScanner(max_entries=10, window_size=2)
+
+        self.assertEqual(scanner.scan(connection, self.queue_class), 2)
+        self.assertEqual(scanner.scan(connection, self.queue_class), 1)
+
+        self.assertEqual(execute_pipelined.call_args_list[2], call(connection, [
+            ('zrangebyscore', 'rq:finished:default', '(1300.0', 1400.0, 0, 12, True)
+        ], 1000))
+        self.assertEqual(execute_pipelined.call_args_list[4][0][1], [
+            ('hmget', 'rq:job:job_short', ('enqueued_at', 'started_at', 'ended_at'))
+        ])
+
+        # The watermark doesn't move back, the window keeps the highest scores
+        self.assertEqual(scanner.watermarks, {'default': (1400.0, ('job_b',))})
+        self.assertEqual(scanner.windows, {'default': {'job_short': 1350.0, 'job_b': 1400.0}})
+
+        self.assertEqual(scanner.scan(connection, self.queue_class), 0)
+
+        self.assertEqual(3, self.get_sample(
+            scanner, 'rq_job_duration_seconds_count', {'queue': 'default'}
+        ))
+
+    def test_late_entries_disabled(self, execute_pipelined):
+        """Without window the entries below the watermark must not be read."""
+        execute_pipelined.side_effect = [
+            [[(b'job_a', 1300.0), (b'job_b', 1400.0)], []],
+            [[None] * 3] * 2,
+            [[], []],
+            [],
+        ]
+
+        scanner = FinishedJobsScanner(max_entries=10, window_size=0)
+
+        scanner.scan(Mock(), self.queue_class)
+        scanner.scan(Mock(), self.queue_class)
+
+        self.assertEqual(scanner.windows, {})
+        self.assertEqual(execute_pipelined.call_args_list[2][0][1][0][2], 1400.0)
+
+    def test_queues_read_in_turn(self, execute_pipelined):
+        """At most `max_entries` queues must be read per scan when there are more queues."""
+        connection = Mock()
+        self.queue_class.all.return_value = [
+            rq.Queue(name, connection=connection) for name in ('c', 'a', 'b')
+        ]
+        execute_pipelined.side_effect = [[[], []], [], [[], []], []]
+
+        scanner = FinishedJobsScanner(max_entries=2)
+        scanner.scan(Mock(), self.queue_class)
+        scanner.scan(Mock(), self.queue_class)
+
+        self.assertEqual(
+            [c[1] for c in execute_pipelined.call_args_list[0][0][1]],
+            ['rq:finished:a', 'rq:finished:b']
+        )
+        self.assertEqual(
+            [c[1] for c in execute_pipelined.call_args_list[2][0][1]],
+            ['rq:finished:c', 'rq:finished:a']
+        )
+
+
+TRACEBACK = (
+    'Traceback (most recent call last):\n'
+    '  File "tasks.py", line 5, in send_email\n'
+    '    raise SMTPError("timeout")\n'
+    'myapp.errors.SMTPError: timeout\n'
+)
+
+
+class ParseExcTypeTestCase(unittest.TestCase):
+    """Tests for the `parse_exc_type` function."""
+
+    def test_exception_class(self):
+        """The exception class must be read from the last line of the traceback."""
+        self.assertEqual(parse_exc_type(TRACEBACK), 'myapp.errors.SMTPError')
+        self.assertEqual(parse_exc_type('Traceback ...\nKeyboardInterrupt\n'), 'KeyboardInterrupt')
+
+    def test_not_an_exception(self):
+        """`None` must be returned if the last line is not an exception."""
+        self.assertIsNone(parse_exc_type('Work-horse terminated unexpectedly; waitpid returned 9'))
+        self.assertIsNone(parse_exc_type(''))
+        self.assertIsNone(parse_exc_type(None))
+
+
+@patch('rq_exporter.scanner.execute_pipelined')
+class FailedJobsScannerTestCase(unittest.TestCase):
+    """Tests for the `FailedJobsScanner` class."""
+
+    def setUp(self):
+        connection = Mock()
+        self.queue_class = Mock()
+        self.queue_class.all.return_value = [rq.Queue('default', connection=connection)]
+
+    def get_counts(self, scanner):
+        return {
+            tuple(sample.labels.values()): sample.value
+            for metric in scanner.get_metrics() for sample in metric.samples
+        }
+
+    def test_scan_counts_new_failures(self, execute_pipelined):
+        """The new failures must be counted by function and exception class."""
+        result = {b'type': b'2', b'exc_string': b64encode(zlib.compress(TRACEBACK.encode()))}
+
+        execute_pipelined.side_effect = [
+            [[(b'job_one', 100.0), (b'job_two', 101.0)]],
+            [
+                [b'tasks.send_email(1)', None], [(b'1-0', result)],
+                # Job saved without a result, the exception is read from the job hash
+                [b'tasks.report()', zlib.compress(b'ValueError: invalid')], []
+            ]
+        ]
+
+        connection = Mock()
+        scanner = FailedJobsScanner(max_entries=10)
+
+        self.assertEqual(scanner.scan(connection, self.queue_class, 50), 2)
+
+        self.assertEqual(execute_pipelined.call_args_list[1], call(connection, [
+            ('hmget', 'rq:job:job_one', ('description', 'exc_info')),
+            ('xrevrange', 'rq:results:job_one', '+', '-', 1),
+            ('hmget', 'rq:job:job_two', ('description', 'exc_info')),
+            ('xrevrange', 'rq:results:job_two', '+', '-', 1)
+        ], 50))
+
+        self.assertEqual(self.get_counts(scanner), {
+            ('default', 'tasks.send_email', 'myapp.errors.SMTPError'): 1,
+            ('default', 'tasks.report', 'ValueError'): 1
+        })
+
+    def test_custom_descriptions(self, execute_pipelined):
+        """The failures of jobs with a custom description must be counted with the fallback function label."""
+        execute_pipelined.side_effect = [
+            [[(b'job_one', 100.0), (b'job_two', 101.0), (b'job_three', 102.0)]],
+            [
+                [b'Report for user 42', zlib.compress(b'ValueError: invalid')], [],
+                [b'Report for user 43', zlib.compress(b'ValueError: invalid')], [],
+                [None, zlib.compress(b'ValueError: invalid')], []
+            ]
+        ]
+
+        scanner = FailedJobsScanner(max_entries=10)
+
+        self.assertEqual(scanner.scan(Mock(), self.queue_class), 3)
+
+        self.assertEqual(self.get_counts(scanner), {
+            ('default', 'other', 'ValueError'): 2,
+            ('default', 'unknown', 'ValueError'): 1
+        })
+        self.assertEqual(scanner.memo.get('job_one'), ('other', 'ValueError'))
+
+    def test_memoised_jobs_are_not_read_again(self, execute_pipelined):
+        """A job failing again must be counted without reading it."""
+        execute_pipelined.side_effect = [
+            [[(b'job_one', 200.0), (b'job_three', 201.0)]],
+            [[None, None], []]
+        ]
+
+        scanner = FailedJobsScanner(max_entries=10)
+        scanner.memo.set('job_one', ('tasks.send_email', 'myapp.errors.SMTPError'))
+        scanner.counts[('default', 'tasks.send_email', 'myapp.errors.SMTPError')] = 1
+
+        self.assertEqual(scanner.scan(Mock(), self.queue_class), 2)
+
+        self.assertEqual(
+            [c[1] for c in execute_pipelined.call_args_list[1][0][1]],
+            ['rq:job:job_three', 'rq:results:job_three']
+        )
+
+        self.assertEqual(self.get_counts(scanner), {
+            ('default', 'tasks.send_email', 'myapp.errors.SMTPError'): 2,
+            ('default', 'unknown', 'unknown'): 1
+        })
+
+    def test_memoised_job_evicted_during_the_scan(self, execute_pipelined):
+        """A memoised job evicted by the jobs processed before it must still be counted."""
+        execute_pipelined.side_effect = [
+            [[(b'job_three', 200.0), (b'job_one', 201.0)]],
+            [[None, None], []]
+        ]
+
+        scanner = FailedJobsScanner(max_entries=10, memo_size=1)
+        scanner.memo.set('job_one', ('tasks.send_email', 'myapp.errors.SMTPError'))
+
+        self.assertEqual(scanner.scan(Mock(), self.queue_class), 2)
+
+        self.assertEqual(self.get_counts(scanner), {
+            ('default', 'tasks.send_email', 'myapp.errors.SMTPError'): 1,
+            ('default', 'unknown', 'unknown'): 1
+        })
+        self.assertEqual(scanner._memoised, {})
@@ -0,0 +1,95 @@
+"""
+Tests for the rq_exporter.script module.
+
+"""
+
+import unittest
+from unittest.mock import Mock
+
+import rq
+from rq.job import JobStatus
+
+from rq_exporter.script import CollectionScript, get_queue_key_templates
+from rq_exporter.utils import WORKER_FIELDS
+
+
+class CustomQueue(rq.Queue):
+    redis_queue_namespace_prefix = 'rq:custom:queue:'
+
+
+class CustomWorker(rq.Worker):
+    redis_worker_namespace_prefix = 'rq:custom:worker:'
+
+
+class GetQueueKeyTemplatesTestCase(unittest.TestCase):
+    """Tests for the `get_queue_key_templates` function."""
+
+    def test_default_queue_class(self):
+        """The key of each job status must be split around the queue name."""
+        templates = get_queue_key_templates(Mock(), rq.Queue)
+
+        self.assertEqual(templates, {
+            JobStatus.QUEUED: ('llen', 'rq:queue:', ''),
+            JobStatus.STARTED: ('zcard', 'rq:wip:', ''),
+            JobStatus.FINISHED: ('zcard', 'rq:finished:', ''),
+            JobStatus.FAILED: ('zcard', 'rq:failed:', ''),
+            JobStatus.DEFERRED: ('zcard', 'rq:deferred:', ''),
+            JobStatus.SCHEDULED: ('zcard', 'rq:scheduled:', ''),
+        })
+
+    def test_custom_queue_class(self):
+        """The key prefix of a custom `Queue` class must be used."""
+        templates = get_queue_key_templates(Mock(), CustomQueue)
+
+        self.assertEqual(templates[JobStatus.QUEUED], ('llen', 'rq:custom:queue:', ''))
+
+
+class CollectionScriptTestCase(unittest.TestCase):
+    """Tests for the `CollectionScript` class."""
+
+    def test_script_arguments(self):
+        """The class keys and prefixes must be passed as arguments."""
+        script = CollectionScript(Mock(), CustomWorker, CustomQueue)
+        args = script.get_args()
+
+        self.assertEqual(args[:5], [
+            'rq:workers', 'rq:custom:worker:', 'rq:queues', 'rq:custom:queue:', len(WORKER_FIELDS)
+        ])
+        self.assertEqual(tuple(args[5:5 + len(WORKER_FIELDS)]), WORKER_FIELDS)
+        self.assertEqual(args[5 + len(WORKER_FIELDS):][:3], ['llen', 'rq:custom:queue:', ''])
+        self.assertEqual(len(args), 5 + len(WORKER_FIELDS) + 6 * 3)
+
+    def test_script_reply(self):
+        """The script reply must be parsed as the client side collection data."""
+        connection = Mock()
+        connection.register_script.return_value.return_value = [
+            [[b'default', 2, 3, 15, 5, 1, 4]],
+            [
+                [b'rq:worker:worker_one', b'busy', b'high,default', b'4', b'5', b'6.5',
+                 b'2020-05-01T10:00:00Z', b'30'],
+                [b'rq:worker:expired', None, None, None, None, None, None, None],
+            ],
+        ]
+
+        workers, jobs_by_queue = CollectionScript(connection)()
+
+        self.assertEqual(jobs_by_queue, {
+            'default': {
+                JobStatus.QUEUED: 2,
+                JobStatus.STARTED: 3,
+                JobStatus.FINISHED: 15,
+                JobStatus.FAILED: 5,
+                JobStatus.DEFERRED: 1,
+                JobStatus.SCHEDULED: 4
+            }
+        })
+        self.assertEqual(workers, [{
+            'name': 'worker_one',
+            'queues': ['high', 'default'],
+            'state': 'busy',
+            'successful_job_count': 4,
+            'failed_job_count': 5,
+            'total_working_time': 6.5,
+            'last_heartbeat': 1588327200,
+            'current_job_started_at': 1588327170
+        }])
@@ -0,0 +1,143 @@
+"""
+Tests for the rq_exporter.sentinel module.
+
+"""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from redis.exceptions import ConnectionError
+from redis.sentinel import SentinelConnectionPool, SentinelManagedConnection
+
+from rq_exporter.sentinel import (
+    ReplicaManagedConnection, ReplicaConnectionPool, parse_replication_info, get_replication_lag
+)
+
+
+REPLICA_INFO = (
+    b'# Replication\r\nrole:slave\r\nmaster_host:10.0.0.1\r\nmaster_port:6379\r\n'
+    b'master_link_status:up\r\nmaster_last_io_seconds_ago:3\r\n'
+)
+
+MASTER_INFO = b'# Replication\r\nrole:master\r\nconnected_slaves:2\r\n'
+
+
+class ReplicationInfoTestCase(unittest.TestCase):
+    """Tests for the `INFO replication` parsing functions."""
+
+    def test_parse_replication_info(self):
+        """The fields must be returned by name, skipping the section header."""
+        fields = parse_replication_info(REPLICA_INFO)
+
+        self.assertEqual(fields['role'], 'slave')
+        self.assertEqual(fields['master_last_io_seconds_ago'], '3')
+        self.assertNotIn('# Replication', fields)
+
+    def test_replication_lag(self):
+        """The lag must be the seconds since the last interaction with the master."""
+        self.assertEqual(get_replication_lag(parse_replication_info(REPLICA_INFO)), 3)
+
+    def test_replication_lag_with_master_link_down(self):
+        """`None` must be returned if the replica is not connected to its master."""
+        fields = parse_replication_info(REPLICA_INFO.replace(b'link_status:up', b'link_status:down'))
+
+        self.assertIsNone(get_replication_lag(fields))
+
+
+class ReplicaManagedConnectionTestCase(unittest.TestCase):
+    """Tests for the `ReplicaManagedConnection` class."""
+
+    def make_connection(self, info, max_replication_lag=None):
+        connection = ReplicaManagedConnection(
+            max_replication_lag=max_replication_lag, connection_pool=Mock()
+        )
+        connection.send_command = Mock()
+        connection.read_response = Mock(return_value=info)
+        connection.disconnect = Mock()
+
+        return connection
+
+    def test_replica_within_max_lag(self):
+        """A replica lagging less than the maximum lag must be used."""
+        connection = self.make_connection(REPLICA_INFO, max_replication_lag=5)
+
+        with patch.object(SentinelManagedConnection, 'connect_to'):
+            connection.connect_to(('10.0.0.2', 6379))
+
+        connection.send_command.assert_called_once_with('INFO', 'replication')
+        connection.disconnect.assert_not_called()
+        self.assertEqual(connection.role, 'slave')
+
+    def test_lagging_replica(self):
+        """A replica lagging more than the maximum lag must be disconnected."""
+        connection = self.make_connection(REPLICA_INFO, max_replication_lag=1)
+
+        with patch.object(SentinelManagedConnection, 'connect_to'):
+            with self.assertRaises(ConnectionError):
+                connection.connect_to(('10.0.0.2', 6379))
+
+        connection.disconnect.assert_called_once()
+
+    def test_master_fallback(self):
+        """The master must be used regardless of the maximum lag."""
+        connection = self.make_connection(MASTER_INFO, max_replication_lag=1)
+
+        with patch.object(SentinelManagedConnection, 'connect_to'):
+            connection.connect_to(('10.0.0.1', 6379))
+
+        connection.disconnect.assert_not_called()
+        self.assertEqual(connection.role, 'master')
+        self.assertTrue(connection.is_checked())
+
+    def test_lag_checked_again(self):
+        """The lag of a replica must be checked again after `max_replication_lag` seconds."""
+        connection = self.make_connection(REPLICA_INFO, max_replication_lag=5)
+
+        with patch('rq_exporter.sentinel.time.monotonic', return_value=100):
+            connection.check_replication()
+
+        with patch('rq_exporter.sentinel.time.monotonic', return_value=104):
+            self.assertTrue(connection.is_checked())
+
+        with patch('rq_exporter.sentinel.time.monotonic', return_value=105):
+            self.assertFalse(connection.is_checked())
+
+
+class ReplicaConnectionPoolTestCase(unittest.TestCase):
+    """Tests for the `ReplicaConnectionPool` class."""
+
+    def setUp(self):
+        self.pool = ReplicaConnectionPool('mymaster', Mock(), max_replication_lag=5)
+
+    def test_replica_connections(self):
+        """The pool must open replica connections using the maximum lag."""
+        self.assertFalse(self.pool.is_master)
+        self.assertIs(self.pool.connection_class, ReplicaManagedConnection)
+        self.assertEqual(self.pool.connection_kwargs['max_replication_lag'], 5)
+
+    def test_served_nodes(self):
+        """The nodes that served the connections must be returned once."""
+        replica = Mock(host='10.0.0.2', port=6379, role='slave', **{'is_checked.return_value': True})
+        master = Mock(host='10.0.0.1', port=6379, role='master', **{'is_checked.return_value': True})
+
+        with patch.object(SentinelConnectionPool, 'get_connection', side_effect=[replica, master, replica]):
+            self.pool.get_connection()
+            self.pool.get_connection()
+            self.pool.get_connection()
+
+        self.assertEqual(self.pool.pop_served_nodes(), {
+            ('10.0.0.2:6379', 'replica'), ('10.0.0.1:6379', 'master')
+        })
+        self.assertEqual(self.pool.pop_served_nodes(), set())
+
+    def test_lagging_connection_reconnected(self):
+        """A connection to a replica that started lagging must be opened again."""
+        connection = Mock(host='10.0.0.2', port=6379, role='slave', **{
+            'is_checked.return_value': False, 'check_replication.return_value': False
+        })
+
+        with patch.object(SentinelConnectionPool, 'get_connection', return_value=connection):
+            self.pool.get_connection()
+
+        connection.disconnect.assert_called_once()
+        connection.connect.assert_called_once()
@@ -0,0 +1,197 @@
+"""
+Tests for the rq_exporter.shared module.
+
+"""
+
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from prometheus_client.core import CollectorRegistry, GaugeMetricFamily
+
+from rq_exporter.collector import RQCollector, Snapshot
+from rq_exporter.shared import SharedSnapshot, SharedSnapshotPoller, SharedSnapshotApp
+
+
+def make_snapshot(value, timestamp=1588327300, success=True):
+    """Create a snapshot with a single `rq_jobs` sample."""
+    rq_jobs = GaugeMetricFamily('rq_jobs', 'RQ jobs by state', labels=['queue', 'status'])
+    rq_jobs.add_metric(['default', 'queued'], value)
+
+    return Snapshot(metrics=(rq_jobs,), timestamp=timestamp, success=success)
+
+
+class SharedSnapshotTestCase(unittest.TestCase):
+    """Tests for the `SharedSnapshot` class."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_missing_file(self):
+        """`None` must be returned if no snapshot was written."""
+        self.assertIsNone(SharedSnapshot(self.path).read())
+
+    def test_write_and_read(self):
+        """A snapshot written by a process must be read by the other processes."""
+        writer = SharedSnapshot(self.path)
+        reader = SharedSnapshot(self.path)
+
+        writer.write(make_snapshot(2))
+        metrics = reader.read()
+
+        self.assertEqual(metrics.timestamp, 1588327300)
+        self.assertTrue(metrics.success)
+        self.assertIn(b'rq_jobs{queue="default",status="queued"} 2.0', bytes(metrics.text))
+        self.assertIn(b'rq_jobs{queue="default",status="queued"} 2.0', bytes(metrics.openmetrics))
+        self.assertNotIn(b'# EOF', bytes(metrics.openmetrics))
+
+        # The file is mapped again when replaced
+        writer.write(make_snapshot(5, timestamp=None, success=False))
+        metrics = reader.read()
+
+        self.assertIsNone(metrics.timestamp)
+        self.assertFalse(metrics.success)
+        self.assertIn(b'rq_jobs{queue="default",status="queued"} 5.0', bytes(metrics.text))
+
+    def test_circuit_state(self):
+        """The circuit breaker state of the writer must be read, `None` if disabled."""
+        writer = SharedSnapshot(self.path)
+
+        writer.write(make_snapshot(2), circuit_open=True)
+        self.assertTrue(SharedSnapshot(self.path).read().circuit_open)
+
+        writer.write(make_snapshot(2))
+        self.assertIsNone(SharedSnapshot(self.path).read().circuit_open)
+
+    def test_invalid_file(self):
+        """`ValueError` must be raised if the file is not a snapshot file."""
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot file, not a snapshot file')
+
+        with self.assertRaises(ValueError):
+            SharedSnapshot(self.path).read()
+
+    def test_single_lock_holder(self):
+        """The snapshot lock must be held by a single instance."""
+        first = SharedSnapshot(self.path)
+        second = SharedSnapshot(self.path)
+
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+
+        first.release()
+
+        self.assertTrue(second.acquire())
+        second.release()
+
+
+class SharedSnapshotPollerTestCase(unittest.TestCase):
+    """Tests for the `SharedSnapshotPoller` class."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_only_the_leader_polls(self):
+        """Only the poller holding the lock must collect the metrics."""
+        leader_collector = Mock(circuit_open=None, **{'poll.return_value': make_snapshot(2)})
+        follower_collector = Mock(circuit_open=None)
+
+        leader = SharedSnapshotPoller(leader_collector, SharedSnapshot(self.path))
+        follower = SharedSnapshotPoller(follower_collector, SharedSnapshot(self.path))
+
+        self.assertTrue(leader.poll())
+        self.assertFalse(follower.poll())
+
+        leader_collector.poll.assert_called_once()
+        follower_collector.poll.assert_not_called()
+
+        self.assertEqual(SharedSnapshot(self.path).read().timestamp, 1588327300)
+
+        # The follower takes over when the lock is released
+        leader.shared.release()
+
+        follower_collector.poll.return_value = make_snapshot(3)
+
+        self.assertTrue(follower.poll())
+        follower_collector.poll.assert_called_once()
+        follower.shared.release()
+
+
+class SharedSnapshotAppTestCase(unittest.TestCase):
+    """Tests for the `SharedSnapshotApp` class."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot')
+
+        self.collector = RQCollector(Mock(), summary=Mock())
+        self.app = SharedSnapshotApp(self.collector, SharedSnapshot(self.path), CollectorRegistry())
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def request(self, **environ):
+        start_response = Mock()
+        body = b''.join(self.app({'PATH_INFO': '/', **environ}, start_response))
+        status, headers = start_response.call_args[0]
+
+        return status, dict(headers), body
+
+    def test_no_snapshot(self):
+        """Only the status metrics must be served before the first snapshot."""
+        status, headers, body = self.request()
+
+        self.assertEqual(status, '200 OK')
+        self.assertIn(b'rq_exporter_last_collection_success 0.0', body)
+        self.assertNotIn(b'rq_jobs', body)
+
+    def test_text_format(self):
+        """The snapshot metrics must be served with the status metrics."""
+        SharedSnapshot(self.path).write(make_snapshot(2))
+
+        status, headers, body = self.request()
+
+        self.assertTrue(headers['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'rq_jobs{queue="default",status="queued"} 2.0', body)
+        self.assertIn(b'rq_exporter_last_collection_success 1.0', body)
+        self.assertIn(b'rq_exporter_snapshot_age_seconds', body)
+        self.assertEqual(int(headers['Content-Length']), len(body))
+
+    def test_openmetrics_format(self):
+        """The OpenMetrics output must be terminated by a single `# EOF`."""
+        SharedSnapshot(self.path).write(make_snapshot(2))
+
+        status, headers, body = self.request(HTTP_ACCEPT='application/openmetrics-text; version=1.0.0')
+
+        self.assertTrue(headers['Content-Type'].startswith('application/openmetrics-text'))
+        self.assertIn(b'rq_jobs{queue="default",status="queued"} 2.0', body)
+        self.assertTrue(body.endswith(b'# EOF\n'))
+        self.assertEqual(body.count(b'# EOF'), 1)
+
+    def test_circuit_open(self):
+        """The circuit breaker state of the polling process must be served."""
+        SharedSnapshot(self.path).write(make_snapshot(2), circuit_open=True)
+
+        status, headers, body = self.request()
+
+        self.assertIn(b'rq_exporter_circuit_open 1.0', body)
+
+    def test_gzip(self):
+        """The response must be compressed when accepted."""
+        SharedSnapshot(self.path).write(make_snapshot(2))
+
+        status, headers, body = self.request(HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'rq_jobs{queue="default",status="queued"} 2.0', gzip.decompress(body))
@@ -4,13 +4,25 @@ Tests for the rq_exporter.utils module.
 """
 
 import unittest
-from unittest.mock import patch, mock_open, Mock, PropertyMock, call
+from datetime import datetime
+from unittest.mock import patch, mock_open, Mock, MagicMock, PropertyMock, call
 
 import rq
 from rq.job import JobStatus
-from redis.exceptions import RedisError
-
-from rq_exporter.utils import get_redis_connection, get_workers_stats, get_queue_jobs, get_jobs_by_queue
+from redis import Redis, ConnectionPool
+from redis.connection import Connection
+from redis.cluster import RedisCluster
+from redis.exceptions import RedisError, ConnectionError
+from redis.retry import Retry
+
+from rq_exporter.sentinel import ReplicaConnectionPool
+from rq_exporter.utils import (
+    get_redis_connection, get_connection_options, get_workers_stats, get_queue_jobs, get_jobs_by_queue,
+    get_queue_keys, execute_pipelined, get_jobs_by_queue_batched, get_workers_stats_batched,
+    execute_pipelined_cluster, parse_timestamp, get_oldest_jobs_by_queue,
+    get_started_jobs_by_queue, scan_set_members, iter_workers_stats, iter_jobs_by_queue, WORKER_FIELDS,
+    get_queued_jobs_by_func, parse_func_name, LRUCache, parse_scheduler_stats, parse_workers_stats
+)
 
 
 class GetRedisConnectionTestCase(unittest.TestCase):
@@ -188,6 +200,30 @@ class GetRedisConnectionTestCase(unittest.TestCase):
 
             self.assertEqual(connection, Sentinel().master_for.return_value)
 
+    @patch('builtins.open', mock_open())
+    def test_creating_redis_connection_with_sentinel_replica(self):
+        """When `sentinel_replica` is set the connection must be created for the replicas."""
+        with patch('rq_exporter.utils.Sentinel') as Sentinel:
+            connection = get_redis_connection(
+                sentinel='127.0.0.1',
+                sentinel_master='mymaster',
+                sentinel_replica=True,
+                sentinel_max_lag=10
+            )
+
+            Sentinel().master_for.assert_not_called()
+
+            Sentinel().slave_for.assert_called_once_with(
+                'mymaster',
+                connection_pool_class=ReplicaConnectionPool,
+                max_replication_lag=10,
+                password=None,
+                db='0',
+                socket_timeout=1
+            )
+
+            self.assertEqual(connection, Sentinel().slave_for.return_value)
+
     @patch('builtins.open', mock_open(read_data=' FILEPASS \n'))
     def test_creating_redis_connection_with_sentinel_using_password_file(self):
         """The password must be set from the `password_file` argument if it was passed."""
@@ -264,6 +300,59 @@ class GetRedisConnectionTestCase(unittest.TestCase):
 
             self.assertEqual(connection, Redis.return_value)
 
+    @patch('builtins.open', mock_open())
+    def test_creating_redis_cluster_connection(self):
+        """When `cluster` is set the connection must be created with `RedisCluster`."""
+        with patch('rq_exporter.utils.RedisCluster') as RedisCluster, \
+             patch('rq_exporter.utils.Redis') as Redis:
+            connection = get_redis_connection(
+                host='redis_host',
+                port='7000',
+                password='123456',
+                cluster=True
+            )
+
+            RedisCluster.assert_called_once_with(host='redis_host', port=7000, password='123456')
+            Redis.assert_not_called()
+
+            self.assertEqual(connection, RedisCluster.return_value)
+
+    @patch('builtins.open', mock_open())
+    def test_creating_redis_cluster_connection_from_url(self):
+        """When `cluster` is set the URL connection must be created with `RedisCluster.from_url`."""
+        with patch('rq_exporter.utils.RedisCluster') as RedisCluster, \
+             patch('rq_exporter.utils.Redis') as Redis:
+            connection = get_redis_connection(url='redis://redis_host:7000', cluster=True)
+
+            RedisCluster.from_url.assert_called_once_with('redis://redis_host:7000')
+            Redis.from_url.assert_not_called()
+
+            self.assertEqual(connection, RedisCluster.from_url.return_value)
+
+    def test_creating_redis_connection_with_options(self):
+        """The connection pool options must be passed to the Redis client."""
+        options = {'socket_timeout': 5, 'max_connections': 10}
+
+        with patch('rq_exporter.utils.Redis') as Redis:
+            get_redis_connection(host='redis_host', port='6379', db='0', options=options)
+            get_redis_connection(url='redis://', options=options)
+
+            Redis.assert_called_once_with(
+                host='redis_host', port='6379', db='0', password=None, socket_timeout=5, max_connections=10
+            )
+            Redis.from_url.assert_called_once_with('redis://', socket_timeout=5, max_connections=10)
+
+    def test_creating_sentinel_connection_with_options(self):
+        """The configured socket timeout must replace the default Sentinel master timeout."""
+        with patch('rq_exporter.utils.Sentinel') as Sentinel:
+            get_redis_connection(
+                sentinel='sentinel_host', sentinel_master='master', options={'socket_timeout': 5}
+            )
+
+            Sentinel.return_value.master_for.assert_called_once_with(
+                'master', password=None, db='0', socket_timeout=5
+            )
+
     @patch('builtins.open', mock_open())
     def test_creating_redis_connection_open_file_raises_IOError(self):
         """An `IOError` exception must be raised if there was error while opening the password file."""
@@ -281,6 +370,67 @@ class GetRedisConnectionTestCase(unittest.TestCase):
             Redis.assert_not_called()
 
 
+class GetConnectionOptionsTestCase(unittest.TestCase):
+    """Tests for the `get_connection_options` function."""
+
+    def test_defaults(self):
+        """No options must be returned by default to keep the `redis` package defaults."""
+        self.assertEqual(get_connection_options(), {})
+
+    def test_options(self):
+        """The configured options must be returned."""
+        options = get_connection_options(
+            max_connections=10,
+            socket_timeout=5,
+            socket_connect_timeout=2,
+            socket_keepalive=True,
+            health_check_interval=30,
+            retries=3,
+            retry_backoff=0.5
+        )
+
+        retry = options.pop('retry')
+        retry_on_error = options.pop('retry_on_error')
+
+        self.assertEqual(options, {
+            'max_connections': 10,
+            'socket_timeout': 5,
+            'socket_connect_timeout': 2,
+            'socket_keepalive': True,
+            'health_check_interval': 30
+        })
+
+        self.assertIsInstance(retry, Retry)
+        self.assertEqual(retry._retries, 3)
+        self.assertIn(ConnectionError, retry_on_error)
+
+    def test_failed_commands_are_retried(self):
+        """The commands failing with connection errors must be sent again."""
+        class FlakyConnection(Connection):
+            sent = 0
+
+            def connect(self):
+                pass
+
+            def disconnect(self, *args, **kwargs):
+                pass
+
+            def send_command(self, *args, **kwargs):
+                FlakyConnection.sent += 1
+
+                if FlakyConnection.sent == 1:
+                    raise ConnectionError('Connection reset by peer')
+
+            def read_response(self, *args, **kwargs):
+                return b'PONG'
+
+        options = get_connection_options(retries=3, retry_backoff=0)
+        connection = Redis(connection_pool=ConnectionPool(connection_class=FlakyConnection, **options))
+
+        self.assertTrue(connection.ping())
+        self.assertEqual(FlakyConnection.sent, 2)
+
+
 class GetWorkersStatsTestCase(unittest.TestCase):
     """Tests for the `get_workers_stats` function."""
 
@@ -315,7 +465,9 @@ class GetWorkersStatsTestCase(unittest.TestCase):
             'get_state.return_value': 'idle',
             'successful_job_count': 1,
             'failed_job_count': 2,
-            'total_working_time': 3
+            'total_working_time': 3,
+            'last_heartbeat': None,
+            'current_job_working_time': 0
         })
 
         worker_two = Mock()
@@ -325,7 +477,9 @@ class GetWorkersStatsTestCase(unittest.TestCase):
             'get_state.return_value': 'busy',
             'successful_job_count': 4,
             'failed_job_count': 5,
-            'total_working_time': 6
+            'total_working_time': 6,
+            'last_heartbeat': datetime(2020, 5, 1, 10, 0, 0),
+            'current_job_working_time': 30
         })
 
         Worker.all.return_value = [worker_one, worker_two]
@@ -345,7 +499,9 @@ class GetWorkersStatsTestCase(unittest.TestCase):
                     'state': 'idle',
                     'successful_job_count': 1,
                     'failed_job_count': 2,
-                    'total_working_time': 3
+                    'total_working_time': 3,
+                    'last_heartbeat': None,
+                    'current_job_started_at': None
                 },
                 {
                     'name': 'worker_two',
@@ -353,7 +509,10 @@ class GetWorkersStatsTestCase(unittest.TestCase):
                     'state': 'busy',
                     'successful_job_count': 4,
                     'failed_job_count': 5,
-                    'total_working_time': 6
+                    'total_working_time': 6,
+                    'last_heartbeat': 1588327200,
+                    # The job started 30 seconds before the last heartbeat
+                    'current_job_started_at': 1588327170
                 }
             ]
         )
@@ -371,6 +530,152 @@ class GetWorkersStatsTestCase(unittest.TestCase):
         worker_class.all.assert_called_once_with(connection)
 
 
+class GetWorkersStatsBatchedTestCase(unittest.TestCase):
+    """Tests for the `get_workers_stats_batched` function."""
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_returns_empty_list_without_workers(self, execute_pipelined):
+        """Without any available workers an empty list must be returned."""
+        execute_pipelined.return_value = []
+
+        connection = Mock()
+        connection.smembers.return_value = set()
+
+        workers = get_workers_stats_batched(connection)
+
+        connection.smembers.assert_called_once_with('rq:workers')
+
+        self.assertEqual(workers, [])
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_returns_worker_stats(self, execute_pipelined):
+        """The worker hash fields must be fetched with HMGET and decoded."""
+        connection = Mock()
+        connection.smembers.return_value = [b'rq:worker:worker_one']
+
+        execute_pipelined.return_value = [
+            [b'busy', b'high,default,low', b'4', b'5', b'6.5', b'2020-05-01T10:00:00Z', b'30']
+        ]
+
+        workers = get_workers_stats_batched(connection, batch_size=10)
+
+        execute_pipelined.assert_called_once_with(
+            connection,
+            [('hmget', 'rq:worker:worker_one', WORKER_FIELDS)],
+            10
+        )
+
+        self.assertEqual(
+            workers,
+            [
+                {
+                    'name': 'worker_one',
+                    'queues': ['high', 'default', 'low'],
+                    'state': 'busy',
+                    'successful_job_count': 4,
+                    'failed_job_count': 5,
+                    'total_working_time': 6.5,
+                    'last_heartbeat': 1588327200,
+                    'current_job_started_at': 1588327170
+                }
+            ]
+        )
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_missing_fields_and_expired_workers(self, execute_pipelined):
+        """Missing fields must use default values and expired workers must be skipped."""
+        connection = Mock()
+        connection.smembers.return_value = [b'rq:worker:worker_one', b'rq:worker:expired']
+
+        execute_pipelined.return_value = [
+            [None, b'default', None, None, None, None, None],
+            [None] * len(WORKER_FIELDS)
+        ]
+
+        workers = get_workers_stats_batched(connection)
+
+        self.assertEqual(
+            workers,
+            [
+                {
+                    'name': 'worker_one',
+                    'queues': ['default'],
+                    'state': '?',
+                    'successful_job_count': 0,
+                    'failed_job_count': 0,
+                    'total_working_time': 0,
+                    'last_heartbeat': None,
+                    'current_job_started_at': None
+                }
+            ]
+        )
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_passing_custom_Worker_class(self, execute_pipelined):
+        """Only the keys with the prefix of the custom `Worker` class must be read."""
+        class CustomWorker(rq.Worker):
+            redis_worker_namespace_prefix = 'rq:custom:worker:'
+
+        execute_pipelined.return_value = [[b'idle', b'default', b'1', b'2', b'3']]
+
+        connection = Mock()
+        connection.smembers.return_value = [b'rq:worker:default_one', b'rq:custom:worker:custom_one']
+
+        workers = get_workers_stats_batched(connection, CustomWorker)
+
+        self.assertEqual(
+            execute_pipelined.call_args[0][1],
+            [('hmget', 'rq:custom:worker:custom_one', WORKER_FIELDS)]
+        )
+
+        self.assertEqual([w['name'] for w in workers], ['custom_one'])
+
+    def test_on_redis_errors_raises_RedisError(self):
+        """On Redis connection errors, exceptions subclasses of `RedisError` will be raised."""
+        connection = Mock()
+        connection.smembers.side_effect = RedisError('Connection error')
+
+        with self.assertRaises(RedisError):
+            get_workers_stats_batched(connection)
+
+
+class WorkersStatsConsistencyTestCase(unittest.TestCase):
+    """Tests for the worker stats of the `get_workers_stats` and `parse_workers_stats` functions."""
+
+    def test_same_worker_hash(self):
+        """The RQ worker objects and the `HMGET` replies of the same worker hash must give the same stats."""
+        base = {
+            b'queues': b'default', b'successful_job_count': b'1', b'failed_job_count': b'0',
+            b'total_working_time': b'2.5', b'last_heartbeat': b'2020-05-01T10:00:00.000000Z',
+        }
+
+        hashes = [
+            {**base, b'state': b'busy', b'current_job': b'job_one', b'current_job_working_time': b'30'},
+            # The working time of the previous job is left when the worker is idle
+            {**base, b'state': b'idle', b'current_job_working_time': b'30'},
+            # The job ID is set before the worker state
+            {**base, b'state': b'idle', b'current_job': b'job_one'},
+        ]
+
+        for worker_hash in hashes:
+            with self.subTest(state=worker_hash[b'state'], current_job=worker_hash.get(b'current_job')):
+                connection = Mock()
+                connection.connection_pool.connection_kwargs = {}
+                connection.hgetall.return_value = worker_hash
+
+                worker_class = Mock()
+                worker_class.all.return_value = [
+                    rq.Worker.find_by_key('rq:worker:worker_one', connection=connection)
+                ]
+
+                replies = [[worker_hash.get(field.encode()) for field in WORKER_FIELDS]]
+
+                self.assertEqual(
+                    get_workers_stats(connection, worker_class),
+                    parse_workers_stats(rq.Worker, ['rq:worker:worker_one'], replies)
+                )
+
+
 class GetQueueJobsTestCase(unittest.TestCase):
     """Tests for the `get_queue_jobs` function."""
 
@@ -517,3 +822,606 @@ class GetJobsByQueueTestCase(unittest.TestCase):
 
         Queue.all.assert_not_called()
         queue_class.all.assert_called_once_with(connection)
+
+
+class GetQueueKeysTestCase(unittest.TestCase):
+    """Tests for the `get_queue_keys` function."""
+
+    def test_get_queue_keys_return_value(self):
+        """The keys of the queue and its registries must be returned with the count command."""
+        queue = rq.Queue('queue_name', connection=Mock())
+
+        self.assertEqual(
+            get_queue_keys(queue),
+            {
+                JobStatus.QUEUED: ('llen', 'rq:queue:queue_name'),
+                JobStatus.STARTED: ('zcard', 'rq:wip:queue_name'),
+                JobStatus.FINISHED: ('zcard', 'rq:finished:queue_name'),
+                JobStatus.FAILED: ('zcard', 'rq:failed:queue_name'),
+                JobStatus.DEFERRED: ('zcard', 'rq:deferred:queue_name'),
+                JobStatus.SCHEDULED: ('zcard', 'rq:scheduled:queue_name')
+            }
+        )
+
+    def test_custom_Queue_class_prefix(self):
+        """The key prefix of a custom `Queue` class must be used."""
+        class CustomQueue(rq.Queue):
+            redis_queue_namespace_prefix = 'rq:custom:queue:'
+
+        queue = CustomQueue('queue_name', connection=Mock())
+
+        self.assertEqual(
+            get_queue_keys(queue)[JobStatus.QUEUED],
+            ('llen', 'rq:custom:queue:queue_name')
+        )
+
+
+class ExecutePipelinedTestCase(unittest.TestCase):
+    """Tests for the `execute_pipelined` function."""
+
+    def test_commands_are_sent_in_chunks(self):
+        """The commands must be sent in pipelines of at most `batch_size` commands."""
+        connection = MagicMock()
+        pipeline = connection.pipeline.return_value.__enter__.return_value
+        pipeline.execute.side_effect = [[1, 2], [3]]
+
+        results = execute_pipelined(
+            connection,
+            [('llen', 'a'), ('zcard', 'b'), ('llen', 'c')],
+            batch_size=2
+        )
+
+        self.assertEqual(results, [1, 2, 3])
+        self.assertEqual(pipeline.execute.call_count, 2)
+
+        connection.pipeline.assert_called_with(transaction=False)
+
+        pipeline.llen.assert_has_calls([call('a'), call('c')])
+        pipeline.zcard.assert_called_once_with('b')
+
+    def test_without_commands(self):
+        """No pipelines must be executed without any commands."""
+        connection = Mock()
+
+        self.assertEqual(execute_pipelined(connection, [], batch_size=10), [])
+
+        connection.pipeline.assert_not_called()
+
+    def test_on_redis_errors_raises_RedisError(self):
+        """On Redis connection errors, exceptions subclasses of `RedisError` will be raised."""
+        connection = MagicMock()
+        pipeline = connection.pipeline.return_value.__enter__.return_value
+        pipeline.execute.side_effect = RedisError('Connection error')
+
+        with self.assertRaises(RedisError):
+            execute_pipelined(connection, [('llen', 'a')], batch_size=10)
+
+
+class ExecutePipelinedClusterTestCase(unittest.TestCase):
+    """Tests for the `execute_pipelined_cluster` function."""
+
+    def create_node(self, name, replies):
+        """Create a cluster node mock with the pipeline replies."""
+        node = Mock()
+        node.name = name
+        node.redis_connection = MagicMock()
+        pipeline = node.redis_connection.pipeline.return_value.__enter__.return_value
+        pipeline.execute.side_effect = replies
+
+        return node, pipeline
+
+    def test_commands_are_grouped_by_node(self):
+        """Each node must receive only the commands of its keys in the original order."""
+        node_one, pipeline_one = self.create_node('node1:7000', [[1, 3]])
+        node_two, pipeline_two = self.create_node('node2:7000', [[2]])
+
+        connection = Mock(spec=RedisCluster)
+        connection.get_node_from_key.side_effect = lambda key: {
+            'a': node_one, 'b': node_two, 'c': node_one
+        }[key]
+
+        results = execute_pipelined(
+            connection,
+            [('llen', 'a'), ('zcard', 'b'), ('llen', 'c')],
+            batch_size=10
+        )
+
+        self.assertEqual(results, [1, 2, 3])
+
+        pipeline_one.llen.assert_has_calls([call('a'), call('c')])
+        pipeline_one.zcard.assert_not_called()
+        pipeline_two.zcard.assert_called_once_with('b')
+
+    def test_without_commands(self):
+        """No pipelines must be executed without any commands."""
+        connection = Mock(spec=RedisCluster)
+
+        self.assertEqual(execute_pipelined_cluster(connection, [], batch_size=10), [])
+
+
+class GetJobsByQueueBatchedTestCase(unittest.TestCase):
+    """Tests for the `get_jobs_by_queue_batched` function."""
+
+    @patch('rq_exporter.utils.Queue')
+    def test_return_value_without_any_queues_available(self, Queue):
+        """If there are no queues, an empty dict must be returned."""
+        Queue.all.return_value = []
+
+        connection = Mock()
+
+        jobs = get_jobs_by_queue_batched(connection)
+
+        Queue.all.assert_called_once_with(connection)
+        connection.pipeline.assert_not_called()
+        self.assertEqual(jobs, {})
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_return_value_with_queues_available(self, execute_pipelined):
+        """The replies must be mapped back to the queue names and job statuses."""
+        connection = Mock()
+        queue_class = Mock()
+        queue_class.all.return_value = [
+            rq.Queue('default', connection=connection),
+            rq.Queue('high', connection=connection)
+        ]
+
+        execute_pipelined.return_value = [2, 3, 15, 5, 1, 4, 10, 4, 25, 22, 5, 1]
+
+        jobs = get_jobs_by_queue_batched(connection, queue_class, batch_size=5)
+
+        queue_class.all.assert_called_once_with(connection)
+
+        commands = execute_pipelined.call_args[0][1]
+        self.assertEqual(len(commands), 12)
+        self.assertEqual(commands[0], ('llen', 'rq:queue:default'))
+        self.assertEqual(commands[6], ('llen', 'rq:queue:high'))
+        self.assertEqual(execute_pipelined.call_args[0][2], 5)
+
+        self.assertEqual(
+            jobs,
+            {
+                'default': {
+                    JobStatus.QUEUED: 2,
+                    JobStatus.STARTED: 3,
+                    JobStatus.FINISHED: 15,
+                    JobStatus.FAILED: 5,
+                    JobStatus.DEFERRED: 1,
+                    JobStatus.SCHEDULED: 4
+                },
+                'high': {
+                    JobStatus.QUEUED: 10,
+                    JobStatus.STARTED: 4,
+                    JobStatus.FINISHED: 25,
+                    JobStatus.FAILED: 22,
+                    JobStatus.DEFERRED: 5,
+                    JobStatus.SCHEDULED: 1
+                }
+            }
+        )
+
+    @patch('rq_exporter.utils.current_timestamp', return_value=1000)
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_scheduler_stats(self, execute_pipelined, current_timestamp):
+        """The scheduler commands must be sent in the same pipelines as the counts."""
+        connection = Mock()
+        queue_class = Mock()
+        queue_class.all.return_value = [rq.Queue('default', connection=connection)]
+
+        execute_pipelined.return_value = [2, 3, 15, 5, 1, 4, 2, [(b'job', 940.0)], 1]
+
+        scheduler_stats = {}
+        jobs = get_jobs_by_queue_batched(connection, queue_class, batch_size=5, scheduler_stats=scheduler_stats)
+
+        execute_pipelined.assert_called_once()
+        commands = execute_pipelined.call_args[0][1]
+        self.assertEqual(commands[6:], [
+            ('zcount', 'rq:scheduled:default', '-inf', 1000),
+            ('zrange', 'rq:scheduled:default', 0, 0, False, True),
+            ('exists', 'rq:scheduler-lock:default'),
+        ])
+
+        self.assertEqual(jobs['default'][JobStatus.SCHEDULED], 4)
+        self.assertEqual(scheduler_stats, {
+            'default': {'overdue': 2, 'max_lag': 60, 'lock_held': True}
+        })
+
+
+class ParseSchedulerStatsTestCase(unittest.TestCase):
+    """Tests for the `parse_scheduler_stats` function."""
+
+    def test_no_overdue_jobs(self):
+        """The lag must be 0 when the registry is empty or the earliest job is not due yet."""
+        queues = [rq.Queue('empty', connection=Mock()), rq.Queue('future', connection=Mock())]
+
+        stats = parse_scheduler_stats(queues, [0, [], 0, 0, [(b'job', 1060.0)], 1], 1000)
+
+        self.assertEqual(stats, {
+            'empty': {'overdue': 0, 'max_lag': 0, 'lock_held': False},
+            'future': {'overdue': 0, 'max_lag': 0, 'lock_held': True},
+        })
+
+
+class ScanSetMembersTestCase(unittest.TestCase):
+    """Tests for the `scan_set_members` function."""
+
+    def test_members_are_read_in_chunks(self):
+        """The set must be iterated until the cursor is 0, skipping the empty chunks."""
+        connection = Mock()
+        connection.sscan.side_effect = [(5, [b'a', b'b']), (7, []), (0, [b'c'])]
+
+        chunks = list(scan_set_members(connection, 'rq:workers', 2))
+
+        self.assertEqual(chunks, [[b'a', b'b'], [b'c']])
+        connection.sscan.assert_has_calls([
+            call('rq:workers', 0, count=2),
+            call('rq:workers', 5, count=2),
+            call('rq:workers', 7, count=2),
+        ])
+
+
+class IterWorkersStatsTestCase(unittest.TestCase):
+    """Tests for the `iter_workers_stats` function."""
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_workers_are_read_in_chunks(self, execute_pipelined):
+        """Each chunk must be read using a pipeline and the duplicate members skipped."""
+        connection = Mock()
+        connection.sscan.side_effect = [
+            (3, [b'rq:worker:one', b'rq:custom:worker:other']),
+            (0, [b'rq:worker:two', b'rq:worker:one']),
+        ]
+
+        execute_pipelined.side_effect = lambda connection, commands, batch_size: [
+            [b'idle', b'default', b'1', b'2', b'3'] for _ in commands
+        ]
+
+        workers = iter_workers_stats(connection, chunk_size=2)
+
+        # Redis is only read when iterating
+        connection.sscan.assert_not_called()
+
+        self.assertEqual([w['name'] for w in workers], ['one', 'two'])
+
+        execute_pipelined.assert_has_calls([
+            call(connection, [('hmget', 'rq:worker:one', WORKER_FIELDS)], 2),
+            call(connection, [('hmget', 'rq:worker:two', WORKER_FIELDS)], 2),
+        ])
+
+    def test_on_redis_errors_raises_RedisError(self):
+        """On Redis connection errors, exceptions of type `RedisError` must be raised."""
+        connection = Mock()
+        connection.sscan.side_effect = RedisError
+
+        with self.assertRaises(RedisError):
+            list(iter_workers_stats(connection))
+
+
+class IterJobsByQueueTestCase(unittest.TestCase):
+    """Tests for the `iter_jobs_by_queue` function."""
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_queues_are_read_in_chunks(self, execute_pipelined):
+        """The counts of each chunk of queues must be read using pipelines."""
+        connection = Mock()
+        connection.sscan.side_effect = [
+            (3, [b'rq:queue:default']),
+            (0, [b'rq:queue:high', b'rq:queue:default']),
+        ]
+
+        execute_pipelined.side_effect = [[2, 3, 15, 5, 1, 4], [10, 4, 25, 22, 5, 1]]
+
+        jobs = iter_jobs_by_queue(connection, chunk_size=100)
+
+        self.assertEqual(next(jobs), ('default', {
+            JobStatus.QUEUED: 2,
+            JobStatus.STARTED: 3,
+            JobStatus.FINISHED: 15,
+            JobStatus.FAILED: 5,
+            JobStatus.DEFERRED: 1,
+            JobStatus.SCHEDULED: 4
+        }))
+
+        # The next chunk is read only when needed
+        self.assertEqual(connection.sscan.call_count, 1)
+
+        self.assertEqual([name for (name, _) in jobs], ['high'])
+
+        commands = execute_pipelined.call_args[0][1]
+        self.assertEqual(len(commands), 6)
+        self.assertEqual(commands[0], ('llen', 'rq:queue:high'))
+        connection.sscan.assert_called_with('rq:queues', 3, count=100)
+
+
+class ParseTimestampTestCase(unittest.TestCase):
+    """Tests for the `parse_timestamp` function."""
+
+    def test_parse_timestamp(self):
+        """RQ dates must be parsed as UTC Unix timestamps."""
+        self.assertEqual(parse_timestamp(b'2020-05-01T10:00:00.500000Z'), 1588327200.5)
+        self.assertEqual(parse_timestamp('2020-05-01T10:00:00Z'), 1588327200)
+
+    def test_invalid_values(self):
+        """`None` must be returned for missing or invalid values."""
+        self.assertEqual(parse_timestamp(None), None)
+        self.assertEqual(parse_timestamp(b''), None)
+        self.assertEqual(parse_timestamp(b'invalid'), None)
+
+
+class GetOldestJobsByQueueTestCase(unittest.TestCase):
+    """Tests for the `get_oldest_jobs_by_queue` function."""
+
+    def setUp(self):
+        connection = Mock()
+        self.queue_class = Mock()
+        self.queue_class.all.return_value = [
+            rq.Queue('default', connection=connection),
+            rq.Queue('high', connection=connection),
+            rq.Queue('empty', connection=connection)
+        ]
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_return_value(self, execute_pipelined):
+        """The enqueue timestamps of the head jobs must be returned by queue name."""
+        execute_pipelined.side_effect = [
+            [b'job_one', b'job_two', None],
+            [b'2020-05-01T10:00:00Z', b'2020-05-01T10:01:00Z']
+        ]
+
+        connection = Mock()
+        cache = {}
+
+        oldest_jobs = get_oldest_jobs_by_queue(connection, self.queue_class, 10, cache)
+
+        execute_pipelined.assert_has_calls([
+            call(connection, [
+                ('lindex', 'rq:queue:default', 0),
+                ('lindex', 'rq:queue:high', 0),
+                ('lindex', 'rq:queue:empty', 0)
+            ], 10),
+            call(connection, [
+                ('hget', 'rq:job:job_one', 'enqueued_at'),
+                ('hget', 'rq:job:job_two', 'enqueued_at')
+            ], 10)
+        ])
+
+        self.assertEqual(oldest_jobs, {
+            'default': 1588327200,
+            'high': 1588327260,
+            'empty': None
+        })
+
+        self.assertEqual(cache, {'job_one': 1588327200, 'job_two': 1588327260})
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_discovered_queues(self, execute_pipelined):
+        """The queues already discovered by the collection must be read without discovering them again."""
+        execute_pipelined.side_effect = [[None], []]
+
+        connection = Mock()
+        queues = [rq.Queue('low', connection=connection)]
+
+        oldest_jobs = get_oldest_jobs_by_queue(connection, self.queue_class, 10, queues=queues)
+
+        self.queue_class.all.assert_not_called()
+        self.assertEqual(execute_pipelined.call_args_list[0], call(connection, [('lindex', 'rq:queue:low', 0)], 10))
+        self.assertEqual(oldest_jobs, {'low': None})
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_cached_jobs_are_not_read_again(self, execute_pipelined):
+        """Only the jobs that are new at the head of the queues must be read."""
+        execute_pipelined.side_effect = [
+            [b'job_one', b'job_three', None],
+            [b'2020-05-01T10:02:00Z']
+        ]
+
+        connection = Mock()
+        cache = {'job_one': 1588327200, 'job_two': 1588327260}
+
+        oldest_jobs = get_oldest_jobs_by_queue(connection, self.queue_class, 10, cache)
+
+        self.assertEqual(
+            execute_pipelined.call_args_list[1],
+            call(connection, [('hget', 'rq:job:job_three', 'enqueued_at')], 10)
+        )
+
+        self.assertEqual(oldest_jobs, {
+            'default': 1588327200,
+            'high': 1588327320,
+            'empty': None
+        })
+
+        # The jobs no longer at the head of a queue are removed from the cache
+        self.assertEqual(cache, {'job_one': 1588327200, 'job_three': 1588327320})
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_missing_jobs_are_ignored(self, execute_pipelined):
+        """Queues with a head job without an enqueue time must be ignored."""
+        execute_pipelined.side_effect = [[b'job_one', None, None], [None]]
+
+        oldest_jobs = get_oldest_jobs_by_queue(Mock(), self.queue_class)
+
+        self.assertEqual(oldest_jobs, {'high': None, 'empty': None})
+
+
+@patch('rq_exporter.utils.current_timestamp', return_value=1588327300)
+class GetStartedJobsByQueueTestCase(unittest.TestCase):
+    """Tests for the `get_started_jobs_by_queue` function."""
+
+    def setUp(self):
+        connection = Mock()
+        self.queue_class = Mock()
+        self.queue_class.all.return_value = [
+            rq.Queue('default', connection=connection),
+            rq.Queue('high', connection=connection)
+        ]
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_return_value(self, execute_pipelined, current_timestamp):
+        """The expired count and the running jobs start timestamps must be returned by queue name."""
+        execute_pipelined.side_effect = [
+            [2, [b'job_one:exec_one', b'job_two:exec_two'], 0, []],
+            [b'2020-05-01T10:00:00Z', b'2020-05-01T10:01:00Z']
+        ]
+
+        connection = Mock()
+        cache = {}
+
+        started_jobs = get_started_jobs_by_queue(connection, self.queue_class, 10, 50, cache)
+
+        execute_pipelined.assert_has_calls([
+            call(connection, [
+                ('zcount', 'rq:wip:default', '-inf', 1588327300),
+                ('zrangebyscore', 'rq:wip:default', '(1588327300', '+inf', 0, 50),
+                ('zcount', 'rq:wip:high', '-inf', 1588327300),
+                ('zrangebyscore', 'rq:wip:high', '(1588327300', '+inf', 0, 50)
+            ], 10),
+            call(connection, [
+                ('hget', 'rq:job:job_one', 'started_at'),
+                ('hget', 'rq:job:job_two', 'started_at')
+            ], 10)
+        ])
+
+        self.assertEqual(started_jobs, {
+            'default': (2, [1588327200, 1588327260]),
+            'high': (0, [])
+        })
+
+        self.assertEqual(cache, {'job_one': 1588327200, 'job_two': 1588327260})
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_cached_jobs_are_not_read_again(self, execute_pipelined, current_timestamp):
+        """Only the jobs that started since the last call must be read."""
+        execute_pipelined.side_effect = [
+            [0, [b'job_two:exec_two'], 0, [b'job_three:exec_three']],
+            [None]
+        ]
+
+        connection = Mock()
+        cache = {'job_one': 1588327200, 'job_two': 1588327260}
+
+        started_jobs = get_started_jobs_by_queue(connection, self.queue_class, 10, 50, cache)
+
+        self.assertEqual(
+            execute_pipelined.call_args_list[1],
+            call(connection, [('hget', 'rq:job:job_three', 'started_at')], 10)
+        )
+
+        # Jobs without a start time are ignored
+        self.assertEqual(started_jobs, {'default': (0, [1588327260]), 'high': (0, [])})
+
+        # The finished jobs are removed from the cache
+        self.assertEqual(cache, {'job_two': 1588327260})
+
+
+class ParseFuncNameTestCase(unittest.TestCase):
+    """Tests for the `parse_func_name` function."""
+
+    def test_call_string(self):
+        """The function name must be read from the call string description."""
+        self.assertEqual(parse_func_name(b"tasks.send_email('user@example.com', retry=True)"), 'tasks.send_email')
+
+    def test_custom_description(self):
+        """A custom description that isn't a dotted callable name must be replaced with the fallback label."""
+        self.assertEqual(parse_func_name('Nightly report'), 'other')
+        self.assertEqual(parse_func_name('Report for user 42 (daily)'), 'other')
+        self.assertEqual(parse_func_name('<lambda>(1)'), 'other')
+        self.assertEqual(parse_func_name('(1, 2)'), 'other')
+
+    def test_dotted_name(self):
+        """A dotted callable name without arguments must be kept."""
+        self.assertEqual(parse_func_name(' app.tasks.cleanup '), 'app.tasks.cleanup')
+
+    def test_missing_description(self):
+        """`None` must be returned for missing descriptions."""
+        self.assertIsNone(parse_func_name(None))
+        self.assertIsNone(parse_func_name(b''))
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    """Tests for the `LRUCache` class."""
+
+    def test_least_recently_used_entries_discarded(self):
+        """The least recently used entries must be discarded above the maximum size."""
+        cache = LRUCache(2)
+        cache.set('one', 1)
+        cache.set('two', 2)
+
+        # `one` becomes the most recently used entry
+        self.assertEqual(cache.get('one'), 1)
+
+        self.assertEqual(cache.set('three', 3), [('two', 2)])
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn('one', cache)
+        self.assertNotIn('two', cache)
+        self.assertIsNone(cache.get('two'))
+
+
+class GetQueuedJobsByFuncTestCase(unittest.TestCase):
+    """Tests for the `get_queued_jobs_by_func` function."""
+
+    def setUp(self):
+        connection = Mock()
+        self.queue_class = Mock()
+        self.queue_class.all.return_value = [
+            rq.Queue('default', connection=connection),
+            rq.Queue('high', connection=connection)
+        ]
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_return_value(self, execute_pipelined):
+        """The jobs at the head of each queue must be counted by function name."""
+        execute_pipelined.side_effect = [
+            [[b'job_one', b'job_two', b'job_three'], [b'job_four']],
+            [b'tasks.add(1, 2)', b'tasks.add(3, 4)', None, b'tasks.report()']
+        ]
+
+        connection = Mock()
+        cache = LRUCache()
+
+        queued_jobs = get_queued_jobs_by_func(connection, self.queue_class, 10, 50, cache)
+
+        execute_pipelined.assert_has_calls([
+            call(connection, [
+                ('lrange', 'rq:queue:default', 0, 49),
+                ('lrange', 'rq:queue:high', 0, 49)
+            ], 10),
+            call(connection, [
+                ('hget', 'rq:job:job_one', 'description'),
+                ('hget', 'rq:job:job_two', 'description'),
+                ('hget', 'rq:job:job_three', 'description'),
+                ('hget', 'rq:job:job_four', 'description')
+            ], 10)
+        ])
+
+        # Deleted jobs are not counted
+        self.assertEqual(queued_jobs, {
+            'default': {'tasks.add': 2},
+            'high': {'tasks.report': 1}
+        })
+
+        self.assertEqual(len(cache), 3)
+
+    @patch('rq_exporter.utils.execute_pipelined')
+    def test_cached_jobs_are_not_read_again(self, execute_pipelined):
+        """Only the jobs missing from the cache must be read."""
+        execute_pipelined.side_effect = [
+            [[b'job_two', b'job_five'], []],
+            [b'tasks.report()']
+        ]
+
+        connection = Mock()
+        cache = LRUCache()
+        cache.set('job_two', 'tasks.add')
+
+        queued_jobs = get_queued_jobs_by_func(connection, self.queue_class, 10, 50, cache)
+
+        self.assertEqual(
+            execute_pipelined.call_args_list[1],
+            call(connection, [('hget', 'rq:job:job_five', 'description')], 10)
+        )
+
+        self.assertEqual(queued_jobs, {
+            'default': {'tasks.add': 1, 'tasks.report': 1},
+            'high': {}
+        })